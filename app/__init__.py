@@ -11,7 +11,10 @@ def create_app():
     app.config.from_object(Config)
     
     # Initialize extensions with app
+    from app.db_engine import configure_engines, tune_sqlite_engines
+    configure_engines(app)
     db.init_app(app)
+    tune_sqlite_engines(app, db)
     login_manager.init_app(app)
     
     # Configure login manager
@@ -26,38 +29,58 @@ def create_app():
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(api_bp, url_prefix='/api')
+
+    # Request/SQL metrics (/metrics) and the slow-query log
+    from app.utils.instrumentation import init_instrumentation
+    init_instrumentation(app)
+
+    # ETags / 304s, compression and static QR caching
+    from app.utils.http_cache import init_http_cache
+    init_http_cache(app)
+
+    # Per-request SQL statement counting and query budgets
+    from app.utils.query_budget import init_query_budget
+    init_query_budget(app)
+
+    # In-process caches
+    from app.utils.student_details import init_student_details_cache
+    init_student_details_cache(app)
+    from app.utils.identity import init_identity_cache
+    init_identity_cache(app)
+    from app.utils.refdata import init_refdata
+    init_refdata(app)
+    from app.utils.archive import init_archives
+    init_archives(app)
+    from app.utils.qr_generator import configure_qr_cache
+    configure_qr_cache(app)
+    from app.utils.qr_tokens import configure_qr_tokens
+    configure_qr_tokens(app)
+    from app.utils.report_cards import configure_reports
+    configure_reports(app)
+    from app.utils.search import init_search
+    init_search(app)
+
+    # Live points updates (server-sent events)
+    from app.utils.events import init_events
+    init_events(app)
+
+    # CLI commands
+    from app.cli import register_commands
+    register_commands(app)
     
-    # Create database tables
+    # Schema and default data: one version query per process start; the full
+    # create/migrate/seed only runs when that says the database is behind
+    # (or explicitly via `flask init-db`)
     with app.app_context():
-        db.create_all()
-        
-        # Create default roles if they don't exist
-        from app.models import Role
-        default_roles = ['admin', 'staff', 'student']
-        for role_name in default_roles:
-            if not Role.query.filter_by(role_name=role_name).first():
-                role = Role(role_name=role_name, description=f'{role_name.capitalize()} role')
-                db.session.add(role)
-        
-        # Create default offence types if they don't exist
-        from app.models import OffenceType
-        default_offences = [
-            ('Latecoming', 5, 'Arriving late to class or activities'),
-            ('Uniform Violation', 10, 'Not wearing proper uniform'),
-            ('Disruptive Behavior', 15, 'Disrupting class or activities'),
-            ('Academic Dishonesty', 20, 'Cheating or plagiarism'),
-            ('Bullying', 25, 'Harassment or bullying behavior')
-        ]
-        
-        for offence_name, points, description in default_offences:
-            if not OffenceType.query.filter_by(offence_name=offence_name).first():
-                offence = OffenceType(
-                    offence_name=offence_name,
-                    deduct_points=points,
-                    description=description
-                )
-                db.session.add(offence)
-        
-        db.session.commit()
+        from app.utils.bootstrap import database_ready, init_database
+        if not database_ready(db.engine):
+            if app.config.get('DB_AUTO_INIT', True):
+                init_database(db.engine, echo=app.logger.info)
+            else:
+                app.logger.warning('Database schema or default data is out of date; run `flask init-db`')
+    
+    # Background job workers inside the web process (optional)
+    from app.utils.jobs import start_embedded_workers
+    start_embedded_workers(app)
     
     return app
\ No newline at end of file
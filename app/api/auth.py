@@ -1,7 +1,9 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, abort
 from flask_login import login_required, current_user, login_user, logout_user
-from werkzeug.security import check_password_hash
 from app.models import db, User
+from app.utils.identity import invalidate_identity
+from app.utils.passwords import verify_and_upgrade
+from app.utils.qr_tokens import InvalidQRToken, verify_token
 
 main_bp = Blueprint('main', __name__)
 auth_bp = Blueprint('auth', __name__)
@@ -14,7 +16,11 @@ def login():
         
         user = User.query.filter_by(user_code=username).first()
         
-        if user and check_password_hash(user.password_hash, password):
+        method = current_app.config.get('PASSWORD_HASH_METHOD') \
+            if current_app.config.get('PASSWORD_REHASH_ON_LOGIN', True) else None
+        if user and verify_and_upgrade(user, password, method):
+            # Commits the upgraded hash when the configured cost has changed
+            db.session.commit()
             login_user(user)
             flash('Login successful!', 'success')
             return redirect(url_for('home'))
@@ -26,10 +32,29 @@ def login():
 @auth_bp.route('/logout')
 @login_required
 def logout():
+    invalidate_identity(current_user.user_id)
     logout_user()
     flash('You have been logged out.', 'info')
     return redirect(url_for('auth.login'))
 
+# The page loads its data from details_url and keeps it live from events_url
 @main_bp.route('/student/qr/<int:student_id>')
+@login_required
 def qr_student_info(student_id):
-    return render_template('qr_result.html')
\ No newline at end of file
+    # Staff lookup by id; the id-keyed data endpoints check the role
+    return render_template('qr_result.html',
+                           details_url=url_for('api.get_student_points', student_id=student_id),
+                           events_url=url_for('api.student_events', student_id=student_id))
+
+@main_bp.route('/student/qr/t/<token>')
+def qr_student_token(token):
+    # What student QR codes encode; the token is verified without the database
+    # and is the only key the page hands to its data endpoints, so sequential
+    # student ids reveal nothing
+    try:
+        verify_token(token)
+    except InvalidQRToken:
+        abort(404)
+    return render_template('qr_result.html',
+                           details_url=url_for('api.qr_student_details', token=token),
+                           events_url=url_for('api.qr_student_events', token=token))
\ No newline at end of file
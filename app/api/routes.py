@@ -1,11 +1,27 @@
-from flask import Blueprint, request, jsonify, redirect, flash, send_file
-from app.models import db, User, Student, Staff, Role, OffenceType, BehaviouralPoints, DisciplinaryRecord
-from werkzeug.security import generate_password_hash
+from flask import Blueprint, request, jsonify, redirect, flash, send_file, current_app, Response, stream_with_context
+from app.models import db, User, Student, Staff, Role, OffenceType, BehaviouralPoints, DisciplinaryRecord, \
+    OffenceRollup, PointsLedger, RefDataVersion
 from flask_login import current_user
 import os
-from utils.qr_generator import generate_student_qr_code
-from io import BytesIO
-import base64
+from app.utils.qr_generator import qr_filename, qr_cache_key, qr_output_dir, render_qr_png, student_qr_url, FILENAME_PATTERN
+from app.utils.listing import list_students, list_staff, list_disciplinary_records, list_ledger_entries
+from app.utils.loading import with_profile
+from app.utils.query_budget import query_budget
+from app.db_engine import read_replica, use_replica
+from app.utils.bulk_import import import_users, shared_hashing_pool
+from app.utils.jobs import enqueue, job_status, run_if_inline
+from app.utils.refdata import REFDATA_KEY, get_offence_points, get_role_id, list_offences, reference_version
+from app.utils.http_cache import etag_from, row_stamp
+from app.utils import analytics, archive, export, ledger, passwords
+from app.utils.identity import invalidate_identity, role_required
+from app.utils.report_cards import load_report_data, render_report_card, report_filename, reports_supported
+from app.utils.pagination import parse_date_arg
+from app.utils.search import search_index
+from app.utils.events import event_broker, sse_stream, student_channel, department_channel
+from app.utils.qr_tokens import InvalidQRToken, revoke_student_tokens, token_stats, verify_token
+from app.utils.student_details import get_student_details, invalidate_student_details, student_details_cache
+from datetime import datetime
+from io import BytesIO, TextIOWrapper
 
 api_bp = Blueprint('api', __name__)
 
@@ -31,12 +47,21 @@ def add_student():
             'parent_contact': request.form['parent_contact']
         }
         
-        # Create the student
-        success, message, student_id = create_user(user_data, profile_data, 'student')
+        # Create the student. The QR code is rendered in the background (download_qr
+        # renders on demand if it is requested before the job has run); the job is
+        # queued in the student's transaction, so both are stored or neither is
+        queued = {}
+        
+        def enqueue_qr(user, profile):
+            queued['job_id'] = enqueue('render_student_qr', commit=False, student_id=profile.student_id,
+                                       register_number=profile.register_number)
+        
+        success, message, student_id = create_user(user_data, profile_data, 'student', before_commit=enqueue_qr)
         
         if success:
-            # Generate QR code for the new student
-            filename, qr_base64 = generate_student_qr_code(student_id, profile_data['register_number'])
+            qr_job_id = queued['job_id']
+            run_if_inline(qr_job_id)
+            filename = qr_filename(student_id, profile_data['register_number'])
             
             flash(f'Student created successfully: {message}', 'success')
             
@@ -44,8 +69,9 @@ def add_student():
             return jsonify({
                 'success': True,
                 'message': f'Student created successfully: {message}',
-                'qr_code': qr_base64,
                 'filename': f'qr_{profile_data["register_number"]}.png',
+                'qr_url': f'/api/download_qr/{filename}',
+                'qr_job_id': qr_job_id,
                 'register_number': profile_data['register_number']
             })
         else:
@@ -92,6 +118,89 @@ def add_staff():
     
     return redirect('/staff')
 
+@api_bp.route('/import_users', methods=['POST'])
+@role_required('admin')
+def import_users_route():
+    upload = request.files.get('file')
+    role_name = request.form.get('role', 'student')
+    if not upload:
+        return jsonify({'success': False, 'message': 'No CSV file uploaded'}), 400
+    
+    try:
+        # Stream the upload straight into the CSV reader instead of reading it into memory
+        lines = TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+        # Uploads share one small hashing pool; large imports belong in `flask import-users`
+        pool, workers = shared_hashing_pool(current_app.config.get('IMPORT_HASH_WORKERS', 2))
+        report = import_users(lines, role_name, workers=workers, pool=pool,
+                              hash_method=current_app.config.get('PASSWORD_HASH_METHOD'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error importing users: {str(e)}'}), 500
+    
+    return jsonify({
+        'success': not report['errors'],
+        'message': f"Created {report['created']} user(s), {len(report['errors'])} row error(s)",
+        'created': report['created'],
+        'errors': report['errors']
+    })
+
+@api_bp.route('/record_offence_batch', methods=['POST'])
+def record_offence_batch_route():
+    """
+    Record one offence for many students (e.g. a late bus). Accepts JSON
+    {student_ids, offence_id, description, action_taken} or the same form
+    fields with student_ids repeated or comma-separated.
+    """
+    if not current_user.is_authenticated:
+        return jsonify({'success': False, 'message': 'You must be logged in to record offences'}), 401
+    if current_user.staff_id is None:
+        return jsonify({'success': False, 'message': 'Only staff members can record offences'}), 403
+    
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        student_ids = data.get('student_ids') or []
+        if not isinstance(student_ids, list):
+            return jsonify({'success': False, 'message': 'student_ids must be a list'}), 400
+    else:
+        data = request.form
+        student_ids = [s for value in data.getlist('student_ids') for s in value.split(',') if s.strip()]
+    try:
+        offence_id = int(data['offence_id'])
+        description = data['description']
+        action_taken = data['action_taken']
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'offence_id, description and action_taken are required'}), 400
+    
+    max_batch = current_app.config.get('MAX_OFFENCE_BATCH', 1000)
+    if not student_ids:
+        return jsonify({'success': False, 'message': 'No students given'}), 400
+    if len(student_ids) > max_batch:
+        return jsonify({'success': False, 'message': f'At most {max_batch} students per batch'}), 400
+    
+    try:
+        results = record_offence_batch(student_ids, offence_id, description, action_taken, current_user.staff_id)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error recording offences: {str(e)}'}), 500
+    
+    recorded = sum(1 for result in results if result['success'])
+    return jsonify({
+        'success': recorded == len(results),
+        'message': f'Recorded {recorded} of {len(results)} offence(s)',
+        'recorded': recorded,
+        'results': results
+    })
+
+@api_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@role_required('admin', 'staff')
+def get_job_status(job_id):
+    status = job_status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(status)
+
 @api_bp.route('/record_offence', methods=['POST'])
 def record_offence_route():
     try:
@@ -106,14 +215,12 @@ def record_offence_route():
             flash('You must be logged in to record an offence', 'error')
             return redirect('/login')
         
-        # Get the staff ID from the user's staff profile
-        staff = Staff.query.filter_by(user_id=current_user.user_id).first()
-        if not staff:
+        # Get the staff ID from the cached identity (no extra query)
+        staff_id = current_user.staff_id
+        if staff_id is None:
             flash('Only staff members can record offences', 'error')
             return redirect('/disciplinary')
         
-        staff_id = staff.staff_id
-        
         # Record the offence
         record = record_offence(student_id, offence_id, description, action_taken, staff_id)
         
@@ -124,15 +231,19 @@ def record_offence_route():
     
     return redirect('/disciplinary')
 
-def create_user(user_data, profile_data, role_name):
+def hash_password(password):
+    return passwords.hash_password(password, current_app.config.get('PASSWORD_HASH_METHOD'))
+
+def create_user(user_data, profile_data, role_name, before_commit=None):
+    # before_commit(user, profile) runs inside the same transaction, just before the commit
     try:
         # Check if username already exists
         if User.query.filter_by(user_code=user_data['user_code']).first():
             return False, "Username already exists", None
         
-        # Get role ID
-        role = Role.query.filter_by(role_name=role_name).first()
-        if not role:
+        # Get role ID (from the reference-data cache)
+        role_id = get_role_id(role_name)
+        if role_id is None:
             return False, "Role does not exist", None
         
         # Validate password confirmation if provided
@@ -142,8 +253,8 @@ def create_user(user_data, profile_data, role_name):
         # Create user
         user = User(
             user_code=user_data['user_code'],
-            password_hash=generate_password_hash(user_data['password']),
-            role_id=role.role_id,
+            password_hash=hash_password(user_data['password']),
+            role_id=role_id,
             full_name=user_data['full_name'],
             gender=user_data['gender'],
             contact_number=user_data['contact_number'],
@@ -180,6 +291,8 @@ def create_user(user_data, profile_data, role_name):
                 offence_count=0
             )
             db.session.add(behavioural_points)
+            db.session.flush()
+            analytics.move_point_bands(profile.student_id)
             
             student_id = profile.student_id
             
@@ -198,7 +311,14 @@ def create_user(user_data, profile_data, role_name):
             db.session.add(profile)
             student_id = None
         
+        if before_commit is not None:
+            before_commit(user, profile)
         db.session.commit()
+        invalidate_student_details(student_id)
+        invalidate_identity(user.user_id)
+        if role_name == 'student':
+            search_index.add_student(student_id, user.full_name, profile.register_number, user.user_code,
+                                     profile.department, profile.student_class)
         
         return True, f"{user_data['full_name']} ({profile_data['register_number' if role_name == 'student' else 'staff_empid']})", student_id
         
@@ -207,15 +327,36 @@ def create_user(user_data, profile_data, role_name):
         return False, f"Error creating user: {str(e)}", None
 
 @api_bp.route('/download_qr/<filename>', methods=['GET'])
+@read_replica
 def download_qr(filename):
-    qr_path = os.path.join('static', 'qrcodes', filename)
+    # One absolute path for the check and send_file (which would resolve a
+    # relative one against the app package, not the working directory)
+    qr_path = os.path.join(qr_output_dir(), filename)
+    # The PNG only changes when the card is reissued, so clients may keep it
+    # for a while; send_file adds the ETag / Last-Modified and handles 304s
+    max_age = current_app.config.get('QR_STATIC_MAX_AGE', 86400)
     if os.path.exists(qr_path):
-        return send_file(qr_path, as_attachment=True)
-    else:
-        return jsonify({'error': 'QR code not found'}), 404
+        return send_file(qr_path, as_attachment=True, max_age=max_age)
+    
+    # Not on disk: render on demand (from the QR cache) for a real student
+    match = FILENAME_PATTERN.match(filename)
+    if match:
+        student_id, register_number = int(match.group(1)), match.group(2)
+        student = Student.query.get(student_id)
+        if student and student.register_number == register_number:
+            url = student_qr_url(student_id, register_number)
+            return send_file(BytesIO(render_qr_png(url)), mimetype='image/png', as_attachment=True,
+                             download_name=filename, etag=qr_cache_key(url), max_age=max_age)
+    
+    return jsonify({'error': 'QR code not found'}), 404
     
 def record_offence(student_id, offence_id, description, action_taken, staff_id):
     try:
+        # Offence points come from the in-memory reference data
+        points = get_offence_points(offence_id)
+        if points is None:
+            raise Exception("Offence type not found")
+        
         # Create disciplinary record
         record = DisciplinaryRecord(
             student_id=student_id,
@@ -226,21 +367,19 @@ def record_offence(student_id, offence_id, description, action_taken, staff_id):
         )
         
         db.session.add(record)
+        db.session.flush()
         
-        # Deduct points
-        behavioural_points = BehaviouralPoints.query.filter_by(student_id=student_id).first()
-        if behavioural_points:
-            # Get offence details to know how many points to deduct
-            offence = OffenceType.query.get(offence_id)
-            if offence:
-                behavioural_points.total_points -= offence.deduct_points
-                behavioural_points.offence_count += 1
-            else:
-                raise Exception("Offence type not found")
-        else:
+        # Deduct points in the database (UPDATE ... SET total_points = total_points - n)
+        if not BehaviouralPoints.apply_deduction(student_id, points):
             raise Exception("Student behavioural record not found")
+        ledger.append_entries([ledger.deduction_entry(student_id, record.record_id, points, staff_id)])
+        
+        # Keep the analytics rollups current in the same transaction
+        analytics.record_rollup(student_id, offence_id, points)
         
         db.session.commit()
+        invalidate_student_details(student_id)
+        search_index.add_record(record.record_id, description, action_taken)
         
         return record
         
@@ -248,44 +387,568 @@ def record_offence(student_id, offence_id, description, action_taken, staff_id):
         db.session.rollback()
         raise e
 
+def record_offence_batch(student_ids, offence_id, description, action_taken, staff_id):
+    """
+    Record the same offence for many students in one transaction with a
+    constant number of statements: one SELECT to validate the students, a
+    bulk INSERT of the records, one set-based points UPDATE, one bulk ledger
+    INSERT and one rollup upsert. Returns a result dict per requested student, in request order.
+    """
+    points = get_offence_points(offence_id)
+    if points is None:
+        raise ValueError("Offence type not found")
+    
+    # Deduplicate, keeping request order; non-numeric ids fail individually
+    requested, results = [], {}
+    for raw in student_ids:
+        try:
+            student_id = int(raw)
+        except (TypeError, ValueError):
+            results[str(raw)] = {'student_id': raw, 'success': False, 'message': 'Invalid student id'}
+            continue
+        if student_id not in results:
+            requested.append(student_id)
+            results[student_id] = None
+    
+    try:
+        existing = {sid for (sid,) in db.session.query(BehaviouralPoints.student_id)
+                    .filter(BehaviouralPoints.student_id.in_(requested))}
+        valid = [sid for sid in requested if sid in existing]
+        
+        if valid:
+            inserted = db.session.execute(
+                # RETURNING carries student_id (unique per batch), so row order does not
+                # matter and the rows can go out as multi-row INSERTs
+                db.insert(DisciplinaryRecord).returning(DisciplinaryRecord.record_id, DisciplinaryRecord.student_id),
+                [{
+                    'student_id': sid,
+                    'offence_id': offence_id,
+                    'description': description,
+                    'action_taken': action_taken,
+                    'recorded_by': staff_id
+                } for sid in valid]
+            ).all()
+            
+            if BehaviouralPoints.apply_deductions(valid, points) != len(valid):
+                raise Exception("Behavioural records changed while recording; nothing was saved")
+            ledger.append_entries([ledger.deduction_entry(student_id, record_id, points, staff_id)
+                                   for record_id, student_id in inserted])
+            analytics.record_rollup(valid, offence_id, points)
+            db.session.commit()
+        else:
+            inserted = []
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    for record_id, student_id in inserted:
+        results[student_id] = {'student_id': student_id, 'success': True, 'record_id': record_id}
+        invalidate_student_details(student_id)
+        search_index.add_record(record_id, description, action_taken)
+    for student_id in requested:
+        if results[student_id] is None:
+            results[student_id] = {'student_id': student_id, 'success': False,
+                                   'message': 'Student behavioural record not found'}
+    return list(results.values())
+
+# ETag stamps for @etag_from views, one query each. Students, staff and
+# records are not edited in place; points only change through ledger entries;
+# offence names and archived years move their version rows.
+def _version_source(name):
+    return RefDataVersion.version, RefDataVersion.name == name
+
+def _students_stamp():
+    return row_stamp((Student.student_id,))
+
+def _staff_stamp():
+    return row_stamp((Staff.staff_id,))
+
+def _records_stamp():
+    return row_stamp((DisciplinaryRecord.record_id,), _version_source(REFDATA_KEY),
+                     _version_source(archive.ARCHIVES_KEY))
+
+def _ledger_stamp(student_id):
+    return row_stamp((PointsLedger.entry_id, PointsLedger.student_id == student_id))
+
+def _points_stamp():
+    return row_stamp((PointsLedger.entry_id,), (Student.student_id,))
+
+def _rollups_stamp():
+    # rebuild_rollups replaces the rollup rows, so their ids move too
+    return row_stamp((PointsLedger.entry_id,), (OffenceRollup.rollup_id,), _version_source(REFDATA_KEY))
+
 # Additional helper endpoint to get student and offence data for forms
+# Listing endpoints are keyset-paginated: pass ?limit=&cursor= and follow next_cursor
 @api_bp.route('/api/students', methods=['GET'])
+@read_replica
+@query_budget(2)  # the page and its ETag stamp
+@etag_from(_students_stamp)
 def get_students():
-    students = Student.query.join(User).all()
+    try:
+        students, next_cursor = list_students(request.args.get('cursor'), profile='student_list',
+                                              department=request.args.get('department'),
+                                              student_class=request.args.get('student_class'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     student_list = [{
         'student_id': s.student_id,
         'name': s.user.full_name,
         'register_number': s.register_number,
         'class': s.student_class
     } for s in students]
-    return jsonify(student_list)
+    return jsonify({'students': student_list, 'next_cursor': next_cursor})
+
+@api_bp.route('/api/staff', methods=['GET'])
+@read_replica
+@query_budget(2)  # the page and its ETag stamp
+@etag_from(_staff_stamp)
+def get_staff():
+    try:
+        staff_members, next_cursor = list_staff(request.args.get('cursor'),
+                                                department=request.args.get('department'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    staff_list = [{
+        'staff_id': s.staff_id,
+        'name': s.user.full_name,
+        'staff_empid': s.staff_empid,
+        'position': s.position,
+        'department': s.department
+    } for s in staff_members]
+    return jsonify({'staff': staff_list, 'next_cursor': next_cursor})
+
+@api_bp.route('/api/records', methods=['GET'])
+@read_replica
+@query_budget(4)  # 2 with the ETag stamp; a date range adds an archive list version check (and reload when it moved)
+@etag_from(_records_stamp)
+def get_records():
+    try:
+        date_from = parse_date_arg('date_from')
+        date_to = parse_date_arg('date_to', end=True)
+        if (date_from or date_to) and archive.archives_for_range(date_from, date_to):
+            # The range reaches closed academic years: fan out to their archives
+            records, next_cursor = archive.query_records(
+                date_from=date_from,
+                date_to=date_to,
+                student_id=request.args.get('student_id', type=int),
+                offence_id=request.args.get('offence_id', type=int),
+                department=request.args.get('department'),
+                student_class=request.args.get('student_class'),
+                cursor=request.args.get('cursor')
+            )
+            return jsonify({'records': [
+                dict(r, created_at=r['created_at'].isoformat() if r['created_at'] else None) for r in records
+            ], 'next_cursor': next_cursor})
+        records, next_cursor = list_disciplinary_records(
+            request.args.get('cursor'),
+            offence_id=request.args.get('offence_id', type=int),
+            student_id=request.args.get('student_id', type=int),
+            date_from=date_from,
+            date_to=date_to,
+            department=request.args.get('department'),
+            student_class=request.args.get('student_class')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    record_list = [{
+        'record_id': r.record_id,
+        'student_id': r.student_id,
+        'offence_id': r.offence_id,
+        'description': r.description,
+        'action_taken': r.action_taken,
+        'offence_name': r.offence_type.offence_name,
+        'recorded_by': r.recorded_by,
+        'created_at': r.created_at.isoformat() if r.created_at else None
+    } for r in records]
+    return jsonify({'records': record_list, 'next_cursor': next_cursor})
 
 @api_bp.route('/api/offences', methods=['GET'])
+@read_replica
+@query_budget(4)  # usually 0; a version check, plus a reload when offence types changed
 def get_offences():
-    offences = OffenceType.query.all()
-    offence_list = [{
-        'offence_id': o.offence_id,
-        'offence_name': o.offence_name,
-        'deduct_points': o.deduct_points,
-        'description': o.description
-    } for o in offences]
-    return jsonify(offence_list)
+    # Served from the reference-data cache; the ETag is its version stamp
+    etag = f'offences-{reference_version()}'
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(list_offences())
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config.get('REFDATA_MAX_AGE', 60)
+    return response
 
+# Student details by id are for staff; card holders reach the same data
+# through their signed QR token (qr_student_details below)
 @api_bp.route('/api/student/<int:student_id>/all_details', methods=['GET'])
+@role_required('admin', 'staff')
+@read_replica
+@query_budget(2)  # 1; a cold identity cache adds the user lookup
 def get_student_points(student_id):
-    points = BehaviouralPoints.query.filter_by(student_id=student_id).first()
-    student_details = Student.query.get(student_id)
-    user_details = User.query.get(student_details.user_id) if student_details else None
-    if student_details and points:
+    details = get_student_details(student_id)
+    if details:
+        return jsonify(details)
+    return jsonify({'error': 'Student points not found'}), 404
 
-        return jsonify({
-            'student_name': user_details.full_name if user_details else "Unknown",
-            'register_number': student_details.register_number if student_details else "Unknown",
-            'student_class': student_details.student_class if student_details else "Unknown",
-            'department': student_details.department if student_details else "Unknown",
-            'parent_name': student_details.parent_name if student_details else "Unknown",
-            'parent_contact': student_details.parent_contact if student_details else "Unknown",
-            'total_points': points.total_points if student_details else "Unknown",
-            'offence_count': points.offence_count if student_details else "Unknown"
-        })
-    return jsonify({'error': 'Student points not found'}), 404
\ No newline at end of file
+def _token_student_id(token):
+    # (student_id, None) for a valid QR token, else (None, error response)
+    try:
+        return verify_token(token).student_id, None
+    except InvalidQRToken as e:
+        return None, (jsonify({'error': 'Invalid QR code', 'reason': e.reason}),
+                      400 if e.reason == 'malformed' else 403)
+
+@api_bp.route('/api/qr/<token>/details', methods=['GET'])
+@read_replica
+@query_budget(1)
+def qr_student_details(token):
+    student_id, error = _token_student_id(token)
+    if error:
+        return error
+    details = get_student_details(student_id)
+    if details:
+        return jsonify(details)
+    return jsonify({'error': 'Student points not found'}), 404
+
+# Points ledger: history, point-in-time balances and corrections
+@api_bp.route('/api/student/<int:student_id>/ledger', methods=['GET'])
+@read_replica
+@query_budget(2)  # the page and its ETag stamp
+@etag_from(_ledger_stamp)
+def get_student_ledger(student_id):
+    try:
+        entries, next_cursor = list_ledger_entries(student_id, request.args.get('cursor'),
+                                                   entry_type=request.args.get('entry_type'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'entries': [{
+        'entry_id': e.entry_id,
+        'record_id': e.record_id,
+        'entry_type': e.entry_type,
+        'points_delta': e.points_delta,
+        'offence_delta': e.offence_delta,
+        'reason': e.reason,
+        'created_by': e.created_by,
+        'created_at': e.created_at.isoformat() if e.created_at else None
+    } for e in entries], 'next_cursor': next_cursor})
+
+@api_bp.route('/api/student/<int:student_id>/points_at', methods=['GET'])
+@read_replica
+@query_budget(4)  # 3, plus the ETag stamp
+@etag_from(_ledger_stamp)
+def get_student_points_at(student_id):
+    """
+    Points and offence count as they stood at ?at= (ISO date or datetime;
+    a bare date means the end of that day). Defaults to now.
+    """
+    try:
+        at = parse_date_arg('at', end=True) or datetime.now()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    balance = ledger.points_at(student_id, at)
+    if balance is None:
+        return jsonify({'error': 'Student not found'}), 404
+    return jsonify(balance)
+
+@api_bp.route('/records/<int:record_id>/reverse', methods=['POST'])
+@role_required('admin', 'staff')
+def reverse_record_route(record_id):
+    reason = (request.get_json(silent=True) or {}).get('reason') if request.is_json else request.form.get('reason')
+    if not reason:
+        return jsonify({'success': False, 'message': 'A reason is required'}), 400
+    try:
+        success, message, entry_id = ledger.reverse_record(record_id, current_user.staff_id, reason)
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error reversing record: {str(e)}'}), 500
+    if not success:
+        return jsonify({'success': False, 'message': message}), 404 if message == 'Record not found' else 409
+    student_id = db.session.query(DisciplinaryRecord.student_id).filter_by(record_id=record_id).scalar()
+    invalidate_student_details(student_id)
+    return jsonify({'success': True, 'message': message, 'entry_id': entry_id})
+
+@api_bp.route('/student/<int:student_id>/adjust_points', methods=['POST'])
+@role_required('admin', 'staff')
+def adjust_points_route(student_id):
+    data = (request.get_json(silent=True) or {}) if request.is_json else request.form
+    try:
+        points = int(data['points'])
+        reason = data['reason']
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'points (an integer) and reason are required'}), 400
+    if not points or not reason:
+        return jsonify({'success': False, 'message': 'points must be non-zero and a reason is required'}), 400
+    try:
+        success, message, entry_id = ledger.adjust_points(student_id, points, current_user.staff_id, reason)
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error adjusting points: {str(e)}'}), 500
+    if not success:
+        return jsonify({'success': False, 'message': message}), 404
+    invalidate_student_details(student_id)
+    return jsonify({'success': True, 'message': message, 'entry_id': entry_id})
+
+# Gate scans: signed QR tokens are checked from memory, never the database
+@api_bp.route('/qr/verify/<token>', methods=['GET'])
+@query_budget(0)
+def verify_qr(token):
+    try:
+        claims = verify_token(token)
+    except InvalidQRToken as e:
+        return jsonify({'valid': False, 'reason': e.reason}), 400 if e.reason == 'malformed' else 403
+    return jsonify(dict(claims.to_dict(), valid=True))
+
+@api_bp.route('/student/<int:student_id>/revoke_qr', methods=['POST'])
+@role_required('admin', 'staff')
+def revoke_qr(student_id):
+    """
+    Invalidate a student's current QR cards (e.g. a lost card) and reissue
+    the stored QR image with a fresh token
+    """
+    register_number = db.session.query(Student.register_number).filter_by(student_id=student_id).scalar()
+    if register_number is None:
+        return jsonify({'success': False, 'message': 'Student not found'}), 404
+    reason = (request.get_json(silent=True) or {}).get('reason') if request.is_json else request.form.get('reason')
+    try:
+        not_before = revoke_student_tokens(student_id, current_user.staff_id, reason)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Error revoking QR code: {str(e)}'}), 500
+    qr_job_id = enqueue('render_student_qr', student_id=student_id, register_number=register_number)
+    return jsonify({
+        'success': True,
+        'message': f'Cards issued before {not_before.isoformat()} are no longer accepted',
+        'not_before': not_before.isoformat(),
+        'qr_url': f'/api/download_qr/{qr_filename(student_id, register_number)}',
+        'qr_job_id': qr_job_id
+    })
+
+@api_bp.route('/api/qr/stats', methods=['GET'])
+def qr_token_stats():
+    return jsonify(token_stats())
+
+@api_bp.route('/api/archives', methods=['GET'])
+@query_budget(2)
+def list_archived_years():
+    return jsonify({'archives': [dict(
+        a,
+        starts_at=a['starts_at'].isoformat(),
+        ends_at=a['ends_at'].isoformat(),
+        archived_at=a['archived_at'].isoformat() if a['archived_at'] else None
+    ) for a in archive.list_archives()]})
+
+# Live points updates as server-sent events, instead of polling the detail
+# endpoints. Reconnecting clients send Last-Event-ID and get what they missed.
+def _event_stream(channels):
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+    try:
+        subscription, backlog = event_broker.subscribe(channels, last_event_id)
+    except OverflowError:
+        response = jsonify({'error': 'Too many live connections, retry later'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    
+    # No request/app context is kept for the stream, so an idle connection
+    # holds no database session
+    response = Response(sse_stream(subscription, backlog,
+                                   heartbeat=current_app.config.get('EVENTS_HEARTBEAT', 15),
+                                   retry_ms=current_app.config.get('EVENTS_RETRY_MS', 3000),
+                                   last_event_id=last_event_id),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx: do not buffer the stream
+    return response
+
+@api_bp.route('/events/student/<int:student_id>', methods=['GET'])
+@role_required('admin', 'staff')
+def student_events(student_id):
+    return _event_stream([student_channel(student_id)])
+
+@api_bp.route('/events/qr/<token>', methods=['GET'])
+def qr_student_events(token):
+    # Same audience as the QR scan details it keeps current
+    student_id, error = _token_student_id(token)
+    if error:
+        return error
+    return _event_stream([student_channel(student_id)])
+
+@api_bp.route('/events/department/<department>', methods=['GET'])
+@role_required('admin', 'staff')
+def department_events(department):
+    return _event_stream([department_channel(department)])
+
+@api_bp.route('/api/events/stats', methods=['GET'])
+def event_stats():
+    return jsonify(event_broker.stats())
+
+# Typeahead / keyword search, served from the in-process index
+def _search_limit(default):
+    return max(1, min(request.args.get('limit', default, type=int), current_app.config.get('MAX_PAGE_SIZE', 500)))
+
+@api_bp.route('/api/search/students', methods=['GET'])
+@read_replica
+@query_budget(4)  # 2 for a refresh; the first index build also reads the records and the archive list
+def search_students():
+    search_index.refresh()
+    return jsonify({'students': search_index.search_students(
+        request.args.get('q', ''),
+        limit=_search_limit(10),
+        department=request.args.get('department'),
+        student_class=request.args.get('student_class')
+    )})
+
+SEARCH_RECORD_FIELDS = ('record_id', 'student_id', 'student_name', 'register_number', 'offence_name',
+                        'description', 'action_taken', 'recorded_by', 'created_at')
+
+@api_bp.route('/api/search/records', methods=['GET'])
+@read_replica
+@query_budget(5)  # 3; the first index build also reads the archive list (2)
+def search_records():
+    search_index.refresh()
+    record_ids = search_index.search_records(request.args.get('q', ''), limit=_search_limit(20))
+    records = []
+    if record_ids:
+        records = [{
+            'record_id': r.record_id,
+            'student_id': r.student_id,
+            'student_name': r.student.user.full_name,
+            'register_number': r.student.register_number,
+            'offence_name': r.offence_type.offence_name,
+            'description': r.description,
+            'action_taken': r.action_taken,
+            'recorded_by': r.recorded_by,
+            'created_at': r.created_at
+        } for r in with_profile(DisciplinaryRecord.query, 'record_list')
+            .filter(DisciplinaryRecord.record_id.in_(record_ids))]
+        # Matches that are no longer live were moved to an academic year archive
+        missing = set(record_ids) - {r['record_id'] for r in records}
+        if missing:
+            records += [{field: r[field] for field in SEARCH_RECORD_FIELDS}
+                        for r in archive.find_records(missing).values()]
+        records.sort(key=lambda r: r['record_id'], reverse=True)
+    return jsonify({'records': [
+        dict(r, created_at=r['created_at'].isoformat() if r['created_at'] else None) for r in records
+    ]})
+
+@api_bp.route('/api/search/stats', methods=['GET'])
+def search_index_stats():
+    return jsonify(search_index.stats())
+
+@api_bp.route('/student/<int:student_id>/report_card', methods=['GET'])
+@role_required('admin', 'staff')
+@read_replica
+def download_report_card(student_id):
+    if not reports_supported():
+        return jsonify({'error': 'PDF reports are not available (reportlab is not installed)'}), 501
+    reports = load_report_data([student_id])
+    if not reports:
+        return jsonify({'error': 'Student not found'}), 404
+    report = reports[0]
+    return send_file(BytesIO(render_report_card(report)), mimetype='application/pdf',
+                     download_name=report_filename(student_id, report['register_number']))
+
+@api_bp.route('/api/cache/student_details', methods=['GET'])
+def student_details_cache_stats():
+    return jsonify(student_details_cache.stats())
+
+
+# Dashboard analytics, served from the offence_rollup table
+def _analytics_filters():
+    date_from = parse_date_arg('date_from')
+    date_to = parse_date_arg('date_to')
+    return {
+        'date_from': date_from.date() if date_from else None,
+        'date_to': date_to.date() if date_to else None,
+        'department': request.args.get('department'),
+        'student_class': request.args.get('student_class')
+    }
+
+@api_bp.route('/api/analytics/summary', methods=['GET'])
+@role_required('admin', 'staff')
+@read_replica
+@query_budget(4)  # 2, plus the ETag stamp; a cold identity cache adds the user lookup
+@etag_from(_rollups_stamp)
+def analytics_summary():
+    try:
+        filters = _analytics_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'classes': analytics.class_summary(**filters),
+        'top_offences': analytics.top_offences(limit=request.args.get('limit', 10, type=int), **filters)
+    })
+
+@api_bp.route('/api/analytics/trends', methods=['GET'])
+@role_required('admin', 'staff')
+@read_replica
+@query_budget(3)  # 1, plus the ETag stamp; a cold identity cache adds the user lookup
+@etag_from(_rollups_stamp)
+def analytics_trends():
+    try:
+        filters = _analytics_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'months': analytics.monthly_trends(**filters)})
+
+@api_bp.route('/api/analytics/points_distribution', methods=['GET'])
+@role_required('admin', 'staff')
+@read_replica
+@query_budget(3)  # 1 (points_band_count), plus the ETag stamp; a cold identity cache adds the user lookup
+@etag_from(_points_stamp)
+def analytics_points_distribution():
+    return jsonify({'distribution': analytics.points_distribution(
+        department=request.args.get('department'),
+        student_class=request.args.get('student_class')
+    )})
+
+@api_bp.route('/api/analytics/leaderboard', methods=['GET'])
+@role_required('admin', 'staff')
+@read_replica
+@query_budget(3)  # 1, plus the ETag stamp; a cold identity cache adds the user lookup
+@etag_from(_points_stamp)
+def analytics_leaderboard():
+    limit = max(1, min(request.args.get('limit', 10, type=int), current_app.config.get('MAX_PAGE_SIZE', 500)))
+    return jsonify({'lowest_points': analytics.lowest_points(
+        limit=limit,
+        department=request.args.get('department'),
+        student_class=request.args.get('student_class')
+    )})
+
+# Term-end export of the full disciplinary history
+def _stream_from_replica(chunks):
+    # The body is generated after the view returns, so route reads here too
+    with use_replica():
+        yield from chunks
+
+@api_bp.route('/export/records', methods=['GET'])
+@role_required('admin', 'staff')
+def export_records():
+    """
+    Stream disciplinary records joined with student, offence and staff as
+    CSV (default) or XLSX (?format=xlsx), filtered by date_from/date_to,
+    department and student_class
+    """
+    try:
+        filters = {
+            'date_from': parse_date_arg('date_from'),
+            'date_to': parse_date_arg('date_to', end=True),
+            'department': request.args.get('department'),
+            'student_class': request.args.get('student_class')
+        }
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    export_format = request.args.get('format', 'csv')
+    if export_format == 'csv':
+        chunks, mimetype = export.iter_csv(**filters), 'text/csv'
+    elif export_format == 'xlsx':
+        if not export.xlsx_supported():
+            return jsonify({'error': 'XLSX export is not available (openpyxl is not installed)'}), 501
+        chunks, mimetype = export.iter_xlsx(**filters), export.XLSX_MIMETYPE
+    else:
+        return jsonify({'error': f'Unknown export format: {export_format}'}), 400
+
+    response = Response(stream_with_context(_stream_from_replica(chunks)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=disciplinary_records.{export_format}'
+    return response
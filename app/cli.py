@@ -0,0 +1,461 @@
+import click
+from jinja2 import BaseLoader
+
+
+def _scratch_app(app, filename):
+    """
+    A second app like `app` on a new SQLite file in a temp directory, for
+    checks that seed data without touching the configured database. Pages
+    added outside create_app (run.py's) are registered on it too.
+    """
+    import os
+    import tempfile
+    from config import Config
+    from app import create_app
+
+    configured_uri = Config.SQLALCHEMY_DATABASE_URI
+    Config.SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tempfile.mkdtemp(), filename)}"
+    try:
+        scratch = create_app()
+    finally:
+        Config.SQLALCHEMY_DATABASE_URI = configured_uri
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint not in scratch.view_functions:
+            scratch.add_url_rule(rule.rule, rule.endpoint, app.view_functions[rule.endpoint], methods=rule.methods)
+    return scratch
+
+
+class _StubTemplates(BaseLoader):
+    # Stands in for page templates that are not in the tree, so a view can
+    # still be called and its queries counted
+    def get_source(self, environment, template):
+        return '{# stub: %s #}{{ next_cursor or "" }}' % template, None, lambda: True
+
+
+def _empty_caches():
+    # Drop every in-process cache, so a request takes its cold path
+    from app.utils import archive, refdata
+    from app.utils.identity import invalidate_identity
+    from app.utils.search import search_index
+    from app.utils.student_details import student_details_cache
+
+    refdata.invalidate_reference_data()
+    archive.invalidate_archives()
+    invalidate_identity()
+    search_index.clear()
+    student_details_cache.clear()
+
+
+def register_commands(app):
+    """
+    Attach the project's `flask <command>` CLI commands to the app
+    """
+
+    @app.cli.command('check-query-budgets')
+    @click.option('--students', 'sizes', default=(8, 200), type=int, nargs=2, show_default=True,
+                  help='Seeded students (and staff) for the small and the large pass, 5 records each; '
+                       'the small pass must fit on one page (PAGE_SIZE) and the large one must not')
+    def check_query_budgets(sizes):
+        """
+        Call every budgeted GET endpoint on a throwaway database seeded at two
+        sizes, one below and one above the page size, with the in-process
+        caches emptied before each call so both passes take the same (cold)
+        path. Fails when an endpoint errors, goes over its budget, or issues
+        more statements on the larger data set (an N+1 query). Templates that
+        are not in the tree render as a stub, so the count covers the view's
+        own queries.
+        """
+        from flask import url_for
+        from jinja2 import ChoiceLoader
+        from app.models import db, Student
+        from app.utils.qr_tokens import issue_token
+        from app.utils.query_budget import budgeted_endpoints, count_queries
+        from app.utils.seed import seed_database
+
+        check_app = _scratch_app(app, 'query_budgets.db')
+        check_app.config.update(LOGIN_DISABLED=True, QUERY_BUDGET_ENFORCE=False)
+        check_app.jinja_env.loader = ChoiceLoader([check_app.jinja_env.loader, _StubTemplates()])
+        page_size = check_app.config.get('PAGE_SIZE', 50)
+        small, large = sizes
+        if not small * 5 < page_size < large:
+            raise click.UsageError(f'--students must straddle the page size ({page_size}): '
+                                   f'{small} student(s) / {small * 5} record(s) below it, {large} above')
+        client = check_app.test_client()
+
+        counts = {}
+        failures = 0
+        seeded = 0
+        for size in sizes:
+            with check_app.test_request_context():
+                seed_database(students=size - seeded, staff=size - seeded,
+                              records=(size - seeded) * 5, hash_method='pbkdf2:sha256:1000')
+                seeded = size
+                student = Student.query.order_by(Student.student_id.desc()).first()
+                arguments = {'student_id': student.student_id,
+                             'token': issue_token(student.student_id, student.register_number)}
+                urls = []
+                for endpoint, rule, budget, rule_arguments in budgeted_endpoints(check_app):
+                    url = None
+                    if all(name in arguments for name in rule_arguments):
+                        url = url_for(endpoint, **{name: arguments[name] for name in rule_arguments})
+                    urls.append((rule, endpoint, url, budget))
+                db.session.remove()
+
+            click.echo(f'{size} students, {size} staff, {size * 5} records:')
+            for rule, endpoint, url, budget in sorted(urls):
+                if url is None:
+                    failures += 1
+                    click.echo(f'FAIL {rule:45} no value for its URL arguments')
+                    continue
+                _empty_caches()
+                with count_queries() as statements:
+                    response = client.get(url)
+                problems = []
+                if not 200 <= response.status_code < 300:
+                    problems.append(f'HTTP {response.status_code}')
+                if len(statements) > budget:
+                    problems.append('over budget')
+                if endpoint in counts and len(statements) > counts[endpoint]:
+                    problems.append(f'grew from {counts[endpoint]} with more data')
+                counts.setdefault(endpoint, len(statements))
+                failures += bool(problems)
+                click.echo(f"{'FAIL' if problems else 'ok':4} {url:45} {len(statements):3} queries "
+                           f"(budget {budget}, HTTP {response.status_code}){': ' + ', '.join(problems) if problems else ''}")
+
+        if failures:
+            raise click.ClickException(f'{failures} endpoint check(s) failed')
+
+    @app.cli.command('check-concurrent-deductions')
+    @click.option('--threads', default=16, show_default=True)
+    @click.option('--offences', default=400, show_default=True)
+    @click.option('--students', default=3, show_default=True)
+    def check_concurrent_deductions(threads, offences, students):
+        """
+        Record offences for a few students from many threads at once on a
+        throwaway database and check that no deduction was lost. Every call
+        must succeed the first time (nothing is retried) and each student's
+        points, offence count, records and ledger must add up.
+        """
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from sqlalchemy import func
+        from app.api.routes import record_offence
+        from app.models import db, BehaviouralPoints, DisciplinaryRecord, OffenceType, PointsLedger, Staff
+        from app.utils.seed import seed_database
+
+        check_app = _scratch_app(app, 'concurrent_deductions.db')
+        with check_app.app_context():
+            seed_database(students=students, staff=1, records=0, hash_method='pbkdf2:sha256:1000')
+            student_ids = [s for (s,) in db.session.query(BehaviouralPoints.student_id).order_by(BehaviouralPoints.student_id)]
+            start = dict(db.session.query(BehaviouralPoints.student_id, BehaviouralPoints.total_points))
+            staff_id = db.session.query(Staff.staff_id).scalar()
+            offence = OffenceType.query.order_by(OffenceType.offence_id).first()
+            offence_id, deduct = offence.offence_id, offence.deduct_points
+
+        def record(n):
+            with check_app.app_context():
+                record_offence(student_ids[n % len(student_ids)], offence_id, 'concurrency check', '-', staff_id)
+
+        errors = []
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for future in [pool.submit(record, n) for n in range(offences)]:
+                if future.exception() is not None:
+                    errors.append(future.exception())
+        elapsed = time.perf_counter() - started
+
+        failures = len(errors)
+        for error in errors[:5]:
+            click.echo(f'ERROR {type(error).__name__}: {error}')
+        with check_app.app_context():
+            for i, student_id in enumerate(student_ids):
+                expected = len(range(i, offences, len(student_ids)))
+                points = db.session.get(BehaviouralPoints, student_id)
+                records = db.session.query(func.count(DisciplinaryRecord.record_id)) \
+                    .filter(DisciplinaryRecord.student_id == student_id).scalar()
+                ledger_points = db.session.query(func.coalesce(func.sum(PointsLedger.points_delta), 0)) \
+                    .filter(PointsLedger.student_id == student_id).scalar()
+                ok = (points.offence_count == records == expected
+                      and points.total_points == start[student_id] - expected * deduct
+                      and ledger_points == -expected * deduct)
+                failures += not ok
+                click.echo(f"{'ok' if ok else 'FAIL':4} student {student_id}: expected {expected} offence(s), got "
+                           f"{points.offence_count} counted, {records} record(s), "
+                           f"{start[student_id] - points.total_points} point(s) deducted, ledger {ledger_points}")
+
+        click.echo(f'{offences} offences on {threads} threads in {elapsed:.2f}s, {len(errors)} error(s)')
+        if failures:
+            raise click.ClickException(f'{failures} failure(s): deductions were lost or calls failed')
+
+    @app.cli.command('import-users')
+    @click.argument('csv_file', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--role', type=click.Choice(['student', 'staff']), default='student')
+    @click.option('--batch-size', default=1000, show_default=True)
+    @click.option('--workers', type=int, default=None, help='Password hashing processes (default: CPU count)')
+    @click.option('--report', type=click.Path(dir_okay=False), help='Write the JSON row report here')
+    def import_users_command(csv_file, role, batch_size, workers, report):
+        """Bulk-create students or staff from a CSV file."""
+        import json
+        import time
+        from app.utils.bulk_import import import_users
+
+        started = time.perf_counter()
+        with open(csv_file, newline='', encoding='utf-8') as f:
+            result = import_users(f, role, batch_size=batch_size, workers=workers,
+                                  hash_method=app.config.get('PASSWORD_HASH_METHOD'))
+        elapsed = time.perf_counter() - started
+
+        click.echo(f"Created {result['created']} {role} account(s) in {elapsed:.1f}s, "
+                   f"{len(result['errors'])} row error(s)")
+        for error in result['errors'][:20]:
+            click.echo(f"  row {error['row']}: {error['error']}")
+        if report:
+            with open(report, 'w') as f:
+                json.dump(result, f, indent=2)
+
+    @app.cli.command('generate-qr')
+    @click.option('--department', help='Only students in this department')
+    @click.option('--student-class', help='Only students in this class')
+    @click.option('--output', default=None, help='Output directory (default: static/qrcodes)')
+    @click.option('--sheet', type=click.Path(dir_okay=False),
+                  help='Also write printable sheets here (.pdf: one A4 page per grid, otherwise one PNG per page)')
+    @click.option('--columns', default=4, show_default=True)
+    @click.option('--rows', default=5, show_default=True, help='Grid rows per sheet page')
+    @click.option('--workers', type=int, default=None, help='Render processes (default: CPU count)')
+    def generate_qr_command(department, student_class, output, sheet, columns, rows, workers):
+        """Render QR codes for a whole class or department in a process pool."""
+        import os
+        import time
+        from app.models import Student
+        from app.utils.qr_generator import generate_qr_batch, qr_output_dir
+
+        query = Student.query.with_entities(Student.student_id, Student.register_number)
+        if department:
+            query = query.filter(Student.department == department)
+        if student_class:
+            query = query.filter(Student.student_class == student_class)
+        students = [tuple(row) for row in query.order_by(Student.student_class, Student.register_number)]
+
+        output = output or qr_output_dir()
+        started = time.perf_counter()
+        filenames = generate_qr_batch(students, output_path=output, workers=workers,
+                                      sheet_path=sheet, columns=columns, rows=rows)
+        click.echo(f'Rendered {len(filenames)} QR code(s) into {output} in {time.perf_counter() - started:.1f}s')
+        if sheet and filenames:
+            pages = -(-len(filenames) // (columns * rows))
+            if pages > 1 and not sheet.lower().endswith('.pdf'):
+                stem, ext = os.path.splitext(sheet)
+                click.echo(f'Sheet written as {pages} pages: {stem}-1{ext or ".png"} .. {stem}-{pages}{ext or ".png"}')
+            else:
+                click.echo(f'Sheet of {pages} page(s) written to {sheet}')
+
+    @app.cli.command('run-worker')
+    @click.option('--threads', default=2, show_default=True)
+    @click.option('--poll-interval', default=1.0, show_default=True)
+    @click.option('--once', is_flag=True, help='Drain the runnable jobs and exit')
+    def run_worker_command(threads, poll_interval, once):
+        """Process background jobs from the persistent queue."""
+        from app.utils.jobs import purge_finished_jobs, run_pending, run_worker
+
+        if once:
+            click.echo(f'Processed {run_pending()} job(s); purged {purge_finished_jobs()} finished job(s)')
+            return
+        click.echo(f'Job worker running with {threads} thread(s); Ctrl-C to stop')
+        run_worker(app, threads=threads, poll_interval=poll_interval)
+
+    @app.cli.command('db-info')
+    def db_info():
+        """Show the effective database engines, pool settings and SQLite pragmas."""
+        from sqlalchemy import text
+        from app.models import db
+
+        for bind_key, engine in db.engines.items():
+            click.echo(f"[{bind_key or 'primary'}] {engine.url.render_as_string(hide_password=True)}")
+            click.echo(f'  pool: {engine.pool.status()}')
+            if engine.dialect.name == 'sqlite':
+                with engine.connect() as conn:
+                    for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size'):
+                        value = conn.execute(text(f'PRAGMA {pragma}')).scalar()
+                        click.echo(f'  {pragma} = {value}')
+
+    @app.cli.command('init-db')
+    def init_db():
+        """Create/upgrade the schema and insert the default roles and offence types (idempotent)."""
+        from app.models import db
+        from app.utils.bootstrap import init_database
+
+        init_database(db.engine, echo=click.echo)
+
+    @app.cli.command('db-upgrade')
+    @click.option('--to', 'target', help='Revision to upgrade to (default: head)')
+    def db_upgrade(target):
+        """Apply pending schema migrations."""
+        from app import migrations
+        from app.models import db
+
+        revision = migrations.upgrade(db.engine, target, echo=click.echo)
+        click.echo(f'Database at revision {revision or "base"}')
+
+    @app.cli.command('db-downgrade')
+    @click.option('--to', 'target', help='Revision to downgrade to (default: base)')
+    def db_downgrade(target):
+        """Revert schema migrations."""
+        from app import migrations
+        from app.models import db
+
+        revision = migrations.downgrade(db.engine, target, echo=click.echo)
+        click.echo(f'Database at revision {revision or "base"}')
+
+    @app.cli.command('db-history')
+    def db_history():
+        """List migrations and mark the applied revision."""
+        from app import migrations
+        from app.models import db
+
+        with db.engine.begin() as conn:
+            current = migrations.current_revision(conn)
+        for migration in migrations.load_migrations():
+            marker = '*' if migration.revision == current else ' '
+            click.echo(f'{marker} {migration.revision}  {migration.description}')
+
+    @app.cli.command('seed-data')
+    @click.option('--students', default=1000, show_default=True)
+    @click.option('--staff', default=50, show_default=True)
+    @click.option('--records', default=5000, show_default=True)
+    @click.option('--days', default=365, show_default=True, help='Spread records over this many past days')
+    @click.option('--seed', default=42, show_default=True, help='Random seed for reproducible data')
+    @click.option('--password', default='password', show_default=True, help='Password for every seeded account')
+    def seed_data(students, staff, records, days, seed, password):
+        """Generate synthetic students, staff and disciplinary history for load testing."""
+        import time
+        from app.utils.seed import seed_database
+
+        started = time.perf_counter()
+        created = seed_database(students=students, staff=staff, records=records, days=days, seed=seed,
+                                password=password, hash_method=app.config.get('PASSWORD_HASH_METHOD'),
+                                echo=click.echo)
+        click.echo(f"Seeded {created['users']} users and {created['records']} records "
+                   f"in {time.perf_counter() - started:.1f}s")
+
+    @app.cli.command('rebuild-analytics')
+    @click.option('--date-from', type=click.DateTime(formats=['%Y-%m-%d']), help='First day to rebuild')
+    @click.option('--date-to', type=click.DateTime(formats=['%Y-%m-%d']), help='Last day to rebuild')
+    def rebuild_analytics(date_from, date_to):
+        """Recompute the offence rollups from disciplinary history (backfill)."""
+        from app.utils.analytics import rebuild_rollups
+
+        written = rebuild_rollups(date_from.date() if date_from else None, date_to.date() if date_to else None)
+        click.echo(f'Wrote {written} rollup row(s)')
+
+    @app.cli.command('export-records')
+    @click.argument('output', type=click.Path(dir_okay=False))
+    @click.option('--format', 'export_format', type=click.Choice(['csv', 'xlsx']), default=None,
+                  help='Default: from the output file extension')
+    @click.option('--date-from', type=click.DateTime(formats=['%Y-%m-%d']), help='First day to export')
+    @click.option('--date-to', type=click.DateTime(formats=['%Y-%m-%d']), help='Last day to export (inclusive)')
+    @click.option('--department', help='Only students in this department')
+    @click.option('--student-class', help='Only students in this class')
+    @click.option('--chunk-size', default=2000, show_default=True, help='Rows fetched per round trip')
+    def export_records_command(output, export_format, date_from, date_to, department, student_class, chunk_size):
+        """Export disciplinary history to CSV or XLSX, streaming rows in chunks."""
+        import time
+        from datetime import timedelta
+        from app.utils.export import iter_csv, write_xlsx
+
+        export_format = export_format or ('xlsx' if output.lower().endswith('.xlsx') else 'csv')
+        filters = {
+            'date_from': date_from,
+            'date_to': date_to + timedelta(days=1) if date_to else None,
+            'department': department,
+            'student_class': student_class
+        }
+        started = time.perf_counter()
+        if export_format == 'xlsx':
+            with open(output, 'wb') as f:
+                written = write_xlsx(f, chunk_size, **filters)
+        else:
+            written = -1  # header line
+            with open(output, 'w', newline='') as f:
+                for text in iter_csv(chunk_size, **filters):
+                    f.write(text)
+                    written += text.count('\n')
+        click.echo(f'Exported {written} record(s) to {output} in {time.perf_counter() - started:.1f}s')
+
+    @app.cli.command('generate-reports')
+    @click.option('--department', help='Only students in this department')
+    @click.option('--student-class', help='Only students in this class')
+    @click.option('--output', default=None, help='Output directory (default: REPORT_OUTPUT_DIR)')
+    @click.option('--batch-size', default=200, show_default=True, help='Students loaded from the database at a time')
+    @click.option('--workers', type=int, default=None, help='Render processes (default: CPU count)')
+    def generate_reports_command(department, student_class, output, batch_size, workers):
+        """Render PDF behaviour reports for a whole class or department in a process pool."""
+        import time
+        from app.utils.report_cards import generate_report_batch, iter_report_batches, reports_supported
+
+        if not reports_supported():
+            raise click.ClickException('PDF reports require reportlab: pip install reportlab')
+        output = output or app.config.get('REPORT_OUTPUT_DIR', 'pdf/reports')
+        started = time.perf_counter()
+        filenames = generate_report_batch(
+            iter_report_batches(department=department, student_class=student_class, batch_size=batch_size),
+            output_path=output, workers=workers
+        )
+        click.echo(f'Rendered {len(filenames)} report(s) into {output} in {time.perf_counter() - started:.1f}s')
+
+    @app.cli.command('snapshot-points')
+    def snapshot_points_command():
+        """Snapshot the points of every student whose ledger changed since the last run."""
+        from app.utils.ledger import take_snapshots
+
+        click.echo(f"Wrote {take_snapshots(lag=app.config.get('LEDGER_SNAPSHOT_LAG', 300))} snapshot(s)")
+
+    @app.cli.command('reconcile-points')
+    @click.option('--fix', is_flag=True, help='Rebuild mismatched behavioural points from the ledger')
+    @click.option('--chunk-size', default=1000, show_default=True, help='Students per range')
+    @click.option('--workers', default=4, show_default=True, help='Ranges checked in parallel')
+    def reconcile_points_command(fix, chunk_size, workers):
+        """Check behavioural points against the points ledger (optionally fixing them)."""
+        import time
+        from app.utils.ledger import reconcile_points
+
+        started = time.perf_counter()
+        mismatches = reconcile_points(app, fix=fix, chunk_size=chunk_size, workers=workers)
+        for m in mismatches[:20]:
+            click.echo(f"  student {m['student_id']}: points {m['total_points']} (ledger {m['ledger_points']}), "
+                       f"offences {m['offence_count']} (ledger {m['ledger_offences']})")
+        action = 'fixed' if fix else 'found'
+        click.echo(f'{len(mismatches)} mismatch(es) {action} in {time.perf_counter() - started:.1f}s')
+        if mismatches and not fix:
+            raise click.ClickException('Points do not match the ledger; rerun with --fix to rebuild them')
+
+    @app.cli.command('archive-year')
+    @click.argument('year', type=int)
+    @click.option('--points-policy', type=click.Choice(['reset', 'carry']), default=None,
+                  help='Default: ACADEMIC_YEAR_POINTS_POLICY')
+    def archive_year_command(year, points_policy):
+        """Move a closed academic year's disciplinary records into their own archive table."""
+        import time
+        from app.utils.archive import archive_year
+
+        points_policy = points_policy or app.config.get('ACADEMIC_YEAR_POINTS_POLICY', 'carry')
+        started = time.perf_counter()
+        try:
+            result = archive_year(year, points_policy=points_policy)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Archived {result['records']} record(s) of {result['label']} into {result['table_name']} "
+                   f"in {time.perf_counter() - started:.1f}s")
+        if points_policy == 'reset':
+            click.echo(f"Points reset for {result['students_reset']} student(s)")
+
+    @app.cli.command('list-archives')
+    def list_archives_command():
+        """List the archived academic years."""
+        from app.utils.archive import list_archives
+
+        archives = list_archives()
+        for a in archives:
+            click.echo(f"{a['label']:8} {a['table_name']:28} {a['record_count']:9} record(s)  "
+                       f"points {a['points_policy']:5}  archived {a['archived_at']:%Y-%m-%d}")
+        if not archives:
+            click.echo('No archived academic years')
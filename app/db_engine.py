@@ -0,0 +1,125 @@
+from contextlib import contextmanager
+from functools import wraps
+
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+REPLICA_BIND = 'replica'
+
+
+class RoutingSession(Session):
+    """
+    Session that sends SELECTs to the read replica while read routing is
+    switched on (see use_replica); everything else, and anything issued
+    while flushing, goes to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and self.info.get('use_replica') and not self._flushing
+                and clause is not None and getattr(clause, 'is_select', False)):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def use_replica():
+    """
+    Route read queries in this block to the replica (no-op without one)
+    """
+    from app.models import db
+    previous = db.session.info.get('use_replica', False)
+    db.session.info['use_replica'] = True
+    try:
+        yield
+    finally:
+        db.session.info['use_replica'] = previous
+
+
+@contextmanager
+def use_primary():
+    """
+    Send reads in this block to the primary even inside a read_replica view
+    (e.g. loads that fill a cache which must not hold lagging data)
+    """
+    from app.models import db
+    previous = db.session.info.get('use_replica', False)
+    db.session.info['use_replica'] = False
+    try:
+        yield
+    finally:
+        db.session.info['use_replica'] = previous
+
+
+def read_replica(view):
+    """
+    Decorator for read-only views whose queries may be served by the replica
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with use_replica():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def engine_options(url, config):
+    """
+    SQLAlchemy engine options for a database URL: pool sizing and pre-ping
+    for server databases, nothing special for SQLite (tuned on connect)
+    """
+    if make_url(url).get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'pool_size': config.get('DB_POOL_SIZE', 10),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': config.get('DB_POOL_PRE_PING', True),
+    }
+
+
+def configure_engines(app):
+    """
+    Fill in engine options and the replica bind before db.init_app()
+    """
+    config = app.config
+    config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(config['SQLALCHEMY_DATABASE_URI'], config))
+
+    replica_url = config.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault(REPLICA_BIND, {'url': replica_url, **engine_options(replica_url, config)})
+        config['SQLALCHEMY_BINDS'] = binds
+
+
+def sqlite_pragmas(config):
+    pragmas = {
+        'journal_mode': config.get('SQLITE_JOURNAL_MODE'),
+        'synchronous': config.get('SQLITE_SYNCHRONOUS'),
+        'busy_timeout': config.get('SQLITE_BUSY_TIMEOUT'),
+        'mmap_size': config.get('SQLITE_MMAP_SIZE'),
+        'cache_size': config.get('SQLITE_CACHE_SIZE'),
+    }
+    return {name: value for name, value in pragmas.items() if value is not None}
+
+
+def tune_sqlite_engines(app, db):
+    """
+    Apply the SQLITE_* pragmas to every new connection of each SQLite engine
+    """
+    pragmas = sqlite_pragmas(app.config)
+    if not pragmas:
+        return
+
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite' and not event.contains(engine, 'connect', apply_pragmas):
+                event.listen(engine, 'connect', apply_pragmas)
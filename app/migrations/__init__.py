@@ -0,0 +1,107 @@
+"""
+Versioned schema migrations.
+
+Each module in app/migrations/versions defines `revision`, `down_revision`,
+a one-line `description` and `upgrade(conn)` / `downgrade(conn)` functions
+taking a SQLAlchemy connection. Revisions form a single linear chain; the
+applied revision is stored in the schema_version table. Run them with
+`flask db-upgrade` / `flask db-downgrade`.
+"""
+import importlib
+import pkgutil
+
+from sqlalchemy import text
+
+VERSIONS_PACKAGE = 'app.migrations.versions'
+
+
+def load_migrations():
+    """
+    All migration modules in chain order (oldest first)
+    """
+    package = importlib.import_module(VERSIONS_PACKAGE)
+    modules = [importlib.import_module(f'{VERSIONS_PACKAGE}.{info.name}')
+               for info in pkgutil.iter_modules(package.__path__)]
+    by_down = {m.down_revision: m for m in modules}
+    if len(by_down) != len(modules):
+        raise RuntimeError('Migration chain has branches (two migrations share a down_revision)')
+
+    chain = []
+    revision = None
+    while revision in by_down:
+        migration = by_down[revision]
+        chain.append(migration)
+        revision = migration.revision
+    if len(chain) != len(modules):
+        raise RuntimeError('Migration chain is broken (unreachable migrations)')
+    return chain
+
+
+def head_revision():
+    chain = load_migrations()
+    return chain[-1].revision if chain else None
+
+
+def _ensure_version_table(conn):
+    conn.execute(text('CREATE TABLE IF NOT EXISTS schema_version (version VARCHAR(32))'))
+
+
+def current_revision(conn):
+    _ensure_version_table(conn)
+    return conn.execute(text('SELECT version FROM schema_version')).scalar()
+
+
+def _set_revision(conn, revision):
+    conn.execute(text('DELETE FROM schema_version'))
+    if revision is not None:
+        conn.execute(text('INSERT INTO schema_version (version) VALUES (:v)'), {'v': revision})
+
+
+def upgrade(engine, target=None, echo=print):
+    """
+    Apply pending migrations up to `target` (default: head), each in its own transaction
+    """
+    chain = load_migrations()
+    with engine.begin() as conn:
+        current = current_revision(conn)
+    revisions = [m.revision for m in chain]
+    start = revisions.index(current) + 1 if current else 0
+    end = revisions.index(target) + 1 if target else len(chain)
+
+    for migration in chain[start:end]:
+        with engine.begin() as conn:
+            echo(f'Upgrading {current or "base"} -> {migration.revision}: {migration.description}')
+            migration.upgrade(conn)
+            _set_revision(conn, migration.revision)
+        current = migration.revision
+    return current
+
+
+def downgrade(engine, target=None, echo=print):
+    """
+    Revert migrations down to `target` (None reverts everything)
+    """
+    chain = load_migrations()
+    with engine.begin() as conn:
+        current = current_revision(conn)
+    revisions = [m.revision for m in chain]
+    if current is None:
+        return None
+    stop = revisions.index(target) + 1 if target else 0
+
+    for migration in reversed(chain[stop:revisions.index(current) + 1]):
+        with engine.begin() as conn:
+            echo(f'Downgrading {migration.revision} -> {migration.down_revision or "base"}')
+            migration.downgrade(conn)
+            _set_revision(conn, migration.down_revision)
+        current = migration.down_revision
+    return current
+
+
+def create_index(conn, name, table, columns):
+    quoted = ', '.join(columns)
+    conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({quoted})'))
+
+
+def drop_index(conn, name):
+    conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
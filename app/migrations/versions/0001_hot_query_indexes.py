@@ -0,0 +1,35 @@
+from app.migrations import create_index, drop_index
+
+revision = '0001'
+down_revision = None
+description = 'Indexes for the hot listing, history and job-claim queries'
+
+# (name, table, columns). Staff.user_id, Student.user_id and
+# BehaviouralPoints.student_id are already covered by their UNIQUE constraints.
+INDEXES = [
+    # A student's history, newest first (QR page, filters by student_id)
+    ('ix_disciplinary_record_student_created', 'disciplinary_record', ['student_id', 'created_at']),
+    # Offence filter with date range
+    ('ix_disciplinary_record_offence_created', 'disciplinary_record', ['offence_id', 'created_at']),
+    # Records entered by a staff member
+    ('ix_disciplinary_record_recorded_by', 'disciplinary_record', ['recorded_by']),
+    # Date-range reports across all students
+    ('ix_disciplinary_record_created_at', 'disciplinary_record', ['created_at']),
+    # Department / class filters on student listings and record joins
+    ('ix_student_department_class', 'student', ['department', 'student_class']),
+    ('ix_staff_department', 'staff', ['department']),
+    # Job workers claim by status and due time
+    ('ix_job_status_run_after', 'job', ['status', 'run_after']),
+]
+
+
+def upgrade(conn):
+    drop_index(conn, 'ix_job_status')
+    for name, table, columns in INDEXES:
+        create_index(conn, name, table, columns)
+
+
+def downgrade(conn):
+    for name, _, _ in INDEXES:
+        drop_index(conn, name)
+    create_index(conn, 'ix_job_status', 'job', ['status'])
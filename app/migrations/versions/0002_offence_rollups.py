@@ -0,0 +1,27 @@
+from app.migrations import create_index, drop_index
+
+revision = '0002'
+down_revision = '0001'
+description = 'Offence analytics rollup table and points leaderboard index'
+
+
+def upgrade(conn):
+    from app.models import OffenceRollup
+    OffenceRollup.__table__.create(conn, checkfirst=True)
+    create_index(conn, 'ix_behavioural_points_total_points', 'behavioural_points', ['total_points'])
+
+    # Backfill from existing history
+    conn.exec_driver_sql('DELETE FROM offence_rollup')
+    conn.exec_driver_sql(
+        'INSERT INTO offence_rollup (day, department, student_class, offence_id, offence_count, points_total) '
+        'SELECT date(r.created_at), s.department, s.student_class, r.offence_id, count(*), sum(o.deduct_points) '
+        'FROM disciplinary_record r '
+        'JOIN student s ON s.student_id = r.student_id '
+        'JOIN offence_type o ON o.offence_id = r.offence_id '
+        'GROUP BY date(r.created_at), s.department, s.student_class, r.offence_id'
+    )
+
+
+def downgrade(conn):
+    drop_index(conn, 'ix_behavioural_points_total_points')
+    conn.exec_driver_sql('DROP TABLE IF EXISTS offence_rollup')
@@ -0,0 +1,12 @@
+revision = '0003'
+down_revision = '0002'
+description = 'Version stamp for the offence type / role cache'
+
+
+def upgrade(conn):
+    from app.models import RefDataVersion
+    RefDataVersion.__table__.create(conn, checkfirst=True)
+
+
+def downgrade(conn):
+    conn.exec_driver_sql('DROP TABLE IF EXISTS ref_data_version')
@@ -0,0 +1,19 @@
+revision = '0004'
+down_revision = '0003'
+description = 'Append-only points ledger and balance snapshots'
+
+
+def upgrade(conn):
+    from app.models import PointsLedger, PointsSnapshot
+    from app.utils.ledger import backfill_ledger
+    PointsLedger.__table__.create(conn, checkfirst=True)
+    PointsSnapshot.__table__.create(conn, checkfirst=True)
+
+    # Existing records become deductions; differences from the current
+    # balances become one opening adjustment per student
+    backfill_ledger(conn)
+
+
+def downgrade(conn):
+    conn.exec_driver_sql('DROP TABLE IF EXISTS points_snapshot')
+    conn.exec_driver_sql('DROP TABLE IF EXISTS points_ledger')
@@ -0,0 +1,12 @@
+revision = '0005'
+down_revision = '0004'
+description = 'Revocation list for signed student QR tokens'
+
+
+def upgrade(conn):
+    from app.models import RevokedQRToken
+    RevokedQRToken.__table__.create(conn, checkfirst=True)
+
+
+def downgrade(conn):
+    conn.exec_driver_sql('DROP TABLE IF EXISTS revoked_qr_token')
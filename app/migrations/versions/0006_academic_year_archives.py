@@ -0,0 +1,22 @@
+revision = '0006'
+down_revision = '0005'
+description = 'Registry of archived academic years'
+
+
+def upgrade(conn):
+    from sqlalchemy import inspect
+    from app.models import ArchivedYear
+    ArchivedYear.__table__.create(conn, checkfirst=True)
+
+    # Ledger entries keep the record_id of records moved to an archive table.
+    # SQLite does not enforce the old constraint; elsewhere it has to go.
+    if conn.dialect.name != 'sqlite':
+        for fk in inspect(conn).get_foreign_keys('points_ledger'):
+            if fk['referred_table'] == 'disciplinary_record' and fk.get('name'):
+                conn.exec_driver_sql(f'ALTER TABLE points_ledger DROP CONSTRAINT {fk["name"]}')
+
+
+def downgrade(conn):
+    # Archive tables (disciplinary_record_<year>) are left in place; the
+    # ledger foreign key is not restored since its records may have moved
+    conn.exec_driver_sql('DROP TABLE IF EXISTS archived_year')
@@ -0,0 +1,24 @@
+revision = '0007'
+down_revision = '0006'
+description = 'At most one reversal ledger entry per disciplinary record'
+
+
+def upgrade(conn):
+    from sqlalchemy import text
+    from app.models import PointsLedger
+
+    duplicates = conn.execute(text(
+        "SELECT record_id FROM points_ledger WHERE entry_type = 'reversal' "
+        "GROUP BY record_id HAVING count(*) > 1"
+    )).scalars().all()
+    if duplicates:
+        # The ledger is append-only, so this is not fixed up automatically
+        raise RuntimeError(f'Records reversed more than once: {duplicates[:20]}; add compensating '
+                           f'adjustments and remove the extra reversals before upgrading')
+
+    index = next(i for i in PointsLedger.__table__.indexes if i.name == 'uq_points_ledger_reversal')
+    index.create(conn, checkfirst=True)
+
+
+def downgrade(conn):
+    conn.exec_driver_sql('DROP INDEX IF EXISTS uq_points_ledger_reversal')
@@ -0,0 +1,13 @@
+revision = '0008'
+down_revision = '0007'
+description = "Store the issue day of each student's QR card"
+
+
+def upgrade(conn):
+    from sqlalchemy import inspect
+    if 'qr_issued_on' not in {column['name'] for column in inspect(conn).get_columns('student')}:
+        conn.exec_driver_sql('ALTER TABLE student ADD COLUMN qr_issued_on DATE')
+
+
+def downgrade(conn):
+    conn.exec_driver_sql('ALTER TABLE student DROP COLUMN qr_issued_on')
@@ -0,0 +1,17 @@
+revision = '0009'
+down_revision = '0008'
+description = 'Precomputed student counts per points band for the analytics distribution'
+
+
+def upgrade(conn):
+    from app.models import PointsBandCount
+    from app.utils.analytics import BAND_KEY, point_bands_source
+    PointsBandCount.__table__.create(conn, checkfirst=True)
+
+    # Backfill from the current balances
+    conn.execute(PointsBandCount.__table__.delete())
+    conn.execute(PointsBandCount.__table__.insert().from_select(BAND_KEY + ['student_count'], point_bands_source()))
+
+
+def downgrade(conn):
+    conn.exec_driver_sql('DROP TABLE IF EXISTS points_band_count')
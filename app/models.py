@@ -1,13 +1,15 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin
-db = SQLAlchemy()
+from app.db_engine import RoutingSession
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 
 
-# User loader function
+# User loader function: a cached identity (user + role + profile, one query)
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    from app.utils.identity import get_identity
+    return get_identity(int(user_id))
 
 # User unification Model - ADD UserMixin
 class User(UserMixin, db.Model):
@@ -42,6 +44,12 @@ class Student(db.Model):
     student_class = db.Column(db.String(20), nullable=False)
     parent_name = db.Column(db.String(20), nullable=False)
     parent_contact = db.Column(db.String(10), nullable=False)
+    # Issue day signed into the student's current QR card (app/utils/qr_tokens.py)
+    qr_issued_on = db.Column(db.Date, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_student_department_class', 'department', 'student_class'),
+    )
     
     # Relationship to behavioural points
     behavioural_points = db.relationship('BehaviouralPoints', backref='student', uselist=False)
@@ -56,6 +64,10 @@ class Staff(db.Model):
     position = db.Column(db.String(50), nullable=False)
     department = db.Column(db.String(50), nullable=False)
     
+    __table_args__ = (
+        db.Index('ix_staff_department', 'department'),
+    )
+    
     def __repr__(self) -> str:
         return f"Staff: {self.staff_empid}"
     
@@ -81,6 +93,16 @@ class DisciplinaryRecord(db.Model):
     
     # Relationship to offence type
     offence_type = db.relationship('OffenceType', backref='disciplinary_records')
+    student = db.relationship('Student', backref='disciplinary_records')
+    recorder = db.relationship('Staff', backref='recorded_offences')
+    
+    # Keep in sync with app/migrations/versions/0001_hot_query_indexes.py
+    __table_args__ = (
+        db.Index('ix_disciplinary_record_student_created', 'student_id', 'created_at'),
+        db.Index('ix_disciplinary_record_offence_created', 'offence_id', 'created_at'),
+        db.Index('ix_disciplinary_record_recorded_by', 'recorded_by'),
+        db.Index('ix_disciplinary_record_created_at', 'created_at'),
+    )
     
     def __repr__(self) -> str:
         return f"Student ID: {self.student_id}, Offence ID: {self.offence_id}"
@@ -92,18 +114,146 @@ class BehaviouralPoints(db.Model):
     offence_count = db.Column(db.Integer, nullable=False, default=0)
     last_updated = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
     
+    # "Lowest points" leaderboard reads this index in order instead of sorting
+    __table_args__ = (
+        db.Index('ix_behavioural_points_total_points', 'total_points'),
+    )
+    
+    @classmethod
+    def apply_deduction(cls, student_id, points, offences=1):
+        """
+        Atomically deduct points for a student with a single UPDATE, so
+        concurrent deductions cannot overwrite each other (the points band
+        counts move in the same transaction).
+        Returns False if the student has no points row.
+        """
+        from app.utils.analytics import move_point_bands
+        result = db.session.execute(
+            db.update(cls)
+            .where(cls.student_id == student_id)
+            .values(total_points=cls.total_points - points,
+                    offence_count=cls.offence_count + offences)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount and points:
+            move_point_bands([student_id], deducted=points)
+        return result.rowcount > 0
+    
+    @classmethod
+    def apply_deductions(cls, student_ids, points, offences=1):
+        """
+        Set-based apply_deduction: one UPDATE ... WHERE student_id IN (...)
+        for many students. Returns the number of points rows updated.
+        """
+        from app.utils.analytics import move_point_bands
+        student_ids = list(student_ids)
+        result = db.session.execute(
+            db.update(cls)
+            .where(cls.student_id.in_(student_ids))
+            .values(total_points=cls.total_points - points,
+                    offence_count=cls.offence_count + offences)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount and points:
+            move_point_bands(student_ids, deducted=points)
+        return result.rowcount
+    
     def deduct_points(self, offence_id):
-        offence = OffenceType.query.get(offence_id)
-        if offence:
-            self.total_points -= offence.deduct_points
-            self.offence_count += 1
-            self.last_updated = db.func.now()
+        from app.utils.events import mark_points_changed
+        from app.utils.refdata import get_offence_points
+        points = get_offence_points(offence_id)
+        if points is not None and BehaviouralPoints.apply_deduction(self.student_id, points):
+            db.session.add(PointsLedger(student_id=self.student_id, entry_type='deduction',
+                                        points_delta=-points, offence_delta=1))
+            mark_points_changed()
+            # Reload the new totals on next access
+            db.session.expire(self, ['total_points', 'offence_count', 'last_updated'])
             return True
         return False
     
     def __repr__(self) -> str:
         return f"Student ID: {self.student_id}, Points: {self.total_points}"
 
+# Append-only points ledger: every change to a student's points is one entry
+# (deductions reference their disciplinary record). Balance = 100 + sum(points_delta).
+class PointsLedger(db.Model):
+    entry_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.student_id'), nullable=False)
+    # Not a foreign key: records of closed academic years move to archive tables
+    record_id = db.Column(db.Integer, nullable=True)
+    entry_type = db.Column(db.String(20), nullable=False)  # deduction, reversal, adjustment
+    points_delta = db.Column(db.Integer, nullable=False)
+    offence_delta = db.Column(db.Integer, nullable=False, default=0)
+    reason = db.Column(db.String(255), nullable=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('staff.staff_id'), nullable=True)
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    
+    __table_args__ = (
+        db.Index('ix_points_ledger_student_entry', 'student_id', 'entry_id'),
+        db.Index('ix_points_ledger_record', 'record_id'),
+        # A record can be reversed once, even by concurrent requests
+        # (keep in sync with app/migrations/versions/0007_unique_reversal.py)
+        db.Index('uq_points_ledger_reversal', 'record_id', unique=True,
+                 sqlite_where=db.text("entry_type = 'reversal'"),
+                 postgresql_where=db.text("entry_type = 'reversal'")),
+    )
+    
+    def __repr__(self) -> str:
+        return f"Ledger {self.entry_id}: student {self.student_id} {self.entry_type} {self.points_delta:+d}"
+
+# Periodic balance snapshots: a student's totals after every ledger entry up
+# to as_of_entry_id; as_of is the latest created_at among those entries
+class PointsSnapshot(db.Model):
+    snapshot_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.student_id'), nullable=False)
+    as_of_entry_id = db.Column(db.Integer, nullable=False)
+    as_of = db.Column(db.DateTime, nullable=False)
+    total_points = db.Column(db.Integer, nullable=False)
+    offence_count = db.Column(db.Integer, nullable=False)
+    taken_at = db.Column(db.DateTime, server_default=db.func.now())
+    
+    __table_args__ = (
+        db.Index('ix_points_snapshot_student_as_of', 'student_id', 'as_of'),
+        db.Index('ix_points_snapshot_as_of_entry', 'as_of_entry_id'),
+    )
+    
+    def __repr__(self) -> str:
+        return f"Snapshot {self.snapshot_id}: student {self.student_id} = {self.total_points} as of {self.as_of}"
+
+# Analytics rollup: one row per day x department x class x offence,
+# maintained incrementally by record_offence (see app/utils/analytics.py)
+class OffenceRollup(db.Model):
+    rollup_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    day = db.Column(db.Date, nullable=False)
+    department = db.Column(db.String(50), nullable=False)
+    student_class = db.Column(db.String(20), nullable=False)
+    offence_id = db.Column(db.Integer, db.ForeignKey('offence_type.offence_id'), nullable=False)
+    offence_count = db.Column(db.Integer, nullable=False, default=0)
+    points_total = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('day', 'department', 'student_class', 'offence_id', name='uq_offence_rollup_key'),
+    )
+    
+    def __repr__(self) -> str:
+        return f"Rollup {self.day} {self.department}/{self.student_class} offence {self.offence_id}: {self.offence_count}"
+
+# Students per current-points band and department/class, kept in step with
+# behavioural_points by apply_deduction(s) so the distribution is a small read
+class PointsBandCount(db.Model):
+    band_count_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    department = db.Column(db.String(50), nullable=False)
+    student_class = db.Column(db.String(20), nullable=False)
+    band = db.Column(db.String(10), nullable=False)  # analytics.POINT_BANDS label
+    student_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('department', 'student_class', 'band', name='uq_points_band_count_key'),
+    )
+    
+    def __repr__(self) -> str:
+        return f"Band {self.band} {self.department}/{self.student_class}: {self.student_count}"
+
 # Role Management Model
 class Role(db.Model):
     role_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -112,4 +262,60 @@ class Role(db.Model):
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     
     def __repr__(self) -> str:
-        return f"Role: {self.role_name}"
\ No newline at end of file
+        return f"Role: {self.role_name}"
+
+# Version stamp for the cached reference data (offence types, roles); bumped
+# in the same transaction as any write to them (see app/utils/refdata.py)
+class RefDataVersion(db.Model):
+    name = db.Column(db.String(30), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self) -> str:
+        return f"RefDataVersion {self.name}: {self.version}"
+
+# Revoked student QR tokens: tokens issued before not_before are rejected.
+# Verifiers keep the whole table in memory (see app/utils/qr_tokens.py).
+class RevokedQRToken(db.Model):
+    student_id = db.Column(db.Integer, db.ForeignKey('student.student_id'), primary_key=True)
+    not_before = db.Column(db.Date, nullable=False)
+    reason = db.Column(db.String(255), nullable=True)
+    revoked_by = db.Column(db.Integer, db.ForeignKey('staff.staff_id'), nullable=True)
+    revoked_at = db.Column(db.DateTime, server_default=db.func.now())
+    
+    def __repr__(self) -> str:
+        return f"Revoked QR: student {self.student_id} before {self.not_before}"
+
+# Closed academic years whose disciplinary records were moved out of
+# disciplinary_record into their own table (see app/utils/archive.py)
+class ArchivedYear(db.Model):
+    year = db.Column(db.Integer, primary_key=True)  # calendar year the academic year starts in
+    table_name = db.Column(db.String(64), unique=True, nullable=False)
+    starts_at = db.Column(db.DateTime, nullable=False)
+    ends_at = db.Column(db.DateTime, nullable=False)  # exclusive
+    record_count = db.Column(db.Integer, nullable=False, default=0)
+    points_policy = db.Column(db.String(10), nullable=False)  # reset, carry
+    archived_at = db.Column(db.DateTime, server_default=db.func.now())
+    
+    def __repr__(self) -> str:
+        return f"Archived year {self.year}: {self.record_count} records in {self.table_name}"
+
+# Background job queue (persistent, in the application database)
+class Job(db.Model):
+    job_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(10), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.Float, nullable=False, default=0)  # epoch seconds
+    locked_at = db.Column(db.Float, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+    )
+    
+    def __repr__(self) -> str:
+        return f"Job {self.job_id}: {self.name} ({self.status})"
@@ -0,0 +1,306 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, case, func, literal, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import aliased
+
+from app.models import db, Student, User, OffenceType, BehaviouralPoints, OffenceRollup, PointsBandCount, PointsLedger
+from app.utils.archive import records_source
+
+ROLLUP_KEY = ['day', 'department', 'student_class', 'offence_id']
+BAND_KEY = ['department', 'student_class', 'band']
+# (label, low inclusive, high exclusive) bands for the points distribution
+POINT_BANDS = [('<0', None, 0), ('0-39', 0, 40), ('40-59', 40, 60), ('60-79', 60, 80),
+               ('80-99', 80, 100), ('100+', 100, None)]
+
+
+def _accumulate(source, model=OffenceRollup, key=ROLLUP_KEY, totals=('offence_count', 'points_total')):
+    # Add the (key..., totals...) rows of `source` onto existing `model` rows:
+    # one ON CONFLICT upsert where the backend has it, select-then-update/insert
+    # elsewhere
+    columns = list(key) + list(totals)
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        statement = (postgresql if dialect == 'postgresql' else sqlite).insert(model)
+        statement = statement.from_select(columns, source)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=key,
+            set_={total: getattr(model, total) + getattr(statement.excluded, total) for total in totals}
+        ))
+        return
+
+    for row in db.session.execute(source).all():
+        values = dict(zip(columns, row))
+        updated = db.session.execute(
+            db.update(model)
+            .where(*[getattr(model, name) == values[name] for name in key])
+            .values(**{total: getattr(model, total) + values[total] for total in totals})
+        )
+        if not updated.rowcount:
+            db.session.execute(db.insert(model).values(**values))
+
+
+def record_rollup(student_ids, offence_id, points, day=None, direction=1):
+    """
+    Add offences to today's rollup rows in one INSERT ... SELECT ... ON CONFLICT
+    statement (select-then-update/insert on other backends), taking
+    department/class from the students. Runs inside the caller's transaction
+    so it commits (or rolls back) with the records.
+    direction=-1 takes reversed offences back out of `day`'s rows.
+    """
+    if isinstance(student_ids, (int, str)):
+        student_ids = [student_ids]
+    # created_at uses the database clock (UTC on SQLite); bucket days the same way
+    day = day or datetime.now(timezone.utc).date()
+
+    source = select(
+        literal(day, OffenceRollup.day.type),
+        Student.department,
+        Student.student_class,
+        literal(int(offence_id)),
+        func.count() * int(direction),
+        func.count() * int(points) * int(direction)
+    ).where(Student.student_id.in_([int(s) for s in student_ids])) \
+     .group_by(Student.department, Student.student_class)
+
+    _accumulate(source)
+
+
+def rebuild_rollups(date_from=None, date_to=None):
+    """
+    Recompute rollups from disciplinary history, archived years included
+    (optionally for a day range, inclusive). Reversed records are left out
+    and points come from each record's ledger deduction (the offence's
+    current points only for records that predate the ledger), matching what
+    record_offence and reverse_record maintain. Returns the number of
+    rollup rows written.
+    """
+    records = records_source(
+        datetime.combine(date_from, datetime.min.time()) if date_from else None,
+        datetime.combine(date_to + timedelta(days=1), datetime.min.time()) if date_to else None,
+        columns=('record_id', 'student_id', 'offence_id', 'created_at')
+    )
+    deduction = aliased(PointsLedger, name='deduction')
+    reversed_record = select(PointsLedger.entry_id).where(
+        PointsLedger.record_id == records.c.record_id, PointsLedger.entry_type == 'reversal'
+    ).exists()
+    delete = db.delete(OffenceRollup)
+    day = func.date(records.c.created_at)
+    source = select(
+        day,
+        Student.department,
+        Student.student_class,
+        records.c.offence_id,
+        func.count(),
+        func.sum(func.coalesce(-deduction.points_delta, OffenceType.deduct_points))
+    ).select_from(records) \
+     .join(Student, Student.student_id == records.c.student_id) \
+     .join(OffenceType, OffenceType.offence_id == records.c.offence_id) \
+     .outerjoin(deduction, and_(deduction.record_id == records.c.record_id, deduction.entry_type == 'deduction')) \
+     .where(~reversed_record)
+
+    if date_from:
+        delete = delete.where(OffenceRollup.day >= date_from)
+        source = source.where(day >= date_from.isoformat())
+    if date_to:
+        delete = delete.where(OffenceRollup.day <= date_to)
+        source = source.where(day <= date_to.isoformat())
+
+    source = source.group_by(day, Student.department, Student.student_class, records.c.offence_id)
+
+    db.session.execute(delete)
+    db.session.execute(
+        db.insert(OffenceRollup).from_select(ROLLUP_KEY + ['offence_count', 'points_total'], source)
+    )
+    count = db.session.query(func.count(OffenceRollup.rollup_id))
+    if date_from:
+        count = count.filter(OffenceRollup.day >= date_from)
+    if date_to:
+        count = count.filter(OffenceRollup.day <= date_to)
+    written = count.scalar()
+    db.session.commit()
+    return written
+
+
+def _filtered(query, date_from=None, date_to=None, department=None, student_class=None):
+    if date_from:
+        query = query.filter(OffenceRollup.day >= date_from)
+    if date_to:
+        query = query.filter(OffenceRollup.day <= date_to)
+    if department:
+        query = query.filter(OffenceRollup.department == department)
+    if student_class:
+        query = query.filter(OffenceRollup.student_class == student_class)
+    return query
+
+
+def class_summary(**filters):
+    """
+    Offence counts and points deducted per department/class
+    """
+    query = db.session.query(
+        OffenceRollup.department,
+        OffenceRollup.student_class,
+        func.sum(OffenceRollup.offence_count),
+        func.sum(OffenceRollup.points_total)
+    )
+    query = _filtered(query, **filters).group_by(OffenceRollup.department, OffenceRollup.student_class) \
+        .order_by(OffenceRollup.department, OffenceRollup.student_class)
+    return [{
+        'department': department,
+        'student_class': student_class,
+        'offence_count': int(count),
+        'points_deducted': int(points)
+    } for department, student_class, count, points in query]
+
+
+def top_offences(limit=10, **filters):
+    """
+    Most frequent offence types
+    """
+    count = func.sum(OffenceRollup.offence_count)
+    query = db.session.query(
+        OffenceRollup.offence_id,
+        OffenceType.offence_name,
+        count,
+        func.sum(OffenceRollup.points_total)
+    ).join(OffenceType, OffenceType.offence_id == OffenceRollup.offence_id)
+    query = _filtered(query, **filters).group_by(OffenceRollup.offence_id, OffenceType.offence_name) \
+        .order_by(count.desc()).limit(limit)
+    return [{
+        'offence_id': offence_id,
+        'offence_name': offence_name,
+        'offence_count': int(total),
+        'points_deducted': int(points)
+    } for offence_id, offence_name, total, points in query]
+
+
+def monthly_trends(**filters):
+    """
+    Offence counts and points per month (days are folded into months here
+    so the query stays portable across backends)
+    """
+    query = db.session.query(
+        OffenceRollup.day,
+        func.sum(OffenceRollup.offence_count),
+        func.sum(OffenceRollup.points_total)
+    )
+    query = _filtered(query, **filters).group_by(OffenceRollup.day).order_by(OffenceRollup.day)
+
+    months = OrderedDict()
+    for day, count, points in query:
+        month = months.setdefault(day.strftime('%Y-%m'), {'offence_count': 0, 'points_deducted': 0})
+        month['offence_count'] += int(count)
+        month['points_deducted'] += int(points)
+    return [{'month': month, **totals} for month, totals in months.items()]
+
+
+def _band(points):
+    # CASE expression mapping a points value onto its POINT_BANDS label
+    whens = []
+    for label, low, high in POINT_BANDS:
+        conditions = []
+        if low is not None:
+            conditions.append(points >= low)
+        if high is not None:
+            conditions.append(points < high)
+        whens.append((and_(*conditions), label))
+    return case(*whens)
+
+
+def point_bands_source():
+    """
+    (department, student_class, band, students) for every student, counted
+    from behavioural_points; what points_band_count holds
+    """
+    band = _band(BehaviouralPoints.total_points)
+    return select(Student.department, Student.student_class, band, func.count()) \
+        .select_from(BehaviouralPoints) \
+        .join(Student, Student.student_id == BehaviouralPoints.student_id) \
+        .group_by(Student.department, Student.student_class, band)
+
+
+def move_point_bands(student_ids, deducted=None):
+    """
+    Keep points_band_count in step after the behavioural_points rows of
+    `student_ids` were written in the current transaction: each student is
+    counted in the band of their new total and, when `deducted` is given,
+    taken out of the band of their previous one (new total + deducted).
+    deducted=None counts newly created students. Students whose band did not
+    change cost nothing beyond the one INSERT ... SELECT statement.
+    """
+    if isinstance(student_ids, (int, str)):
+        student_ids = [student_ids]
+    student_ids = [int(s) for s in student_ids]
+
+    def counted(points, delta):
+        return select(Student.department, Student.student_class, _band(points).label('band'),
+                      literal(delta).label('delta')) \
+            .select_from(BehaviouralPoints) \
+            .join(Student, Student.student_id == BehaviouralPoints.student_id) \
+            .where(BehaviouralPoints.student_id.in_(student_ids))
+
+    parts = [counted(BehaviouralPoints.total_points, 1)]
+    if deducted is not None:
+        parts.append(counted(BehaviouralPoints.total_points + int(deducted), -1))
+    moves = union_all(*parts).subquery('moves')
+    net = func.sum(moves.c.delta)
+    # Ordered so concurrent writers take the count rows' locks in the same order
+    source = select(moves.c.department, moves.c.student_class, moves.c.band, net) \
+        .group_by(moves.c.department, moves.c.student_class, moves.c.band) \
+        .having(net != 0) \
+        .order_by(moves.c.department, moves.c.student_class, moves.c.band)
+    _accumulate(source, PointsBandCount, BAND_KEY, ('student_count',))
+
+
+def rebuild_point_bands():
+    """
+    Recompute points_band_count from behavioural_points, inside the caller's
+    transaction; for bulk writes that bypass move_point_bands (seeding,
+    archive resets, reconciliation)
+    """
+    db.session.execute(db.delete(PointsBandCount))
+    db.session.execute(
+        db.insert(PointsBandCount).from_select(BAND_KEY + ['student_count'], point_bands_source())
+    )
+
+
+def points_distribution(department=None, student_class=None):
+    """
+    Number of students per current-points band, per department/class, read
+    from points_band_count rather than scanning behavioural_points
+    """
+    query = db.session.query(PointsBandCount.department, PointsBandCount.student_class,
+                             PointsBandCount.band, PointsBandCount.student_count) \
+        .filter(PointsBandCount.student_count > 0)
+    if department:
+        query = query.filter(PointsBandCount.department == department)
+    if student_class:
+        query = query.filter(PointsBandCount.student_class == student_class)
+
+    distribution = OrderedDict()
+    for dept, cls, band, count in query.order_by(PointsBandCount.department, PointsBandCount.student_class):
+        entry = distribution.setdefault((dept, cls), {'department': dept, 'student_class': cls, 'bands': {}})
+        entry['bands'][band] = count
+    return list(distribution.values())
+
+
+def lowest_points(limit=10, department=None, student_class=None):
+    """
+    Students with the fewest points, read in index order
+    (ix_behavioural_points_total_points) rather than sorting every row
+    """
+    query = db.session.query(
+        Student.student_id, Student.register_number, User.full_name,
+        Student.department, Student.student_class,
+        BehaviouralPoints.total_points, BehaviouralPoints.offence_count
+    ).select_from(BehaviouralPoints) \
+     .join(Student, Student.student_id == BehaviouralPoints.student_id) \
+     .join(User, User.user_id == Student.user_id)
+    if department:
+        query = query.filter(Student.department == department)
+    if student_class:
+        query = query.filter(Student.student_class == student_class)
+    query = query.order_by(BehaviouralPoints.total_points, BehaviouralPoints.bpoints_id).limit(limit)
+    return [row._asdict() for row in query]
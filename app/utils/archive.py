@@ -0,0 +1,357 @@
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+from itertools import islice
+
+from flask import current_app
+from sqlalchemy import Column, Index, MetaData, Table, and_, func, or_, select, union_all
+
+from app.models import db, User, Student, OffenceType, BehaviouralPoints, DisciplinaryRecord, PointsLedger, ArchivedYear, RefDataVersion
+from app.db_engine import use_replica
+from app.utils.events import mark_points_changed
+from app.utils.pagination import decode_cursor, encode_cursor, get_page_size
+from app.utils.refdata import bump_reference_version
+
+# Closed academic years are moved out of disciplinary_record into one table
+# per year (disciplinary_record_<year>, same columns), so the live table only
+# holds the open year and everyday queries cost the same in year ten as in
+# year one. archived_year lists the archives; each process caches that list
+# and compares its version stamp at most every check_interval seconds.
+# query_records reads the live table plus, only when the requested date
+# range reaches them, the archives - in parallel - and merges the pages.
+ARCHIVES_KEY = 'archives'
+POINTS_POLICIES = ('reset', 'carry')
+RECORD_COLUMNS = ('record_id', 'student_id', 'offence_id', 'description', 'action_taken', 'recorded_by', 'created_at')
+
+_settings = {'start_month': 6, 'workers': 4}
+_lock = threading.Lock()
+_state = {
+    'loaded': False,
+    'version': None,
+    'checked_at': 0.0,
+    'check_interval': 30.0,
+    'years': [],  # dicts, oldest first
+}
+_archive_metadata = MetaData()
+_pool = {'executor': None}
+
+
+def init_archives(app):
+    _settings['start_month'] = app.config.get('ACADEMIC_YEAR_START_MONTH', _settings['start_month'])
+    _settings['workers'] = app.config.get('ARCHIVE_QUERY_WORKERS', _settings['workers'])
+    _state['check_interval'] = app.config.get('ARCHIVE_CHECK_INTERVAL', _state['check_interval'])
+
+
+# Academic years
+def academic_year_of(moment):
+    """
+    The academic year (the calendar year it starts in) a date falls in
+    """
+    return moment.year if moment.month >= _settings['start_month'] else moment.year - 1
+
+
+def academic_year_bounds(year):
+    """
+    [start, end) of an academic year as datetimes
+    """
+    month = _settings['start_month']
+    return datetime(year, month, 1), datetime(year + 1, month, 1)
+
+
+def year_label(year):
+    return str(year) if _settings['start_month'] == 1 else f'{year}/{(year + 1) % 100:02d}'
+
+
+def archive_table(year):
+    """
+    The Table for a year's archive (created in the database by archive_year)
+    """
+    name = f'disciplinary_record_{int(year)}'
+    with _lock:
+        table = _archive_metadata.tables.get(name)
+        if table is None:
+            columns = [Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable, autoincrement=False)
+                       for c in DisciplinaryRecord.__table__.columns]
+            table = Table(
+                name, _archive_metadata, *columns,
+                Index(f'ix_{name}_student_created', 'student_id', 'created_at'),
+                Index(f'ix_{name}_created_at', 'created_at'),
+            )
+    return table
+
+
+# Registry of archived years
+def _stored_version():
+    return db.session.query(RefDataVersion.version).filter(RefDataVersion.name == ARCHIVES_KEY).scalar() or 0
+
+
+def load_archives():
+    """
+    (Re)load the list of archived years with the current version stamp
+    """
+    version = _stored_version()
+    years = [{
+        'year': a.year,
+        'label': year_label(a.year),
+        'table_name': a.table_name,
+        'starts_at': a.starts_at,
+        'ends_at': a.ends_at,
+        'record_count': a.record_count,
+        'points_policy': a.points_policy,
+        'archived_at': a.archived_at
+    } for a in db.session.query(ArchivedYear).order_by(ArchivedYear.year)]
+
+    with _lock:
+        _state['years'] = years
+        _state['version'] = version
+        _state['checked_at'] = time.monotonic()
+        _state['loaded'] = True
+
+
+def _ensure_current():
+    if not _state['loaded']:
+        load_archives()
+        return
+    if time.monotonic() - _state['checked_at'] < _state['check_interval']:
+        return
+    if _stored_version() != _state['version']:
+        load_archives()
+    else:
+        _state['checked_at'] = time.monotonic()
+
+
+def invalidate_archives():
+    """
+    Force a reload on next access in this process
+    """
+    with _lock:
+        _state['loaded'] = False
+
+
+def list_archives():
+    _ensure_current()
+    return _state['years']
+
+
+def archives_for_range(date_from=None, date_to=None):
+    """
+    Archived years overlapping [date_from, date_to); a missing bound is open
+    """
+    return [a for a in list_archives()
+            if (date_to is None or a['starts_at'] < date_to) and (date_from is None or a['ends_at'] > date_from)]
+
+
+# Reads
+def _records_select(table, filters, before_id, limit):
+    offences = OffenceType.__table__
+    statement = select(*(table.c[name] for name in RECORD_COLUMNS), offences.c.offence_name) \
+        .join(offences, offences.c.offence_id == table.c.offence_id)
+
+    if filters.get('student_id'):
+        statement = statement.where(table.c.student_id == filters['student_id'])
+    if filters.get('offence_id'):
+        statement = statement.where(table.c.offence_id == filters['offence_id'])
+    if filters.get('date_from'):
+        statement = statement.where(table.c.created_at >= filters['date_from'])
+    if filters.get('date_to'):
+        statement = statement.where(table.c.created_at < filters['date_to'])
+    if filters.get('department') or filters.get('student_class'):
+        students = Student.__table__
+        statement = statement.join(students, students.c.student_id == table.c.student_id)
+        if filters.get('department'):
+            statement = statement.where(students.c.department == filters['department'])
+        if filters.get('student_class'):
+            statement = statement.where(students.c.student_class == filters['student_class'])
+    if before_id is not None:
+        statement = statement.where(table.c.record_id < before_id)
+    return statement.order_by(table.c.record_id.desc()).limit(limit)
+
+
+def _fetch(app, statement, archived, replica):
+    # Runs in a pool thread with its own app context (and so its own session)
+    with app.app_context(), (use_replica() if replica else nullcontext()):
+        return [dict(row._mapping, archived=archived) for row in db.session.execute(statement)]
+
+
+def _fetch_all(statements):
+    # (statement, archived) pairs run in parallel; one list of rows per statement
+    app = current_app._get_current_object()
+    replica = db.session.info.get('use_replica', False)
+    futures = [_executor().submit(_fetch, app, statement, archived, replica) for statement, archived in statements]
+    return [future.result() for future in futures]
+
+
+def _executor():
+    with _lock:
+        if _pool['executor'] is None:
+            _pool['executor'] = ThreadPoolExecutor(max_workers=_settings['workers'],
+                                                   thread_name_prefix='archive-query')
+        return _pool['executor']
+
+
+def query_records(date_from=None, date_to=None, student_id=None, offence_id=None,
+                  department=None, student_class=None, cursor=None, limit=None):
+    """
+    One page of disciplinary records, newest first, across the live table
+    and every archived year overlapping [date_from, date_to). Without either
+    bound only the live table is read. Each source is queried in parallel
+    for a page of its own and the pages are merged on record_id. Rows are
+    dicts (record columns, offence_name, archived); cursors are the same as
+    list_disciplinary_records'.
+    """
+    limit = limit or get_page_size()
+    before_id = decode_cursor(cursor, [(DisciplinaryRecord.record_id, True)])[0] if cursor else None
+    filters = {'date_from': date_from, 'date_to': date_to, 'student_id': student_id, 'offence_id': offence_id,
+               'department': department, 'student_class': student_class}
+
+    sources = [(DisciplinaryRecord.__table__, False)]
+    if date_from is not None or date_to is not None:
+        sources += [(archive_table(a['year']), True) for a in archives_for_range(date_from, date_to)]
+    statements = [(_records_select(table, filters, before_id, limit + 1), archived) for table, archived in sources]
+
+    if len(statements) == 1:
+        rows = [dict(row._mapping, archived=False) for row in db.session.execute(statements[0][0])]
+    else:
+        pages = _fetch_all(statements)
+        rows = list(islice(heapq.merge(*pages, key=lambda row: -row['record_id']), limit + 1))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1]['record_id']])
+    return rows, next_cursor
+
+
+def find_records(record_ids):
+    """
+    Archived records by id, looked up in every archive in parallel. Returns
+    {record_id: dict} with the record columns, offence_name, student_name,
+    register_number, archived=True and the academic year.
+    """
+    record_ids = list(record_ids)
+    archives = list_archives()
+    if not record_ids or not archives:
+        return {}
+    offences, students, users = OffenceType.__table__, Student.__table__, User.__table__
+    statements = []
+    for a in archives:
+        table = archive_table(a['year'])
+        statement = select(
+            *(table.c[name] for name in RECORD_COLUMNS), offences.c.offence_name,
+            users.c.full_name.label('student_name'), students.c.register_number, db.literal(a['year']).label('academic_year')
+        ).join(offences, offences.c.offence_id == table.c.offence_id) \
+         .join(students, students.c.student_id == table.c.student_id) \
+         .join(users, users.c.user_id == students.c.user_id) \
+         .where(table.c.record_id.in_(record_ids))
+        statements.append((statement, True))
+    return {row['record_id']: row for rows in _fetch_all(statements) for row in rows}
+
+
+def records_source(date_from=None, date_to=None, columns=('student_id', 'offence_id', 'created_at')):
+    """
+    `columns` of the live records plus those archived for years overlapping
+    [date_from, date_to), as one selectable for set-based batch jobs and
+    exports (e.g. rebuilding the analytics rollups)
+    """
+    load_archives()
+    tables = [DisciplinaryRecord.__table__] + [archive_table(a['year']) for a in archives_for_range(date_from, date_to)]
+    if len(tables) == 1:
+        return tables[0]
+    return union_all(*[select(*(t.c[name] for name in columns)) for t in tables]).subquery('records')
+
+
+# Archiving
+def _reset_points(connection, ends_at, reason):
+    # One adjustment per student, dated at the year's end, cancelling every
+    # ledger change before it; balances move by the same amounts
+    ledger = PointsLedger.__table__
+    points = BehaviouralPoints.__table__
+    high = connection.execute(select(func.max(ledger.c.entry_id))).scalar() or 0
+
+    owed = select(
+        ledger.c.student_id, db.literal('adjustment'),
+        -func.sum(ledger.c.points_delta), -func.sum(ledger.c.offence_delta),
+        db.literal(reason), db.literal(ends_at, db.DateTime)
+    ).where(ledger.c.created_at < ends_at) \
+     .group_by(ledger.c.student_id) \
+     .having(or_(func.sum(ledger.c.points_delta) != 0, func.sum(ledger.c.offence_delta) != 0))
+    connection.execute(ledger.insert().from_select(
+        ['student_id', 'entry_type', 'points_delta', 'offence_delta', 'reason', 'created_at'], owed
+    ))
+
+    is_reset = and_(ledger.c.entry_id > high, ledger.c.reason == reason)
+    points_delta = select(ledger.c.points_delta).where(is_reset, ledger.c.student_id == points.c.student_id)
+    offence_delta = select(ledger.c.offence_delta).where(is_reset, ledger.c.student_id == points.c.student_id)
+    result = connection.execute(
+        points.update()
+        .where(points.c.student_id.in_(select(ledger.c.student_id).where(is_reset)))
+        .values(total_points=points.c.total_points + points_delta.scalar_subquery(),
+                offence_count=points.c.offence_count + offence_delta.scalar_subquery())
+    )
+    mark_points_changed()
+    return result.rowcount
+
+
+def archive_year(year, points_policy='carry', now=None):
+    """
+    Move a closed academic year's records from disciplinary_record into
+    disciplinary_record_<year> and apply its points policy: 'reset' cancels
+    each student's losses up to the year's end with a ledger adjustment,
+    'carry' leaves balances alone. Runs as one transaction, so readers find
+    every record either in the live table or in its archive. Returns a
+    summary dict; raises ValueError if the year cannot be archived.
+    """
+    from app.utils.student_details import student_details_cache
+
+    if points_policy not in POINTS_POLICIES:
+        raise ValueError(f'Unknown points policy: {points_policy} (expected one of {", ".join(POINTS_POLICIES)})')
+    label = year_label(year)
+    starts_at, ends_at = academic_year_bounds(year)
+    if ends_at > (now or datetime.now()):
+        raise ValueError(f'Academic year {label} is still open (it ends on {ends_at:%Y-%m-%d})')
+    if db.session.get(ArchivedYear, year) is not None:
+        raise ValueError(f'Academic year {label} is already archived')
+
+    records = DisciplinaryRecord.__table__
+    in_year = and_(records.c.created_at >= starts_at, records.c.created_at < ends_at)
+    count, last_id = db.session.execute(select(func.count(), func.max(records.c.record_id)).where(in_year)).one()
+    connection = db.session.connection()
+    if connection.dialect.name == 'sqlite' and last_id is not None:
+        # SQLite hands out max(record_id) + 1, so moving the newest rows away
+        # would make new records reuse archived ids
+        remaining = db.session.execute(
+            select(func.max(records.c.record_id))
+            .where(or_(records.c.created_at < starts_at, records.c.created_at >= ends_at))
+        ).scalar()
+        if (remaining or 0) < last_id:
+            raise ValueError(f'Academic year {label} holds the newest records; archive it once the '
+                             f'current year has records of its own')
+
+    table = archive_table(year)
+    reset = 0
+    try:
+        table.create(connection, checkfirst=True)
+        columns = [c.name for c in records.columns]
+        connection.execute(table.insert().from_select(columns, select(*records.columns).where(in_year)))
+        connection.execute(records.delete().where(in_year))
+        if points_policy == 'reset':
+            from app.utils.analytics import rebuild_point_bands
+            reset = _reset_points(connection, ends_at, f'Academic year {label} closed: points reset')
+            rebuild_point_bands()
+        db.session.add(ArchivedYear(year=year, table_name=table.name, starts_at=starts_at, ends_at=ends_at,
+                                    record_count=count, points_policy=points_policy))
+        db.session.flush()
+        bump_reference_version(connection, ARCHIVES_KEY)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    invalidate_archives()
+    if reset:
+        student_details_cache.clear()
+    return {'year': year, 'label': label, 'table_name': table.name, 'records': count,
+            'points_policy': points_policy, 'students_reset': reset}
@@ -0,0 +1,108 @@
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DBAPIError
+
+from app.models import db, Role, OffenceType, RefDataVersion
+
+DEFAULT_ROLES = [
+    ('admin', 'Admin role'),
+    ('staff', 'Staff role'),
+    ('student', 'Student role'),
+]
+DEFAULT_OFFENCES = [
+    ('Latecoming', 5, 'Arriving late to class or activities'),
+    ('Uniform Violation', 10, 'Not wearing proper uniform'),
+    ('Disruptive Behavior', 15, 'Disrupting class or activities'),
+    ('Academic Dishonesty', 20, 'Cheating or plagiarism'),
+    ('Bullying', 25, 'Harassment or bullying behavior')
+]
+# Bump when the defaults above change so existing databases get re-seeded
+SEED_VERSION = 1
+SEED_KEY = 'seed'
+
+
+def _insert_missing(connection, model, key, rows):
+    # Idempotent bulk insert: rows whose key already exists are left alone
+    # (existing offence points are never overwritten)
+    if not rows:
+        return 0
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = (postgresql if dialect == 'postgresql' else sqlite).insert(model)
+        return connection.execute(insert.on_conflict_do_nothing(index_elements=[key]), rows).rowcount
+
+    column = getattr(model, key)
+    existing = set(connection.execute(select(column).where(column.in_([row[key] for row in rows]))).scalars())
+    missing = [row for row in rows if row[key] not in existing]
+    if missing:
+        connection.execute(db.insert(model), missing)
+    return len(missing)
+
+
+def seed_reference_data(connection):
+    """
+    Insert the default roles and offence types that are missing, one
+    statement per table, and record SEED_VERSION. Returns the number of
+    rows inserted.
+    """
+    from app.utils.refdata import bump_reference_version
+
+    inserted = _insert_missing(connection, Role, 'role_name', [
+        {'role_name': name, 'description': description} for name, description in DEFAULT_ROLES
+    ])
+    inserted += _insert_missing(connection, OffenceType, 'offence_name', [
+        {'offence_name': name, 'deduct_points': points, 'description': description}
+        for name, points, description in DEFAULT_OFFENCES
+    ])
+    if inserted:
+        # Running workers reload their cached roles/offences
+        bump_reference_version(connection)
+
+    updated = connection.execute(
+        db.update(RefDataVersion).where(RefDataVersion.name == SEED_KEY).values(version=SEED_VERSION)
+    )
+    if not updated.rowcount:
+        connection.execute(db.insert(RefDataVersion).values(name=SEED_KEY, version=SEED_VERSION))
+    return inserted
+
+
+def database_state(engine):
+    """
+    (schema revision, seed version) in one round trip; (None, None) when
+    the bookkeeping tables do not exist yet
+    """
+    try:
+        with engine.connect() as conn:
+            return tuple(conn.execute(text(
+                "SELECT (SELECT version FROM schema_version), "
+                "(SELECT version FROM ref_data_version WHERE name = :key)"
+            ), {'key': SEED_KEY}).one())
+    except DBAPIError:
+        return None, None
+
+
+def database_ready(engine):
+    """
+    True if the schema is at the head migration and the defaults are seeded
+    """
+    from app import migrations
+
+    return database_state(engine) == (migrations.head_revision(), SEED_VERSION)
+
+
+def init_database(engine, echo=print):
+    """
+    Bring a database to a usable state: create missing tables, apply pending
+    migrations (all of them are idempotent, so this is safe on databases
+    created before migrations were tracked) and seed the defaults. Safe to
+    run any number of times.
+    """
+    from app import migrations
+
+    db.metadata.create_all(engine)
+    revision = migrations.upgrade(engine, echo=echo)
+    with engine.begin() as conn:
+        inserted = seed_reference_data(conn)
+    echo(f'Database at revision {revision or "base"}, seed version {SEED_VERSION} '
+         f'({inserted} default row(s) added)')
+    return revision
@@ -0,0 +1,169 @@
+import csv
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from itertools import islice
+
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from app.models import db, User, Student, Staff, BehaviouralPoints
+from app.utils.analytics import move_point_bands
+from app.utils.refdata import get_role_id
+
+# CSV columns use the same names as the add_student/add_staff forms
+USER_FIELDS = ['username', 'password', 'full_name', 'gender', 'contact_number', 'address']
+PROFILE_FIELDS = {
+    'student': ['register_number', 'department', 'student_class', 'parent_name', 'parent_contact'],
+    'staff': ['empid', 'position', 'department']
+}
+# Column that must be unique per profile, and the model column it maps to
+PROFILE_KEY = {
+    'student': ('register_number', Student.register_number),
+    'staff': ('empid', Staff.staff_empid)
+}
+
+# Hashing pool shared by web uploads in this process (see shared_hashing_pool)
+_shared_pool = {'executor': None, 'workers': None}
+_shared_pool_lock = threading.Lock()
+
+
+def shared_hashing_pool(workers):
+    """
+    (pool, workers) for imports started from web requests: one process pool
+    per server process, `workers` wide, created on first use. Concurrent
+    uploads queue for the same processes instead of each starting its own.
+    """
+    with _shared_pool_lock:
+        if _shared_pool['executor'] is None:
+            _shared_pool['executor'] = ProcessPoolExecutor(max_workers=workers)
+            _shared_pool['workers'] = workers
+        return _shared_pool['executor'], _shared_pool['workers']
+
+
+def _existing(column, values):
+    if not values:
+        return set()
+    return {v for (v,) in db.session.query(column).filter(column.in_(values))}
+
+
+def _validate_batch(rows, role_name, seen_codes, seen_keys):
+    """
+    Split a batch into valid rows and errors. Uniqueness is checked against
+    the rest of the file (seen_* sets) and the database with one IN query per key.
+    """
+    key_field, key_column = PROFILE_KEY[role_name]
+    required = USER_FIELDS + PROFILE_FIELDS[role_name]
+
+    taken_codes = _existing(User.user_code, [r['username'] for _, r in rows if r.get('username')])
+    taken_keys = _existing(key_column, [r[key_field] for _, r in rows if r.get(key_field)])
+
+    valid, errors = [], []
+    for line, row in rows:
+        missing = [f for f in required if not (row.get(f) or '').strip()]
+        if missing:
+            errors.append({'row': line, 'error': f"Missing fields: {', '.join(missing)}"})
+        elif row['username'] in taken_codes or row['username'] in seen_codes:
+            errors.append({'row': line, 'error': 'Username already exists'})
+        elif row[key_field] in taken_keys or row[key_field] in seen_keys:
+            label = 'Register number' if role_name == 'student' else 'Employee ID'
+            errors.append({'row': line, 'error': f'{label} already exists'})
+        else:
+            seen_codes.add(row['username'])
+            seen_keys.add(row[key_field])
+            valid.append((line, row))
+    return valid, errors
+
+
+def _insert_batch(rows, hashes, role_id, role_name):
+    user_ids = db.session.scalars(
+        insert(User).returning(User.user_id, sort_by_parameter_order=True),
+        [{
+            'user_code': row['username'],
+            'password_hash': password_hash,
+            'role_id': role_id,
+            'full_name': row['full_name'],
+            'gender': row['gender'],
+            'contact_number': row['contact_number'],
+            'address': row['address'],
+            'image_url': row.get('image_url') or None
+        } for (_, row), password_hash in zip(rows, hashes)]
+    ).all()
+
+    if role_name == 'student':
+        student_ids = db.session.scalars(
+            insert(Student).returning(Student.student_id, sort_by_parameter_order=True),
+            [{
+                'user_id': user_id,
+                'register_number': row['register_number'],
+                'department': row['department'],
+                'student_class': row['student_class'],
+                'parent_name': row['parent_name'],
+                'parent_contact': row['parent_contact']
+            } for (_, row), user_id in zip(rows, user_ids)]
+        ).all()
+        db.session.execute(insert(BehaviouralPoints), [
+            {'student_id': student_id, 'total_points': 100, 'offence_count': 0}
+            for student_id in student_ids
+        ])
+        move_point_bands(student_ids)
+    else:
+        db.session.execute(insert(Staff), [{
+            'user_id': user_id,
+            'staff_empid': row['empid'],
+            'position': row['position'],
+            'department': row['department']
+        } for (_, row), user_id in zip(rows, user_ids)])
+
+
+def import_users(lines, role_name, batch_size=1000, workers=None, hash_method=None, pool=None):
+    """
+    Stream users of one role from CSV text lines (header row first) into the database.
+
+    Rows are validated and inserted in batches, each batch in its own
+    transaction; passwords are hashed in a process pool (with `hash_method`,
+    or werkzeug's default when None). `pool` is an existing executor
+    `workers` wide to hash in; without one a pool of `workers` (default:
+    CPU count) processes is started for this import. Returns a report
+    dict with the number of created users and a per-row error list.
+    """
+    if role_name not in PROFILE_FIELDS:
+        raise ValueError(f'Unsupported role for import: {role_name}')
+
+    role_id = get_role_id(role_name)
+    if role_id is None:
+        raise ValueError('Role does not exist')
+
+    reader = csv.DictReader(lines)
+    numbered = ((reader.line_num, row) for row in reader)
+    seen_codes, seen_keys = set(), set()
+    report = {'created': 0, 'errors': []}
+
+    workers = workers or os.cpu_count()
+    hash_password = partial(generate_password_hash, method=hash_method) if hash_method else generate_password_hash
+    with nullcontext(pool) if pool is not None else ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = list(islice(numbered, batch_size))
+            if not batch:
+                break
+
+            valid, errors = _validate_batch(batch, role_name, seen_codes, seen_keys)
+            report['errors'].extend(errors)
+            if not valid:
+                continue
+
+            chunksize = max(1, len(valid) // (workers * 4))
+            hashes = list(pool.map(hash_password, [row['password'] for _, row in valid],
+                                   chunksize=chunksize))
+            try:
+                _insert_batch(valid, hashes, role_id, role_name)
+                db.session.commit()
+                report['created'] += len(valid)
+            except Exception as e:
+                db.session.rollback()
+                report['errors'].extend({'row': line, 'error': f'Error creating user: {str(e)}'}
+                                        for line, _ in valid)
+
+    return report
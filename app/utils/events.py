@@ -0,0 +1,354 @@
+import json
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event
+
+from app.models import db, Student, OffenceType, BehaviouralPoints, DisciplinaryRecord, PointsLedger
+from app.db_engine import RoutingSession
+
+# Live points updates for SSE clients. Each process runs one tailer thread
+# that reads new points_ledger entries (a single query for all of its
+# subscribers) and fans them out to in-memory subscriptions. Writers in this
+# process wake the tailer right after commit; entries written by other
+# workers are picked up within poll_interval. Event ids are ledger entry_ids,
+# so Last-Event-ID resume works across workers and restarts.
+#
+# entry_ids are assigned at insert but become visible at commit, so on
+# PostgreSQL a lower id can appear after a higher one was read. Ids skipped
+# over by the watermark are kept as gaps and re-read on every poll until
+# they show up or gap_timeout passes (rolled back, or deleted).
+POLL_BATCH_SIZE = 1000
+MAX_GAPS = 10000
+# Ids recently sent on one stream, to drop duplicates between replay and live events
+SENT_IDS_KEPT = 1000
+
+
+class Event:
+    __slots__ = ('id', 'channels', 'type', 'data')
+
+    def __init__(self, id, channels, type, data):
+        self.id = id
+        self.channels = channels
+        self.type = type
+        self.data = data
+
+    def encode(self):
+        return f'id: {self.id}\nevent: {self.type}\ndata: {self.data}\n\n'
+
+
+def student_channel(student_id):
+    return f'student:{int(student_id)}'
+
+
+def department_channel(department):
+    return f'department:{department}'
+
+
+class Subscription:
+    """
+    One client's bounded event buffer. When the client falls more than
+    `maxsize` events behind, the oldest are dropped and the stream tells it
+    to reload instead of replaying.
+    """
+
+    def __init__(self, channels, maxsize):
+        self.channels = frozenset(channels)
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._events = deque()
+        self._overflowed = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def push(self, event):
+        with self._lock:
+            if len(self._events) >= self.maxsize:
+                self._events.popleft()
+                self.dropped += 1
+                self._overflowed = True
+            self._events.append(event)
+        self._wake.set()
+
+    def wait(self, timeout):
+        """
+        Block until events arrive or `timeout` passes. Returns (events,
+        overflowed); events is empty on timeout.
+        """
+        self._wake.wait(timeout)
+        self._wake.clear()
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+            overflowed, self._overflowed = self._overflowed, False
+        return events, overflowed
+
+
+class EventBroker:
+    def __init__(self, poll_interval=1.0, buffer_size=100, history_size=1000, max_subscribers=5000,
+                 gap_timeout=30.0):
+        self.poll_interval = poll_interval
+        self.gap_timeout = gap_timeout
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.published = 0
+        self._app = None
+        self._lock = threading.Lock()
+        self._subscribers = {}  # channel -> set of Subscription
+        self._count = 0
+        self._history = deque(maxlen=history_size)
+        self._watermark = None  # highest ledger entry_id seen
+        self._floor = None      # history holds every event with id > floor
+        self._gaps = {}         # entry_id below the watermark not seen yet -> monotonic time noticed
+        self._nudge = threading.Event()
+        self._tailer = None
+
+    def configure(self, app, poll_interval=None, buffer_size=None, history_size=None, max_subscribers=None,
+                  gap_timeout=None):
+        with self._lock:
+            self._app = app
+            if poll_interval is not None:
+                self.poll_interval = poll_interval
+            if gap_timeout is not None:
+                self.gap_timeout = gap_timeout
+            if buffer_size is not None:
+                self.buffer_size = buffer_size
+            if history_size is not None:
+                self._history = deque(self._history, maxlen=history_size)
+            if max_subscribers is not None:
+                self.max_subscribers = max_subscribers
+
+    # Subscribers
+    def subscribe(self, channels, last_event_id=None):
+        """
+        Register a subscription and return it with the events it missed
+        since `last_event_id` (None, or [] when there is nothing to replay).
+        Replay comes from memory when possible, otherwise from the ledger;
+        None means the gap is too large and the client should reload.
+        Raises OverflowError when the node is at max_subscribers.
+        """
+        self._ensure_tailer()
+        subscription = Subscription(channels, self.buffer_size)
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise OverflowError('Too many live subscribers')
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+            self._count += 1
+            if last_event_id is None:
+                return subscription, []
+            if self._floor is not None and last_event_id >= self._floor:
+                return subscription, [e for e in self._history
+                                      if e.id > last_event_id and not subscription.channels.isdisjoint(e.channels)]
+            until = self._watermark
+
+        # Older than what is in memory: read the gap from the ledger
+        missed = self._load_events(last_event_id, until, subscription.channels, limit=self.buffer_size + 1)
+        if len(missed) > self.buffer_size:
+            return subscription, None
+        return subscription, missed
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+            self._count -= 1
+
+    def publish(self, event):
+        with self._lock:
+            self._watermark = max(self._watermark or 0, event.id)
+            self._history.append(event)
+            if len(self._history) == self._history.maxlen:
+                self._floor = self._history[0].id
+            targets = set()
+            for channel in event.channels:
+                targets.update(self._subscribers.get(channel, ()))
+            self.published += 1
+        for subscription in targets:
+            subscription.push(event)
+
+    def notify(self):
+        """
+        Wake the tailer now (called after a commit that wrote ledger entries)
+        """
+        self._nudge.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': self._count,
+                'channels': len(self._subscribers),
+                'published': self.published,
+                'history': len(self._history),
+                'watermark': self._watermark,
+                'gaps': len(self._gaps),
+                'buffer_size': self.buffer_size,
+                'max_subscribers': self.max_subscribers
+            }
+
+    # Ledger tailing
+    def _query(self):
+        return db.session.query(
+            PointsLedger.entry_id, PointsLedger.student_id, Student.department, PointsLedger.entry_type,
+            PointsLedger.points_delta, PointsLedger.offence_delta, PointsLedger.record_id,
+            OffenceType.offence_name, BehaviouralPoints.total_points, BehaviouralPoints.offence_count,
+            PointsLedger.created_at
+        ).join(Student, Student.student_id == PointsLedger.student_id) \
+         .outerjoin(DisciplinaryRecord, DisciplinaryRecord.record_id == PointsLedger.record_id) \
+         .outerjoin(OffenceType, OffenceType.offence_id == DisciplinaryRecord.offence_id) \
+         .outerjoin(BehaviouralPoints, BehaviouralPoints.student_id == PointsLedger.student_id)
+
+    def _to_event(self, row):
+        data = row._asdict()
+        data['created_at'] = row.created_at.isoformat() if row.created_at else None
+        return Event(row.entry_id, (student_channel(row.student_id), department_channel(row.department)),
+                     'points', json.dumps(data, separators=(',', ':')))
+
+    def _load_events(self, after_id, until_id, channels, limit):
+        students = [int(c.split(':', 1)[1]) for c in channels if c.startswith('student:')]
+        departments = [c.split(':', 1)[1] for c in channels if c.startswith('department:')]
+        with self._app.app_context():
+            query = self._query().filter(PointsLedger.entry_id > after_id)
+            if until_id is not None:
+                query = query.filter(PointsLedger.entry_id <= until_id)
+            query = query.filter(db.or_(PointsLedger.student_id.in_(students), Student.department.in_(departments)))
+            return [self._to_event(row) for row in query.order_by(PointsLedger.entry_id).limit(limit)]
+
+    def _open_gaps(self):
+        expired_before = time.monotonic() - self.gap_timeout
+        for entry_id in [i for i, noticed in self._gaps.items() if noticed < expired_before]:
+            del self._gaps[entry_id]
+        return list(self._gaps)
+
+    def _note_gaps(self, after_id, before_id):
+        # Ids skipped between two entries read in id order may still commit
+        noticed = time.monotonic()
+        for entry_id in range(max(after_id + 1, before_id - MAX_GAPS), before_id):
+            self._gaps[entry_id] = noticed
+        while len(self._gaps) > MAX_GAPS:
+            del self._gaps[next(iter(self._gaps))]
+
+    def poll(self, batch_size=POLL_BATCH_SIZE):
+        """
+        Publish ledger entries newer than the watermark, and any that filled
+        a gap below it since the last poll. Returns how many new entries
+        were read past the watermark.
+        """
+        with self._app.app_context():
+            if self._watermark is None:
+                start = db.session.query(db.func.max(PointsLedger.entry_id)).scalar() or 0
+                with self._lock:
+                    self._watermark = self._floor = start
+                return 0
+            watermark = self._watermark
+            gaps = self._open_gaps()
+            late = []
+            if gaps:
+                late = self._query().filter(PointsLedger.entry_id.in_(gaps)).order_by(PointsLedger.entry_id).all()
+            rows = self._query().filter(PointsLedger.entry_id > watermark) \
+                .order_by(PointsLedger.entry_id).limit(batch_size).all()
+        for row in late:
+            self._gaps.pop(row.entry_id, None)
+            self.publish(self._to_event(row))
+        for row in rows:
+            self._note_gaps(watermark, row.entry_id)
+            watermark = row.entry_id
+            self.publish(self._to_event(row))
+        return len(rows)
+
+    def _ensure_tailer(self):
+        if self._tailer is not None and self._tailer.is_alive():
+            return
+        if self._watermark is None:
+            # Fix the starting point before anyone subscribes, so nothing
+            # committed in between is missed
+            self.poll()
+        with self._lock:
+            if self._tailer is not None and self._tailer.is_alive():
+                return
+            self._tailer = threading.Thread(target=self._run, name='points-event-tailer', daemon=True)
+            self._tailer.start()
+
+    def _run(self):
+        while True:
+            self._nudge.wait(self.poll_interval)
+            self._nudge.clear()
+            try:
+                while self.poll() == POLL_BATCH_SIZE:
+                    pass
+            except Exception:
+                self._app.logger.exception('Points event tailer failed')
+
+
+event_broker = EventBroker()
+
+
+def sse_stream(subscription, backlog, heartbeat, retry_ms, last_event_id=None):
+    """
+    Yield an SSE stream: a retry hint, missed events (or a reset when the
+    gap was too large), then live events with a comment line every
+    `heartbeat` seconds so proxies keep idle connections open. Events the
+    client already has are skipped. The subscription is released when the
+    client goes away.
+    """
+    resumed_from = last_event_id or 0
+    sent_ids = set()
+    sent_order = deque()
+    try:
+        yield f'retry: {retry_ms}\n\n'
+        if backlog is None:
+            yield 'event: reset\ndata: {}\n\n'
+            backlog = []
+        while True:
+            for e in backlog:
+                # Ids are not strictly increasing (late commits), so remember recent ones
+                if e.id > resumed_from and e.id not in sent_ids:
+                    sent_ids.add(e.id)
+                    sent_order.append(e.id)
+                    if len(sent_order) > SENT_IDS_KEPT:
+                        sent_ids.discard(sent_order.popleft())
+                    yield e.encode()
+            backlog, overflowed = subscription.wait(heartbeat)
+            if overflowed:
+                # The client fell behind; it should reload current state
+                yield 'event: reset\ndata: {}\n\n'
+            if not backlog:
+                yield ': heartbeat\n\n'
+    finally:
+        event_broker.unsubscribe(subscription)
+
+
+def mark_points_changed(session=None):
+    """
+    Note that this transaction wrote ledger entries, so the tailer is woken
+    when it commits
+    """
+    (session or db.session).info['points_changed'] = True
+
+
+def _notify_after_commit(session):
+    if session.info.pop('points_changed', False):
+        event_broker.notify()
+
+
+def _forget_on_rollback(session, previous_transaction):
+    session.info.pop('points_changed', None)
+
+
+def init_events(app):
+    event_broker.configure(
+        app,
+        poll_interval=app.config.get('EVENTS_POLL_INTERVAL'),
+        buffer_size=app.config.get('EVENTS_BUFFER_SIZE'),
+        history_size=app.config.get('EVENTS_HISTORY_SIZE'),
+        max_subscribers=app.config.get('EVENTS_MAX_SUBSCRIBERS'),
+        gap_timeout=app.config.get('EVENTS_GAP_TIMEOUT')
+    )
+    if not event.contains(RoutingSession, 'after_commit', _notify_after_commit):
+        event.listen(RoutingSession, 'after_commit', _notify_after_commit)
+        event.listen(RoutingSession, 'after_soft_rollback', _forget_on_rollback)
@@ -0,0 +1,139 @@
+import csv
+import tempfile
+from io import StringIO
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from app.models import db, User, Student, Staff, OffenceType
+from app.utils.archive import RECORD_COLUMNS, records_source
+
+EXPORT_CHUNK_SIZE = 2000
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+_StudentUser = aliased(User, name='student_user')
+_StaffUser = aliased(User, name='staff_user')
+
+# (header, record column or other column) in export order; record columns
+# are named, since records may come from the live table or an archive
+EXPORT_COLUMNS = [
+    ('record_id', 'record_id'),
+    ('created_at', 'created_at'),
+    ('register_number', Student.register_number),
+    ('student_name', _StudentUser.full_name),
+    ('department', Student.department),
+    ('student_class', Student.student_class),
+    ('offence', OffenceType.offence_name),
+    ('points_deducted', OffenceType.deduct_points),
+    ('description', 'description'),
+    ('action_taken', 'action_taken'),
+    ('recorded_by', Staff.staff_empid),
+    ('recorded_by_name', _StaffUser.full_name),
+]
+EXPORT_HEADERS = [header for header, _ in EXPORT_COLUMNS]
+
+
+def export_statement(date_from=None, date_to=None, department=None, student_class=None):
+    """
+    SELECT for the flat disciplinary history export, oldest record first,
+    including archived academic years in the range.
+    `date_to` is exclusive (see parse_date_arg(end=True)).
+    """
+    records = records_source(date_from, date_to, columns=RECORD_COLUMNS)
+    columns = [(records.c[column] if isinstance(column, str) else column).label(header)
+               for header, column in EXPORT_COLUMNS]
+    statement = select(*columns) \
+        .select_from(records) \
+        .join(Student, Student.student_id == records.c.student_id) \
+        .join(_StudentUser, _StudentUser.user_id == Student.user_id) \
+        .join(OffenceType, OffenceType.offence_id == records.c.offence_id) \
+        .join(Staff, Staff.staff_id == records.c.recorded_by) \
+        .join(_StaffUser, _StaffUser.user_id == Staff.user_id)
+
+    if date_from:
+        statement = statement.where(records.c.created_at >= date_from)
+    if date_to:
+        statement = statement.where(records.c.created_at < date_to)
+    if department:
+        statement = statement.where(Student.department == department)
+    if student_class:
+        statement = statement.where(Student.student_class == student_class)
+    return statement.order_by(records.c.record_id)
+
+
+def iter_export_chunks(chunk_size=EXPORT_CHUNK_SIZE, **filters):
+    """
+    Yield lists of at most `chunk_size` plain row tuples. Rows are streamed
+    from a server-side cursor (yield_per), so only one chunk is ever held
+    in memory regardless of how many records match.
+    """
+    result = db.session.execute(
+        export_statement(**filters).execution_options(yield_per=chunk_size)
+    )
+    try:
+        for partition in result.partitions():
+            yield [tuple(row) for row in partition]
+    finally:
+        result.close()
+
+
+def iter_csv(chunk_size=EXPORT_CHUNK_SIZE, **filters):
+    """
+    Yield the export as CSV text, one string per chunk of rows (header first)
+    """
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADERS)
+    yield buffer.getvalue()
+
+    for rows in iter_export_chunks(chunk_size, **filters):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+def xlsx_supported():
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def write_xlsx(fileobj, chunk_size=EXPORT_CHUNK_SIZE, **filters):
+    """
+    Write the export to `fileobj` as an XLSX workbook. Uses openpyxl's
+    write-only mode, which spools rows to disk instead of building the
+    sheet in memory. Returns the number of rows written.
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError('XLSX export requires openpyxl: pip install openpyxl')
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Disciplinary records')
+    sheet.append(EXPORT_HEADERS)
+    written = 0
+    for rows in iter_export_chunks(chunk_size, **filters):
+        for row in rows:
+            sheet.append(row)
+        written += len(rows)
+    workbook.save(fileobj)
+    return written
+
+
+def iter_xlsx(chunk_size=EXPORT_CHUNK_SIZE, read_size=64 * 1024, **filters):
+    """
+    Build the workbook in a temporary file (XLSX is a zip archive, so it
+    can only be sent once complete) and yield it back in `read_size` blocks
+    """
+    with tempfile.TemporaryFile() as spool:
+        write_xlsx(spool, chunk_size, **filters)
+        spool.seek(0)
+        while True:
+            block = spool.read(read_size)
+            if not block:
+                return
+            yield block
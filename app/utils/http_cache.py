@@ -0,0 +1,184 @@
+import gzip
+import hashlib
+from functools import wraps
+
+from flask import current_app, request, session
+from sqlalchemy import func, select
+
+from app.models import db
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/csv', 'text/css',
+                          'application/javascript', 'image/svg+xml'}
+# Headers a 304 must repeat from the full response (RFC 9110 15.4.5)
+NOT_MODIFIED_HEADERS = ('ETag', 'Cache-Control', 'Vary', 'Expires', 'Content-Location')
+
+_settings = {'min_size': 1024, 'gzip_level': 6, 'brotli_quality': 5, 'qr_max_age': 86400}
+
+
+def body_etag(body):
+    """
+    Strong validator for a response body
+    """
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def row_stamp(*sources):
+    """
+    A version stamp for the rows behind a view, from one query: the count and
+    max id of each (id_column, *criteria) source. It moves whenever a
+    matching row is added or removed, so it suits tables whose listed
+    columns are not edited in place (ids and counts come from indexes). A
+    (RefDataVersion.version, name == key) source folds in a version row.
+    """
+    columns = [select(aggregate(id_column)).where(*criteria).scalar_subquery()
+               for id_column, *criteria in sources
+               for aggregate in (func.count, func.max)]
+    return '.'.join(str(value or 0) for value in db.session.execute(select(*columns)).one())
+
+
+def _is_authenticated():
+    # From the session cookie alone: loading the user here could cost a query
+    return session.get('_user_id') is not None or \
+        current_app.config.get('REMEMBER_COOKIE_NAME', 'remember_token') in request.cookies
+
+
+def _revalidate(response):
+    # Clients must revalidate; only the user's own cache may keep what a
+    # logged-in user was sent
+    if 'Cache-Control' not in response.headers:
+        response.cache_control.no_cache = True
+        if _is_authenticated():
+            response.cache_control.private = True
+
+
+def etag_from(stamp):
+    """
+    Decorator for JSON GET views whose response is fully determined by a
+    cheap stamp: `stamp(**view_args)` (a version number, a row_stamp, ...)
+    runs before the view, and a client already holding the matching ETag
+    gets a 304 without the view's queries or rendering. Responses of the
+    view carry the ETag, so apply_http_caching does not hash their body.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+            # Hashed so row counts are not exposed to clients
+            etag = body_etag(f'{request.endpoint}-{stamp(*args, **kwargs)}'.encode())
+            if _client_has(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            _revalidate(response)
+            return response
+        return wrapper
+    return decorator
+
+
+def _preferred_encoding():
+    # Brotli compresses JSON noticeably better than gzip at similar CPU cost
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=_settings['brotli_quality'])
+    return gzip.compress(body, compresslevel=_settings['gzip_level'], mtime=0)
+
+
+def _client_has(etag):
+    # Compressed representations carry "<etag>-<encoding>"; any of them
+    # proves the client holds the current content
+    if_none_match = request.if_none_match
+    if not if_none_match:
+        return False
+    return if_none_match.star_tag or any(
+        if_none_match.contains(candidate) for candidate in (etag, f'{etag}-gzip', f'{etag}-br')
+    )
+
+
+def _not_modified(app, response):
+    not_modified = app.response_class(status=304)
+    for header in NOT_MODIFIED_HEADERS:
+        if header in response.headers:
+            not_modified.headers[header] = response.headers[header]
+    return not_modified
+
+
+def _is_static_qr():
+    return request.endpoint == 'static' and \
+        (request.view_args or {}).get('filename', '').replace('\\', '/').startswith('qrcodes/')
+
+
+def init_http_cache(app):
+    """
+    Add validators and compression to GET responses:
+
+    - JSON without an ETag gets a strong one from a hash of its body (views
+      with a cheaper version set their own before rendering, like the
+      offence list or the @etag_from views) and Cache-Control: no-cache,
+      plus private for logged-in users, so clients revalidate and get 304s
+    - If-None-Match matching the current ETag returns 304 with no body
+    - bodies over COMPRESS_MIN_SIZE are sent brotli (when installed) or
+      gzip encoded, with a per-encoding ETag
+    - QR PNGs under static/qrcodes are cacheable for QR_STATIC_MAX_AGE
+    """
+    if not app.config.get('HTTP_CACHE_ENABLED', True):
+        return
+
+    _settings['min_size'] = app.config.get('COMPRESS_MIN_SIZE', _settings['min_size'])
+    _settings['gzip_level'] = app.config.get('COMPRESS_GZIP_LEVEL', _settings['gzip_level'])
+    _settings['brotli_quality'] = app.config.get('COMPRESS_BROTLI_QUALITY', _settings['brotli_quality'])
+    _settings['qr_max_age'] = app.config.get('QR_STATIC_MAX_AGE', _settings['qr_max_age'])
+
+    @app.after_request
+    def apply_http_caching(response):
+        if request.method not in ('GET', 'HEAD'):
+            return response
+
+        # A QR file only changes when the student's card is reissued
+        if _is_static_qr() and response.status_code in (200, 304):
+            response.cache_control.no_cache = False
+            response.cache_control.public = True
+            response.cache_control.max_age = _settings['qr_max_age']
+            return response
+
+        if response.status_code != 200 or response.direct_passthrough or response.is_streamed:
+            return response
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers:
+            return response
+
+        body = response.get_data()
+        etag, _ = response.get_etag()
+        if response.mimetype == 'application/json':
+            if etag is None:
+                etag = body_etag(body)
+                response.set_etag(etag)
+            _revalidate(response)
+
+        response.vary.add('Accept-Encoding')
+        encoding = _preferred_encoding() if len(body) >= _settings['min_size'] else None
+        if etag is not None:
+            if encoding:
+                response.set_etag(f'{etag}-{encoding}')
+            if _client_has(etag):
+                return _not_modified(app, response)
+
+        if encoding:
+            response.set_data(_compress(body, encoding))
+            response.headers['Content-Encoding'] = encoding
+        return response
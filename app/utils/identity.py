@@ -0,0 +1,119 @@
+from functools import wraps
+
+from flask import current_app, jsonify
+from flask_login import UserMixin, current_user
+
+from app.models import db, User, Role, Student, Staff
+from app.utils.cache import TTLCache
+
+# Identities of logged-in users, keyed by user_id. Profile writes in this
+# process invalidate explicitly; the TTL bounds staleness across workers.
+identity_cache = TTLCache(maxsize=5000, ttl=300)
+
+
+class Identity(UserMixin):
+    """
+    Read-only snapshot of a logged-in user: the user row, role name and
+    staff/student profile ids. This is what current_user is on every request
+    after login; it is never attached to a session, so reading it never
+    triggers a query.
+    """
+
+    def __init__(self, user_id, user_code, full_name, image_url, role_name,
+                 staff_id=None, student_id=None, department=None, student_class=None):
+        self.user_id = user_id
+        self.user_code = user_code
+        self.full_name = full_name
+        self.image_url = image_url
+        self.role_name = role_name
+        self.staff_id = staff_id
+        self.student_id = student_id
+        self.department = department
+        self.student_class = student_class
+
+    def get_id(self):
+        return str(self.user_id)
+
+    def has_role(self, *role_names):
+        return self.role_name in role_names
+
+    @property
+    def is_staff(self):
+        return self.staff_id is not None
+
+    @property
+    def is_student(self):
+        return self.student_id is not None
+
+    def __repr__(self) -> str:
+        return f"Identity: {self.user_code}, Role: {self.role_name}"
+
+
+def init_identity_cache(app):
+    identity_cache.configure(
+        maxsize=app.config.get('IDENTITY_CACHE_SIZE'),
+        ttl=app.config.get('IDENTITY_CACHE_TTL')
+    )
+
+
+def load_identity(user_id):
+    """
+    Load a user with their role and profile in a single joined query.
+    Returns None if the user does not exist.
+    """
+    row = db.session.query(
+        User.user_id, User.user_code, User.full_name, User.image_url, Role.role_name,
+        Staff.staff_id, Student.student_id,
+        db.func.coalesce(Staff.department, Student.department).label('department'),
+        Student.student_class
+    ).join(Role, Role.role_id == User.role_id) \
+     .outerjoin(Staff, Staff.user_id == User.user_id) \
+     .outerjoin(Student, Student.user_id == User.user_id) \
+     .filter(User.user_id == user_id) \
+     .first()
+
+    if row is None:
+        return None
+    return Identity(**row._asdict())
+
+
+def get_identity(user_id):
+    """
+    Cached load_identity (the Flask-Login user loader)
+    """
+    identity = identity_cache.get(user_id)
+    if identity is None:
+        identity = load_identity(user_id)
+        if identity is not None:
+            identity_cache.set(user_id, identity)
+    return identity
+
+
+def invalidate_identity(user_id=None):
+    """
+    Drop one cached identity, or all of them when user_id is None
+    """
+    if user_id is None:
+        identity_cache.clear()
+    else:
+        identity_cache.invalidate(int(user_id))
+
+
+def role_required(*role_names):
+    """
+    Decorator for views restricted to some roles, checked against the cached
+    identity (implies login_required); other roles get a JSON 403. Like
+    login_required, it lets everything through when LOGIN_DISABLED is set.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if current_app.config.get('LOGIN_DISABLED'):
+                return view(*args, **kwargs)
+            if not current_user.is_authenticated:
+                return current_app.login_manager.unauthorized()
+            if not current_user.has_role(*role_names):
+                return jsonify({'error': 'Forbidden'}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
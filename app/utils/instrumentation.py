@@ -0,0 +1,200 @@
+import bisect
+import logging
+import threading
+import time
+
+from flask import Response, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.utils.query_budget import request_statements
+
+slow_query_logger = logging.getLogger('app.slow_query')
+
+# Histogram bucket upper bounds (Prometheus `le` labels)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+_local = threading.local()
+_settings = {'slow_query_seconds': None}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class RequestMetrics:
+    """
+    Per-process aggregates keyed by endpoint. One lock acquisition per
+    request keeps this cheap enough to leave on under load.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}       # (endpoint, method, status) -> count
+        self.durations = {}      # endpoint -> Histogram (seconds)
+        self.db_times = {}       # endpoint -> Histogram (seconds)
+        self.statements = {}     # endpoint -> Histogram (count)
+        self.rows = {}           # endpoint -> rows fetched/affected
+        self.slow_queries = {}   # endpoint -> count
+
+    def record(self, endpoint, method, status, duration, stats):
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.durations.setdefault(endpoint, Histogram(DURATION_BUCKETS)).observe(duration)
+            self.db_times.setdefault(endpoint, Histogram(DURATION_BUCKETS)).observe(stats['db_time'])
+            self.statements.setdefault(endpoint, Histogram(STATEMENT_BUCKETS)).observe(stats['statements'])
+            self.rows[endpoint] = self.rows.get(endpoint, 0) + stats['rows']
+            if stats['slow']:
+                self.slow_queries[endpoint] = self.slow_queries.get(endpoint, 0) + stats['slow']
+
+    def render(self):
+        """
+        Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            lines += ['# HELP http_requests_total Requests by endpoint, method and status.',
+                      '# TYPE http_requests_total counter']
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+
+            for name, help_text, histograms in (
+                ('http_request_duration_seconds', 'Wall time per request.', self.durations),
+                ('db_time_seconds', 'Cumulative SQL time per request.', self.db_times),
+                ('db_statements_per_request', 'SQL statements issued per request.', self.statements),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for endpoint, histogram in sorted(histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {histogram.total:.6f}')
+                    lines.append(f'{name}_count{{endpoint="{endpoint}"}} {histogram.count}')
+
+            lines += ['# HELP db_rows_total Rows loaded by the ORM or affected by writes, per endpoint.',
+                      '# TYPE db_rows_total counter']
+            for endpoint, rows in sorted(self.rows.items()):
+                lines.append(f'db_rows_total{{endpoint="{endpoint}"}} {rows}')
+
+            lines += ['# HELP db_slow_queries_total Statements slower than SLOW_QUERY_THRESHOLD_MS.',
+                      '# TYPE db_slow_queries_total counter']
+            for endpoint, count in sorted(self.slow_queries.items()):
+                lines.append(f'db_slow_queries_total{{endpoint="{endpoint}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = RequestMetrics()
+
+
+def _current_stats():
+    return getattr(_local, 'stats', None)
+
+
+# Statements are counted by app/utils/query_budget.py; these hooks only time
+# them. The start times are a stack per connection, pushed here and popped by
+# _stop_timer, or by _discard_timer when the statement fails.
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    stats = _current_stats()
+    if stats is not None:
+        stats['db_time'] += elapsed
+        if cursor.rowcount and cursor.rowcount > 0:
+            stats['rows'] += cursor.rowcount
+
+    threshold = _settings['slow_query_seconds']
+    if threshold is not None and elapsed >= threshold:
+        endpoint = stats['endpoint'] if stats is not None else None
+        if stats is not None:
+            stats['slow'] += 1
+        slow_query_logger.warning('%.1f ms endpoint=%s %s', elapsed * 1000, endpoint or '-',
+                                  ' '.join(statement.split())[:1000])
+
+
+@event.listens_for(Engine, 'handle_error')
+def _discard_timer(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_start'):
+        conn.info['query_start'].pop()
+
+
+def _count_loaded_row(target, context):
+    stats = _current_stats()
+    if stats is not None:
+        stats['rows'] += 1
+
+
+def init_instrumentation(app):
+    """
+    Hook request timing, SQL statement counting and the slow-query log into
+    the app, and expose the aggregates at METRICS_PATH
+    """
+    if not app.config.get('INSTRUMENTATION_ENABLED', True):
+        return
+
+    threshold_ms = app.config.get('SLOW_QUERY_THRESHOLD_MS')
+    _settings['slow_query_seconds'] = threshold_ms / 1000 if threshold_ms is not None else None
+    log_path = app.config.get('SLOW_QUERY_LOG')
+    if log_path and not slow_query_logger.handlers:
+        handler = logging.FileHandler(log_path)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_query_logger.addHandler(handler)
+
+    # SELECT rowcounts are not reported by most drivers, so count ORM-loaded rows
+    from app.models import db
+    if not event.contains(db.Model, 'load', _count_loaded_row):
+        event.listen(db.Model, 'load', _count_loaded_row, propagate=True)
+
+    @app.before_request
+    def start_request_metrics():
+        g.request_started = time.perf_counter()
+        _local.stats = {'endpoint': request.endpoint or 'unmatched', 'statements': 0,
+                        'db_time': 0.0, 'rows': 0, 'slow': 0}
+
+    @app.after_request
+    def record_request_metrics(response):
+        stats = _current_stats()
+        if stats is not None:
+            stats['statements'] = len(request_statements() or ())
+            metrics.record(stats['endpoint'], request.method, response.status_code,
+                           time.perf_counter() - g.request_started, stats)
+        return response
+
+    @app.teardown_request
+    def clear_request_metrics(exc):
+        _local.stats = None
+
+    @app.route(app.config.get('METRICS_PATH', '/metrics'))
+    def prometheus_metrics():
+        return Response(metrics.render() + _cache_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+def _cache_metrics():
+    from app.utils.student_details import student_details_cache
+
+    stats = student_details_cache.stats()
+    return '\n'.join([
+        '# TYPE cache_hits_total counter',
+        f'cache_hits_total{{cache="student_details"}} {stats["hits"]}',
+        '# TYPE cache_misses_total counter',
+        f'cache_misses_total{{cache="student_details"}} {stats["misses"]}',
+        '# TYPE cache_entries gauge',
+        f'cache_entries{{cache="student_details"}} {stats["size"]}',
+    ]) + '\n'
@@ -0,0 +1,248 @@
+import json
+import threading
+import time
+import traceback
+
+from flask import current_app
+from sqlalchemy import and_, or_
+
+from app.models import db, Job
+
+# name -> callable(**payload); registered with @job_handler
+JOB_HANDLERS = {}
+
+
+def job_handler(name):
+    """
+    Register a function as the handler for jobs called `name`.
+    The job payload is passed as keyword arguments; the return value
+    (if JSON-serialisable) is stored as the job result.
+    """
+    def decorator(func):
+        JOB_HANDLERS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, max_attempts=3, delay=0, commit=True, **payload):
+    """
+    Persist a job and return its id. Runs synchronously instead when
+    JOBS_RUN_INLINE is set (useful for tests and single-process setups).
+
+    With commit=False the job is only flushed into the caller's transaction,
+    so it is stored exactly when the caller's rows are; the caller commits
+    and then calls run_if_inline(job_id).
+    """
+    if name not in JOB_HANDLERS:
+        raise ValueError(f'Unknown job: {name}')
+
+    job = Job(
+        name=name,
+        payload=json.dumps(payload),
+        max_attempts=max_attempts,
+        run_after=time.time() + delay
+    )
+    db.session.add(job)
+    if not commit:
+        db.session.flush()
+        return job.job_id
+    db.session.commit()
+
+    run_if_inline(job.job_id)
+    return job.job_id
+
+
+def run_if_inline(job_id):
+    """
+    Run a committed job now when JOBS_RUN_INLINE is set
+    """
+    if current_app.config.get('JOBS_RUN_INLINE'):
+        job = _claim(job_id)
+        if job is not None:
+            _execute(job)
+
+
+def _error_summary(last_error):
+    # The exception line of a stored traceback; the full text stays in the
+    # job row for operators
+    lines = [line for line in (last_error or '').splitlines() if line.strip()]
+    return lines[-1][:200] if lines else None
+
+
+def job_status(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return None
+    return {
+        'job_id': job.job_id,
+        'name': job.name,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'last_error': _error_summary(job.last_error),
+        'result': json.loads(job.result) if job.result else None
+    }
+
+
+def _claimable(now):
+    lock_timeout = current_app.config.get('JOBS_LOCK_TIMEOUT', 300)
+    return or_(
+        and_(Job.status == 'queued', Job.run_after <= now),
+        # Reclaim jobs whose worker died mid-run
+        and_(Job.status == 'running', Job.locked_at < now - lock_timeout)
+    )
+
+
+def _claim(job_id=None):
+    """
+    Atomically move one runnable job to 'running'. The conditional UPDATE
+    makes it safe for several workers (threads or processes) to race.
+    """
+    now = time.time()
+    if job_id is None:
+        job_id = db.session.query(Job.job_id).filter(_claimable(now)) \
+            .order_by(Job.run_after, Job.job_id).limit(1).scalar()
+        if job_id is None:
+            return None
+
+    claimed = db.session.query(Job).filter(Job.job_id == job_id, _claimable(now)).update({
+        Job.status: 'running',
+        Job.locked_at: now,
+        Job.attempts: Job.attempts + 1
+    }, synchronize_session=False)
+    db.session.commit()
+    return db.session.get(Job, job_id) if claimed else None
+
+
+def _execute(job):
+    handler = JOB_HANDLERS.get(job.name)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for {job.name}')
+        result = handler(**json.loads(job.payload))
+        job.status = 'done'
+        job.result = json.dumps(result) if result is not None else None
+        job.last_error = None
+    except Exception:
+        db.session.rollback()
+        job = db.session.get(Job, job.job_id)
+        job.last_error = traceback.format_exc(limit=5)
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+        else:
+            # Exponential backoff: 2, 4, 8... seconds
+            job.status = 'queued'
+            job.run_after = time.time() + 2 ** job.attempts
+    job.locked_at = None
+    db.session.commit()
+    return job.status
+
+
+def run_pending(limit=None):
+    """
+    Run queued jobs on this thread until none are runnable (or `limit` ran).
+    Returns the number of jobs processed.
+    """
+    processed = 0
+    while limit is None or processed < limit:
+        job = _claim()
+        if job is None:
+            break
+        _execute(job)
+        processed += 1
+    return processed
+
+
+def purge_finished_jobs(retention_days=None):
+    """
+    Delete done and failed jobs last scheduled more than `retention_days`
+    (default: JOBS_RETENTION_DAYS) ago. Returns the number of rows deleted.
+    """
+    if retention_days is None:
+        retention_days = current_app.config.get('JOBS_RETENTION_DAYS', 7)
+    cutoff = time.time() - retention_days * 86400
+    deleted = db.session.query(Job).filter(
+        Job.status.in_(('done', 'failed')),
+        Job.run_after < cutoff
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+# Shared by all worker threads in the process, so one of them purges per interval
+_last_purge = {'at': 0.0}
+_purge_lock = threading.Lock()
+
+
+def _purge_if_due():
+    interval = current_app.config.get('JOBS_PURGE_INTERVAL', 3600)
+    with _purge_lock:
+        now = time.time()
+        if now - _last_purge['at'] < interval:
+            return 0
+        _last_purge['at'] = now
+    return purge_finished_jobs()
+
+
+def run_worker(app, threads=2, poll_interval=1.0, stop_event=None):
+    """
+    Process jobs with `threads` worker threads until stop_event is set
+    (or the process is interrupted)
+    """
+    stop_event = stop_event or threading.Event()
+
+    def loop():
+        with app.app_context():
+            while not stop_event.is_set():
+                try:
+                    if not run_pending():
+                        _purge_if_due()
+                        stop_event.wait(poll_interval)
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Job worker error')
+                    stop_event.wait(poll_interval)
+                finally:
+                    db.session.remove()
+
+    workers = [threading.Thread(target=loop, name=f'job-worker-{i}', daemon=True) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    try:
+        while not stop_event.is_set():
+            stop_event.wait(poll_interval)
+    except KeyboardInterrupt:
+        stop_event.set()
+    for worker in workers:
+        worker.join()
+
+
+def start_embedded_workers(app):
+    """
+    Start JOBS_EMBEDDED_WORKERS daemon threads inside the web process,
+    for deployments that do not run `flask run-worker` separately
+    """
+    threads = app.config.get('JOBS_EMBEDDED_WORKERS', 0)
+    if not threads:
+        if not app.config.get('JOBS_RUN_INLINE'):
+            app.logger.warning('JOBS_EMBEDDED_WORKERS is 0: queued jobs (such as student QR codes) '
+                               'only run while `flask run-worker` is running')
+        return None
+    app.logger.info('Starting %d embedded job worker thread(s)', threads)
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=run_worker,
+        args=(app, threads, app.config.get('JOBS_POLL_INTERVAL', 1.0), stop_event),
+        name='job-workers',
+        daemon=True
+    )
+    thread.start()
+    return stop_event
+
+
+@job_handler('render_student_qr')
+def render_student_qr(student_id, register_number):
+    # Imported lazily so workers that never render QR codes skip the imaging stack
+    from app.utils.qr_generator import generate_student_qr_code
+    filename, _ = generate_student_qr_code(student_id, register_number)
+    return {'filename': filename}
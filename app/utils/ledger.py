@@ -0,0 +1,306 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, Student, OffenceType, BehaviouralPoints, DisciplinaryRecord, PointsLedger, PointsSnapshot
+from app.utils.events import mark_points_changed
+
+# Every student starts from this balance; the ledger only holds changes
+STARTING_POINTS = 100
+# Snapshots stay this many seconds behind the newest ledger entry (see take_snapshots)
+SNAPSHOT_LAG = 300
+
+
+def append_entries(entries):
+    """
+    Add ledger entries (dicts with student_id, entry_type, points_delta and
+    optionally record_id, offence_delta, reason, created_by) in one
+    statement, inside the caller's transaction
+    """
+    if entries:
+        db.session.execute(db.insert(PointsLedger), [dict({'offence_delta': 0}, **entry) for entry in entries])
+        mark_points_changed()
+
+
+def deduction_entry(student_id, record_id, points, staff_id=None):
+    return {'student_id': student_id, 'record_id': record_id, 'entry_type': 'deduction',
+            'points_delta': -int(points), 'offence_delta': 1, 'created_by': staff_id}
+
+
+def reverse_record(record_id, staff_id, reason):
+    """
+    Undo a disciplinary record's deduction with a compensating 'reversal'
+    entry (the record and its original entry are kept). Points, offence
+    count and the analytics rollup for the offence's day are corrected in
+    the same transaction. Records of archived academic years are refused.
+    Returns (success, message, entry_id).
+    """
+    from app.utils import analytics
+
+    record = db.session.get(DisciplinaryRecord, record_id)
+    if record is None:
+        # Closed academic years are final: their points were reset or
+        # carried over when they were archived
+        from app.utils.archive import find_records, year_label
+        archived = find_records([record_id]).get(record_id)
+        if archived is not None:
+            return False, (f"Record {record_id} belongs to the archived academic year "
+                           f"{year_label(archived['academic_year'])} and can no longer be reversed"), None
+        return False, "Record not found", None
+
+    entries = db.session.query(PointsLedger.entry_type, PointsLedger.points_delta) \
+        .filter(PointsLedger.record_id == record_id).all()
+    if any(entry_type == 'reversal' for entry_type, _ in entries):
+        return False, "Record has already been reversed", None
+    deducted = -sum(delta for entry_type, delta in entries if entry_type == 'deduction')
+    if not deducted:
+        # Recorded before the ledger existed: reverse what the offence costs now
+        deducted = db.session.query(OffenceType.deduct_points) \
+            .filter(OffenceType.offence_id == record.offence_id).scalar() or 0
+
+    try:
+        entry = PointsLedger(student_id=record.student_id, record_id=record_id, entry_type='reversal',
+                             points_delta=deducted, offence_delta=-1, reason=reason, created_by=staff_id)
+        db.session.add(entry)
+        # Written first: a concurrent reversal of the same record fails here
+        # on uq_points_ledger_reversal before anything else changes
+        db.session.flush()
+        mark_points_changed()
+        if not BehaviouralPoints.apply_deduction(record.student_id, -deducted, offences=-1):
+            raise Exception("Student behavioural record not found")
+        if record.created_at is not None:
+            analytics.record_rollup(record.student_id, record.offence_id, deducted,
+                                    day=record.created_at.date(), direction=-1)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False, "Record has already been reversed", None
+    except Exception:
+        db.session.rollback()
+        raise
+    return True, f"Reversed {deducted} point(s) for record {record_id}", entry.entry_id
+
+
+def adjust_points(student_id, points, staff_id, reason):
+    """
+    Manual correction (positive or negative) that is not tied to an offence.
+    Returns (success, message, entry_id).
+    """
+    # Checked first: the ledger row's foreign key would otherwise fail the
+    # flush with an IntegrityError for a missing student
+    if db.session.query(BehaviouralPoints.bpoints_id).filter_by(student_id=student_id).first() is None:
+        return False, "Student behavioural record not found", None
+    try:
+        entry = PointsLedger(student_id=student_id, entry_type='adjustment', points_delta=int(points),
+                             offence_delta=0, reason=reason, created_by=staff_id)
+        db.session.add(entry)
+        mark_points_changed()
+        if not BehaviouralPoints.apply_deduction(student_id, -int(points), offences=0):
+            db.session.rollback()
+            return False, "Student behavioural record not found", None
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return True, f"Adjusted points by {int(points):+d}", entry.entry_id
+
+
+def backfill_ledger(connection):
+    """
+    Give every disciplinary record without a ledger entry a 'deduction' at
+    its offence's current points, then add one 'adjustment' per student so
+    the ledger balance matches the current behavioural_points row (opening
+    balance for history that predates the ledger). Set-based; run on a
+    connection so migrations can use it too.
+    """
+    ledger = PointsLedger.__table__
+    records = DisciplinaryRecord.__table__
+    offences = OffenceType.__table__
+    points = BehaviouralPoints.__table__
+
+    missing = select(
+        records.c.student_id, records.c.record_id, db.literal('deduction'),
+        -offences.c.deduct_points, db.literal(1), records.c.recorded_by, records.c.created_at
+    ).join(offences, offences.c.offence_id == records.c.offence_id) \
+     .where(~select(ledger.c.entry_id).where(ledger.c.record_id == records.c.record_id).exists()) \
+     .order_by(records.c.created_at, records.c.record_id)
+    connection.execute(ledger.insert().from_select(
+        ['student_id', 'record_id', 'entry_type', 'points_delta', 'offence_delta', 'created_by', 'created_at'],
+        missing
+    ))
+
+    balance = select(
+        ledger.c.student_id,
+        func.sum(ledger.c.points_delta).label('points'),
+        func.sum(ledger.c.offence_delta).label('offences')
+    ).group_by(ledger.c.student_id).subquery()
+    opening = select(
+        points.c.student_id, db.literal('adjustment'),
+        points.c.total_points - STARTING_POINTS - func.coalesce(balance.c.points, 0),
+        points.c.offence_count - func.coalesce(balance.c.offences, 0),
+        db.literal('Opening balance (history before the ledger)')
+    ).select_from(points.outerjoin(balance, balance.c.student_id == points.c.student_id)) \
+     .where(db.or_(points.c.total_points - STARTING_POINTS != func.coalesce(balance.c.points, 0),
+                   points.c.offence_count != func.coalesce(balance.c.offences, 0)))
+    connection.execute(ledger.insert().from_select(
+        ['student_id', 'entry_type', 'points_delta', 'offence_delta', 'reason'], opening
+    ))
+
+
+# Snapshots
+def take_snapshots(chunk_size=1000, lag=SNAPSHOT_LAG):
+    """
+    Snapshot every student whose balance changed since the last run. Only
+    ledger entries above the previous run's high-water mark are read, and
+    each new snapshot builds on the student's previous one, so the cost
+    tracks recent activity rather than total history. Returns the number
+    of snapshots written.
+
+    Entry ids are handed out before commit (on PostgreSQL), so a lower id
+    can become visible after a higher one and would fall below the next
+    run's watermark for good. Like the events tailer, this stays behind the
+    tip: only entries created `lag` seconds before the newest one are
+    covered, by which time any transaction still holding a lower id has
+    committed or rolled back.
+    """
+    watermark = db.session.query(func.max(PointsSnapshot.as_of_entry_id)).scalar() or 0
+    # Both read backwards along the primary key, so only the last `lag`
+    # seconds of entries are walked
+    tip = db.session.query(PointsLedger.created_at).order_by(PointsLedger.entry_id.desc()).limit(1).scalar()
+    if tip is None:
+        return 0
+    high = db.session.query(PointsLedger.entry_id) \
+        .filter(PointsLedger.entry_id > watermark, PointsLedger.created_at <= tip - timedelta(seconds=lag)) \
+        .order_by(PointsLedger.entry_id.desc()).limit(1).scalar()
+    if high is None:
+        return 0
+
+    changes = db.session.query(
+        PointsLedger.student_id,
+        func.max(PointsLedger.entry_id),
+        func.max(PointsLedger.created_at),
+        func.sum(PointsLedger.points_delta),
+        func.sum(PointsLedger.offence_delta)
+    ).filter(PointsLedger.entry_id > watermark, PointsLedger.entry_id <= high) \
+     .group_by(PointsLedger.student_id).all()
+
+    written = 0
+    for start in range(0, len(changes), chunk_size):
+        chunk = changes[start:start + chunk_size]
+        previous = _latest_snapshots([student_id for student_id, *_ in chunk])
+        rows = []
+        for student_id, last_entry, last_created, points_delta, offence_delta in chunk:
+            base = previous.get(student_id)
+            as_of = max(last_created, base.as_of) if base else last_created
+            rows.append({
+                'student_id': student_id,
+                'as_of_entry_id': last_entry,
+                'as_of': as_of,
+                'total_points': (base.total_points if base else STARTING_POINTS) + points_delta,
+                'offence_count': (base.offence_count if base else 0) + offence_delta,
+            })
+        db.session.execute(db.insert(PointsSnapshot), rows)
+        written += len(rows)
+    db.session.commit()
+    return written
+
+
+def _latest_snapshots(student_ids):
+    latest = db.session.query(func.max(PointsSnapshot.snapshot_id)) \
+        .filter(PointsSnapshot.student_id.in_(student_ids)) \
+        .group_by(PointsSnapshot.student_id)
+    return {s.student_id: s for s in PointsSnapshot.query.filter(PointsSnapshot.snapshot_id.in_(latest))}
+
+
+# Point-in-time queries
+def points_at(student_id, at):
+    """
+    A student's points and offence count just before `at`: the latest
+    snapshot covering only earlier entries, plus the entries recorded after
+    it. Returns None if the student does not exist.
+    """
+    if db.session.get(Student, student_id) is None:
+        return None
+
+    snapshot = PointsSnapshot.query \
+        .filter(PointsSnapshot.student_id == student_id, PointsSnapshot.as_of < at) \
+        .order_by(PointsSnapshot.as_of.desc(), PointsSnapshot.snapshot_id.desc()).first()
+    after_entry = snapshot.as_of_entry_id if snapshot else 0
+
+    points_delta, offence_delta, replayed = db.session.query(
+        func.coalesce(func.sum(PointsLedger.points_delta), 0),
+        func.coalesce(func.sum(PointsLedger.offence_delta), 0),
+        func.count(PointsLedger.entry_id)
+    ).filter(PointsLedger.student_id == student_id,
+             PointsLedger.entry_id > after_entry,
+             PointsLedger.created_at < at).one()
+
+    return {
+        'student_id': student_id,
+        'at': at.isoformat(),
+        'total_points': (snapshot.total_points if snapshot else STARTING_POINTS) + points_delta,
+        'offence_count': (snapshot.offence_count if snapshot else 0) + offence_delta,
+        'snapshot_id': snapshot.snapshot_id if snapshot else None,
+        'entries_replayed': replayed
+    }
+
+
+# Reconciliation
+def _ledger_totals(student_id_column):
+    points = select(func.coalesce(func.sum(PointsLedger.points_delta), 0)) \
+        .where(PointsLedger.student_id == student_id_column).scalar_subquery()
+    offences = select(func.coalesce(func.sum(PointsLedger.offence_delta), 0)) \
+        .where(PointsLedger.student_id == student_id_column).scalar_subquery()
+    return STARTING_POINTS + points, offences
+
+
+def _reconcile_range(app, low, high, fix):
+    with app.app_context():
+        expected_points, expected_offences = _ledger_totals(BehaviouralPoints.student_id)
+        in_range = db.and_(BehaviouralPoints.student_id >= low, BehaviouralPoints.student_id < high)
+        mismatched = db.or_(BehaviouralPoints.total_points != expected_points,
+                            BehaviouralPoints.offence_count != expected_offences)
+        rows = db.session.query(
+            BehaviouralPoints.student_id, BehaviouralPoints.total_points, expected_points,
+            BehaviouralPoints.offence_count, expected_offences
+        ).filter(in_range, mismatched).all()
+        if fix and rows:
+            # Recomputed inside the UPDATE so concurrent deductions cannot be lost
+            db.session.execute(
+                db.update(BehaviouralPoints).where(in_range, mismatched)
+                .values(total_points=expected_points, offence_count=expected_offences)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        return [{
+            'student_id': student_id,
+            'total_points': total_points,
+            'ledger_points': ledger_points,
+            'offence_count': offence_count,
+            'ledger_offences': ledger_offences
+        } for student_id, total_points, ledger_points, offence_count, ledger_offences in rows]
+
+
+def reconcile_points(app, fix=False, chunk_size=1000, workers=4):
+    """
+    Compare every behavioural_points row with its ledger balance in
+    student_id ranges processed by a thread pool (each with its own session;
+    the aggregation runs in the database). With fix=True the rows are
+    rebuilt from the ledger. Returns the list of mismatches found.
+    """
+    low, high = db.session.query(func.min(BehaviouralPoints.student_id),
+                                 func.max(BehaviouralPoints.student_id)).one()
+    if low is None:
+        return []
+    ranges = [(start, start + chunk_size) for start in range(low, high + 1, chunk_size)]
+    mismatches = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for found in pool.map(lambda r: _reconcile_range(app, r[0], r[1], fix), ranges):
+            mismatches.extend(found)
+    if fix and mismatches:
+        from app.utils.analytics import rebuild_point_bands
+        rebuild_point_bands()
+        db.session.commit()
+    return mismatches
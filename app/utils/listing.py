@@ -0,0 +1,92 @@
+from app.models import db, User, Student, Staff, BehaviouralPoints, DisciplinaryRecord, PointsLedger
+from app.utils.loading import with_profile
+from app.utils.pagination import keyset_paginate
+
+
+def _apply_profile_filters(query, model, department=None, student_class=None):
+    # Filters shared by every listing that can reach a department/class
+    if department:
+        query = query.filter(model.department == department)
+    if student_class and hasattr(model, 'student_class'):
+        query = query.filter(model.student_class == student_class)
+    return query
+
+
+def list_students(cursor=None, profile='student_view', department=None, student_class=None):
+    """
+    One page of students (with their user row), filtered by department/student_class
+    """
+    query = Student.query.join(User)
+    query = _apply_profile_filters(query, Student, department, student_class)
+    query = with_profile(query, profile)
+    return keyset_paginate(query, [(Student.student_id, False)], cursor)
+
+
+def student_choices():
+    """
+    (student_id, full_name, register_number) for every student, ordered by
+    name, for pickers that must offer all of them (one narrow query, no ORM
+    entities)
+    """
+    return db.session.query(Student.student_id, User.full_name, Student.register_number) \
+        .join(User, User.user_id == Student.user_id) \
+        .order_by(User.full_name, Student.student_id).all()
+
+
+def list_staff(cursor=None, profile='staff_list', department=None):
+    """
+    One page of staff members, filtered by department
+    """
+    query = Staff.query.join(User)
+    query = _apply_profile_filters(query, Staff, department)
+    query = with_profile(query, profile)
+    return keyset_paginate(query, [(Staff.staff_id, False)], cursor)
+
+
+def list_behavioural_points(cursor=None, profile='points_list', department=None, student_class=None):
+    """
+    One page of behavioural points rows, filtered by the student's department/class
+    """
+    query = BehaviouralPoints.query.join(Student).join(User)
+    query = _apply_profile_filters(query, Student, department, student_class)
+    query = with_profile(query, profile)
+    return keyset_paginate(query, [(BehaviouralPoints.bpoints_id, False)], cursor)
+
+
+def list_disciplinary_records(cursor=None, profile='record_list', offence_id=None, student_id=None,
+                              date_from=None, date_to=None, department=None, student_class=None):
+    """
+    One page of disciplinary records, newest first.
+
+    Records are keyed on record_id (monotonic with created_at) so the cursor
+    never depends on how the backend stores timestamps. Supports filtering by
+    offence_id, student_id, date_from/date_to (created_at >= date_from and
+    < date_to) and the student's department/student_class. Only the live
+    table is read; archived academic years are reached through
+    app.utils.archive.
+    """
+    query = DisciplinaryRecord.query
+
+    if offence_id:
+        query = query.filter(DisciplinaryRecord.offence_id == offence_id)
+    if student_id:
+        query = query.filter(DisciplinaryRecord.student_id == student_id)
+    if date_from:
+        query = query.filter(DisciplinaryRecord.created_at >= date_from)
+    if date_to:
+        query = query.filter(DisciplinaryRecord.created_at < date_to)
+    if department or student_class:
+        query = _apply_profile_filters(query.join(Student), Student, department, student_class)
+
+    query = with_profile(query, profile)
+    return keyset_paginate(query, [(DisciplinaryRecord.record_id, True)], cursor)
+
+
+def list_ledger_entries(student_id, cursor=None, entry_type=None):
+    """
+    One page of a student's points ledger, newest first (keyed on entry_id)
+    """
+    query = PointsLedger.query.filter(PointsLedger.student_id == student_id)
+    if entry_type:
+        query = query.filter(PointsLedger.entry_type == entry_type)
+    return keyset_paginate(query, [(PointsLedger.entry_id, True)], cursor)
@@ -0,0 +1,40 @@
+from sqlalchemy.orm import contains_eager, joinedload, load_only, selectinload
+
+from app.models import User, Student, Staff, BehaviouralPoints, DisciplinaryRecord
+
+# Per-endpoint loading strategies. Every relationship a view or serializer
+# touches must be covered here, otherwise it is lazily loaded once per row.
+# Profiles that use contains_eager expect the query to already join the
+# related table (the listing queries in app.utils.listing do).
+LOAD_PROFILES = {
+    # JSON student list: only the columns the serializer reads
+    'student_list': lambda: (
+        load_only(Student.student_id, Student.register_number, Student.student_class),
+        contains_eager(Student.user).load_only(User.full_name),
+    ),
+    # HTML student pages also show points
+    'student_view': lambda: (
+        contains_eager(Student.user),
+        selectinload(Student.behavioural_points),
+    ),
+    'staff_list': lambda: (
+        contains_eager(Staff.user),
+    ),
+    'points_list': lambda: (
+        contains_eager(BehaviouralPoints.student).contains_eager(Student.user),
+    ),
+    'record_list': lambda: (
+        joinedload(DisciplinaryRecord.offence_type),
+        joinedload(DisciplinaryRecord.student).joinedload(Student.user),
+        joinedload(DisciplinaryRecord.recorder).joinedload(Staff.user),
+    ),
+}
+
+
+def with_profile(query, profile):
+    """
+    Apply the named loading profile to a query (no-op when profile is None)
+    """
+    if profile is None:
+        return query
+    return query.options(*LOAD_PROFILES[profile]())
@@ -0,0 +1,130 @@
+import base64
+import json
+from datetime import datetime, date, timedelta
+
+from flask import current_app, request
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(values):
+    """
+    Encode the key values of the last row on a page into an opaque cursor string
+    """
+    payload = [v.isoformat() if isinstance(v, (datetime, date)) else v for v in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """
+    Decode a cursor produced by encode_cursor back into typed key values.
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+    if not isinstance(payload, list) or len(payload) != len(columns):
+        raise ValueError('Invalid cursor')
+
+    values = []
+    for (column, _descending), value in zip(columns, payload):
+        values.append(_cursor_value(column, value))
+    return values
+
+
+def _cursor_value(column, value):
+    # A cursor comes from the client: every value must fit its key column
+    if value is None:
+        if column.nullable:
+            return None
+        raise ValueError('Invalid cursor')
+    python_type = column.type.python_type
+    if python_type is datetime:
+        if not isinstance(value, str):
+            raise ValueError('Invalid cursor')
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError('Invalid cursor')
+    if python_type is int:
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError('Invalid cursor')
+        return value
+    if python_type is str:
+        if not isinstance(value, str):
+            raise ValueError('Invalid cursor')
+        return value
+    raise ValueError('Invalid cursor')
+
+
+def get_page_size():
+    """
+    Read the requested page size from the query string, bounded by the configured maximum
+    """
+    default = current_app.config.get('PAGE_SIZE', 50)
+    maximum = current_app.config.get('MAX_PAGE_SIZE', 500)
+    try:
+        limit = int(request.args.get('limit', default))
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, maximum))
+
+
+def parse_date_arg(name, end=False):
+    """
+    Parse an ISO date/datetime query string argument, returning None if absent.
+    With end=True a bare date is turned into the exclusive bound of that day,
+    so date_to=2024-06-30 includes everything recorded on the 30th.
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid date for {name}: {value}')
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def _after_cursor(columns, values):
+    # Build "row comes after the cursor" for a (possibly mixed direction) key:
+    # (a > x) OR (a = x AND b > y) OR ...
+    clauses = []
+    for i, (column, descending) in enumerate(columns):
+        value = values[i]
+        step = column < value if descending else column > value
+        equals = [c == v for (c, _), v in zip(columns[:i], values[:i])]
+        clauses.append(and_(*equals, step) if equals else step)
+    return or_(*clauses)
+
+
+def keyset_paginate(query, columns, cursor=None, limit=None):
+    """
+    Fetch one page of `query` ordered by the keyset `columns`.
+
+    `columns` is a list of (column, descending) pairs; the last one must be
+    unique (normally the primary key). Returns (rows, next_cursor) where
+    next_cursor is None on the last page. Rows may be entities or tuples,
+    as long as the key columns can be read from them by name.
+    """
+    limit = limit or get_page_size()
+
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        query = query.filter(_after_cursor(columns, values))
+
+    order_by = [column.desc() if descending else column.asc() for column, descending in columns]
+    rows = query.order_by(*order_by).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column, _ in columns])
+
+    return rows, next_cursor
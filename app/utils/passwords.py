@@ -0,0 +1,40 @@
+from functools import lru_cache
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+def hash_password(password, method=None):
+    """
+    Hash with `method` (e.g. 'pbkdf2:sha256:260000'), or werkzeug's default
+    """
+    return generate_password_hash(password, method=method) if method else generate_password_hash(password)
+
+
+@lru_cache(maxsize=None)
+def _method_prefix(method):
+    # werkzeug stores the fully expanded method ('scrypt' -> 'scrypt:32768:8:1')
+    # in front of the salt; hash once to learn what `method` expands to
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+
+def needs_rehash(password_hash, method):
+    """
+    True when `password_hash` was not made with `method` (None means any is fine)
+    """
+    if not method:
+        return False
+    return password_hash.split('$', 1)[0] != _method_prefix(method)
+
+
+def verify_and_upgrade(user, password, method=None):
+    """
+    Check `password` against the user's hash. On success, re-hash it with
+    `method` if the stored hash uses a different algorithm or cost, so
+    changing PASSWORD_HASH_METHOD migrates accounts as they log in. The
+    caller commits.
+    """
+    if not check_password_hash(user.password_hash, password):
+        return False
+    if needs_rehash(user.password_hash, method):
+        user.password_hash = hash_password(password, method)
+    return True
@@ -1,41 +1,293 @@
-import qrcode  # Ensure the qrcode library is installed: pip install qrcode[pil] or use segno
 import os
+import re
+import hashlib
 from io import BytesIO
 import base64
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
-def generate_student_qr_code(student_id, register_number, output_path='static/qrcodes'):
+from app.utils.cache import TTLCache
+
+# Rendering parameters used everywhere unless a caller overrides them
+QR_DEFAULTS = {'box_size': 10, 'border': 4, 'error_correction': 'L'}
+ERROR_CORRECTION = {
+    'L': 'ERROR_CORRECT_L',
+    'M': 'ERROR_CORRECT_M',
+    'Q': 'ERROR_CORRECT_Q',
+    'H': 'ERROR_CORRECT_H'
+}
+FILENAME_PATTERN = re.compile(r'^student_(\d+)_([A-Za-z0-9._-]+)\.png$')
+
+# Content-addressed PNG cache: key is a hash of the encoded data + rendering params
+_memory_cache = TTLCache(maxsize=2048, ttl=24 * 3600)
+_disk_cache_dir = None
+# The disk cache keeps at most max_files PNGs, least recently used (by
+# mtime, refreshed on read) pruned first; checked every PRUNE_EVERY writes
+_disk_cache = {'max_files': 20000, 'writes': 0}
+_disk_cache_lock = threading.Lock()
+PRUNE_EVERY = 100
+
+
+def configure_qr_cache(app):
     """
-    Generate a QR code for a student that links to their points page
-    Returns the filename and base64 encoded image
+    Size the in-memory QR cache and pick the on-disk cache directory from app config
+    """
+    global _disk_cache_dir
+    _memory_cache.configure(maxsize=app.config.get('QR_MEMORY_CACHE_SIZE'))
+    _disk_cache_dir = app.config.get('QR_DISK_CACHE_DIR') or os.path.join(app.instance_path, 'qr_cache')
+    _disk_cache['max_files'] = app.config.get('QR_DISK_CACHE_MAX_FILES', _disk_cache['max_files'])
+
+
+def card_issue_days(student_ids, chunk_size=500):
+    """
+    {student_id: issue day of the student's current card}. The day is stored
+    on the student and reused, so a card's token, PNG, ETag and cache entry
+    stay the same however often it is rendered; a new day is stored (and
+    committed) only for a first card, after a revocation, or once
+    QR_TOKEN_MAX_AGE_DAYS has run out.
     """
-    # Create output directory if it doesn't exist
-    if not os.path.exists(output_path):
-        os.makedirs(output_path)
-    
-    # Create the URL that will be encoded in the QR code
-    qr_url = f"/api/student/{student_id}/qrcode"
-    
-    # Generate QR code
+    from sqlalchemy import update
+    from app.models import db, Student
+    from app.utils.qr_tokens import card_issue_day
+
+    student_ids = [int(s) for s in student_ids]
+    days = {}
+    changed = {}  # new day -> student ids
+    for start in range(0, len(student_ids), chunk_size):
+        rows = db.session.query(Student.student_id, Student.qr_issued_on) \
+            .filter(Student.student_id.in_(student_ids[start:start + chunk_size]))
+        for student_id, stored in rows:
+            days[student_id] = card_issue_day(student_id, stored)
+            if days[student_id] != stored:
+                changed.setdefault(days[student_id], []).append(student_id)
+    for day, ids in changed.items():
+        db.session.execute(update(Student).where(Student.student_id.in_(ids)).values(qr_issued_on=day))
+    if changed:
+        db.session.commit()
+    return days
+
+
+def student_qr_url(student_id, register_number, issued=None):
+    # The URL that will be encoded in the QR code: a signed token that scanners
+    # can check without the database (see app/utils/qr_tokens.py), dated with
+    # the card's stored issue day
+    from app.utils.qr_tokens import issue_token
+    if issued is None:
+        issued = card_issue_days([student_id]).get(int(student_id))
+    return f"/student/qr/t/{issue_token(student_id, register_number, issued)}"
+
+
+def qr_output_dir():
+    """
+    Absolute directory the student QR PNGs are written to and served from
+    (static/qrcodes under the app's static folder, whatever the working directory)
+    """
+    from flask import current_app
+    return os.path.join(current_app.static_folder, 'qrcodes')
+
+
+def qr_filename(student_id, register_number):
+    return f"student_{student_id}_{register_number}.png"
+
+
+def qr_cache_key(data, **params):
+    options = dict(QR_DEFAULTS, **params)
+    material = '|'.join([data] + [f'{k}={options[k]}' for k in sorted(options)])
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def _encode_png(data, box_size, border, error_correction):
+    # qrcode pulls in PIL; imported on first render so processes that only
+    # serve cached PNGs (or none at all) never pay for it
+    import qrcode  # Ensure the qrcode library is installed: pip install qrcode[pil] or use segno
+
     qr = qrcode.QRCode(
         version=1,
-        error_correction=qrcode.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
+        error_correction=getattr(qrcode, ERROR_CORRECTION[error_correction]),
+        box_size=box_size,
+        border=border,
     )
-    qr.add_data(qr_url)
+    qr.add_data(data)
     qr.make(fit=True)
-    
-    # Create QR code image
+
+    # Encode the image to PNG once; files and base64 are both written from these bytes
     img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Save the image
-    filename = f"student_{student_id}_{register_number}.png"
-    filepath = os.path.join(output_path, filename)
-    img.save(filepath)
-    
-    # Also create base64 version for immediate download
     buffered = BytesIO()
     img.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-    
-    return filename, img_str
\ No newline at end of file
+    return buffered.getvalue()
+
+
+def render_qr_png(data, **params):
+    """
+    Return PNG bytes for `data`, served from the memory cache, then the disk
+    cache, and only rendered when neither has it
+    """
+    options = dict(QR_DEFAULTS, **params)
+    key = qr_cache_key(data, **options)
+
+    png = _memory_cache.get(key)
+    if png is not None:
+        return png
+
+    disk_path = os.path.join(_disk_cache_dir, f'{key}.png') if _disk_cache_dir else None
+    png = _read_disk_cache(disk_path) if disk_path else None
+    if png is None:
+        png = _encode_png(data, **options)
+        if disk_path:
+            _write_atomic(disk_path, png)
+            with _disk_cache_lock:
+                _disk_cache['writes'] += 1
+                prune = _disk_cache['writes'] % PRUNE_EVERY == 1
+            if prune:
+                prune_disk_cache()
+
+    _memory_cache.set(key, png)
+    return png
+
+
+def _read_disk_cache(path):
+    try:
+        with open(path, 'rb') as f:
+            png = f.read()
+        os.utime(path)  # mark as recently used
+        return png
+    except FileNotFoundError:
+        return None
+
+
+def prune_disk_cache(max_files=None):
+    """
+    Delete the least recently used PNGs beyond `max_files` (default
+    QR_DISK_CACHE_MAX_FILES) from the disk cache. Returns how many went.
+    """
+    max_files = _disk_cache['max_files'] if max_files is None else max_files
+    if not _disk_cache_dir or max_files is None:
+        return 0
+    try:
+        entries = [entry for entry in os.scandir(_disk_cache_dir) if entry.name.endswith('.png')]
+    except FileNotFoundError:
+        return 0
+    if len(entries) <= max_files:
+        return 0
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    removed = 0
+    for entry in entries[:len(entries) - max_files]:
+        try:
+            os.remove(entry.path)
+            removed += 1
+        except FileNotFoundError:
+            pass  # another process pruned it first
+    return removed
+
+
+def _write_atomic(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def generate_student_qr_code(student_id, register_number, output_path=None):
+    """
+    Generate a QR code for a student that links to their points page
+    (written to qr_output_dir() by default)
+    Returns the filename and base64 encoded image
+    """
+    png = render_qr_png(student_qr_url(student_id, register_number))
+
+    # Save the image
+    filename = qr_filename(student_id, register_number)
+    _write_atomic(os.path.join(output_path or qr_output_dir(), filename), png)
+
+    # Also create base64 version for immediate download
+    img_str = base64.b64encode(png).decode()
+
+    return filename, img_str
+
+
+def _render_student(student):
+    student_id, register_number, url = student
+    return student_id, register_number, render_qr_png(url)
+
+
+def generate_qr_batch(students, output_path=None, workers=None, sheet_path=None, columns=4, rows=5):
+    """
+    Render QR codes for many students in a process pool.
+
+    `students` is an iterable of (student_id, register_number) pairs. Each
+    code is written to `output_path` (default: qr_output_dir()); if
+    `sheet_path` is given, the codes are also laid out on printable grid
+    pages labelled with register numbers. Returns the list of written filenames.
+    """
+    output_path = output_path or qr_output_dir()
+    os.makedirs(output_path, exist_ok=True)
+    filenames = []
+    rendered = []
+
+    # Tokens are signed here, so the signing keys never have to reach the workers
+    students = list(students)
+    issued = card_issue_days([student_id for student_id, _ in students])
+    signed = ((student_id, register_number, student_qr_url(student_id, register_number, issued.get(student_id)))
+              for student_id, register_number in students)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for student_id, register_number, png in pool.map(_render_student, signed, chunksize=32):
+            filename = qr_filename(student_id, register_number)
+            _write_atomic(os.path.join(output_path, filename), png)
+            filenames.append(filename)
+            if sheet_path:
+                rendered.append((register_number, png))
+
+    if sheet_path and rendered:
+        render_qr_sheet(rendered, sheet_path, columns=columns, rows=rows)
+
+    return filenames
+
+
+# Sheets are sized for A4 portrait: 210 x 297 mm
+A4_WIDTH_INCHES = 8.27
+
+
+def render_qr_sheet(entries, sheet_path, columns=4, rows=5, label_height=24):
+    """
+    Lay out (label, png_bytes) entries on printable grid pages of
+    `columns` x `rows` codes, decoding one page at a time.
+
+    A `.pdf` sheet_path gets one A4 page per grid; anything else is written
+    as one PNG per page (`sheet-1.png`, `sheet-2.png`, ..., or just
+    `sheet_path` when everything fits on one page). Returns the written paths.
+    """
+    from PIL import Image, ImageDraw
+
+    per_page = columns * rows
+    pages = [entries[start:start + per_page] for start in range(0, len(entries), per_page)]
+    as_pdf = sheet_path.lower().endswith('.pdf')
+    stem, ext = os.path.splitext(sheet_path)
+    os.makedirs(os.path.dirname(os.path.abspath(sheet_path)), exist_ok=True)
+
+    written = []
+    for number, page in enumerate(pages, start=1):
+        images = [(label, Image.open(BytesIO(png)).convert('RGB')) for label, png in page]
+        cell_w = max(img.width for _, img in images)
+        cell_h = max(img.height for _, img in images) + label_height
+
+        # Every page keeps the full grid size, so pages print at the same scale
+        sheet = Image.new('RGB', (cell_w * columns, cell_h * rows), 'white')
+        draw = ImageDraw.Draw(sheet)
+        for index, (label, img) in enumerate(images):
+            x = (index % columns) * cell_w
+            y = (index // columns) * cell_h
+            sheet.paste(img, (x, y))
+            draw.text((x + 10, y + img.height + 4), str(label), fill='black')
+
+        if as_pdf:
+            sheet.save(sheet_path, 'PDF', resolution=sheet.width / A4_WIDTH_INCHES, append=number > 1)
+            if number == 1:
+                written.append(sheet_path)
+        else:
+            path = sheet_path if len(pages) == 1 else f'{stem}-{number}{ext or ".png"}'
+            sheet.save(path)
+            written.append(path)
+        sheet.close()
+
+    return written
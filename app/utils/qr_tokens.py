@@ -0,0 +1,265 @@
+import base64
+import hashlib
+import hmac
+import struct
+import threading
+import time
+from datetime import date, timedelta
+
+from app.models import db, RevokedQRToken, RefDataVersion
+from app.utils.refdata import bump_reference_version
+
+# Student QR codes carry a signed token instead of a bare id:
+#
+#     <key id>.<payload>.<signature>      (base64url, no padding)
+#
+# payload = format version (1 byte), student_id (4), issue day (2, days
+# since 1970-01-01), register number (UTF-8); signature = HMAC-SHA256 over
+# "<key id>.<payload>" truncated to 16 bytes. Verification needs only the
+# keys and the in-memory revocation list, never the database.
+TOKEN_VERSION = 1
+SIGNATURE_BYTES = 16
+_HEADER = struct.Struct('>BIH')
+_EPOCH = date(1970, 1, 1)
+REVOCATIONS_KEY = 'qr_revocations'
+
+_settings = {'max_age_days': None, 'refresh_interval': 10.0}
+_keys = {'active': None, 'macs': {}}  # key id -> keyed hmac object (copied per use)
+_revocations = {
+    'not_before': {},   # student_id -> first issue day still accepted
+    'version': None,
+    'refreshed_at': None,
+    'thread': None,
+}
+_lock = threading.Lock()
+_loaded = threading.Event()
+# Seconds the first scan in a process waits for the revocation list
+INITIAL_LOAD_TIMEOUT = 5.0
+
+
+class QRToken:
+    __slots__ = ('student_id', 'register_number', 'issued', 'key_id')
+
+    def __init__(self, student_id, register_number, issued, key_id):
+        self.student_id = student_id
+        self.register_number = register_number
+        self.issued = issued
+        self.key_id = key_id
+
+    def to_dict(self):
+        return {
+            'student_id': self.student_id,
+            'register_number': self.register_number,
+            'issued': self.issued.isoformat(),
+            'key_id': self.key_id
+        }
+
+
+class InvalidQRToken(Exception):
+    """
+    A token that does not verify; `reason` is one of malformed,
+    unknown_key, bad_signature, expired, not_yet_valid or revoked
+    """
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def parse_signing_keys(spec, secret_key):
+    """
+    "kid:secret,kid:secret" -> [(kid, secret bytes)], newest (signing) key
+    first. Without a spec a single key 'k0' is derived from SECRET_KEY.
+    """
+    if not spec:
+        derived = hmac.new(secret_key.encode(), b'student-qr-token', hashlib.sha256).digest()
+        return [('k0', derived)]
+    keys = []
+    for item in spec.split(','):
+        kid, _, secret = item.strip().partition(':')
+        if not kid or not secret or '.' in kid:
+            raise ValueError(f'Invalid QR signing key entry: {item!r} (expected kid:secret)')
+        keys.append((kid, secret.encode()))
+    return keys
+
+
+def configure_qr_tokens(app):
+    """
+    Load signing keys and settings. To rotate, put the new key first in
+    QR_SIGNING_KEYS and keep the old one after it until every card signed
+    with it has been reissued, then drop it.
+    """
+    keys = parse_signing_keys(app.config.get('QR_SIGNING_KEYS'), app.config['SECRET_KEY'])
+    _keys['macs'] = {kid: hmac.new(secret, digestmod=hashlib.sha256) for kid, secret in keys}
+    _keys['active'] = keys[0][0]
+    _settings['max_age_days'] = app.config.get('QR_TOKEN_MAX_AGE_DAYS')
+    _settings['refresh_interval'] = app.config.get('QR_REVOCATION_REFRESH', _settings['refresh_interval'])
+    _settings['app'] = app
+
+
+def _sign(key_id, signed_part):
+    mac = _keys['macs'][key_id].copy()
+    mac.update(signed_part)
+    return mac.digest()[:SIGNATURE_BYTES]
+
+
+def issue_token(student_id, register_number, issued=None):
+    """
+    Signed token for a student's card with the active key. The issue day
+    defaults to today, moved forward past any revocation so a reissued
+    card is accepted.
+    """
+    _ensure_revocations()
+    issued = issued or date.today()
+    not_before = _revocations['not_before'].get(int(student_id))
+    if not_before is not None and issued < not_before:
+        issued = not_before
+    payload = _HEADER.pack(TOKEN_VERSION, int(student_id), (issued - _EPOCH).days) + register_number.encode()
+    signed_part = f"{_keys['active']}.{_b64encode(payload)}"
+    return f"{signed_part}.{_b64encode(_sign(_keys['active'], signed_part.encode()))}"
+
+
+def card_issue_day(student_id, stored=None, today=None):
+    """
+    Issue day for a student's card: the `stored` one (Student.qr_issued_on)
+    while a card dated that day is still accepted, otherwise the day a new
+    card gets (today, or the day after a revocation)
+    """
+    _ensure_revocations()
+    today = today or date.today()
+    not_before = _revocations['not_before'].get(int(student_id))
+    max_age = _settings['max_age_days']
+    if (stored is not None and (not_before is None or stored >= not_before)
+            and (max_age is None or (today - stored).days < max_age)):
+        return stored
+    if not_before is not None and today < not_before:
+        return not_before
+    return today
+
+
+def verify_token(token, today=None):
+    """
+    Validate and decode a token using only memory. Returns a QRToken or
+    raises InvalidQRToken.
+    """
+    try:
+        signed_part, _, signature = token.rpartition('.')
+        key_id, _, payload_text = signed_part.partition('.')
+        signature = _b64decode(signature)
+        payload = _b64decode(payload_text)
+    except (ValueError, AttributeError):
+        raise InvalidQRToken('malformed')
+    if not key_id or len(payload) <= _HEADER.size:
+        raise InvalidQRToken('malformed')
+    if key_id not in _keys['macs']:
+        raise InvalidQRToken('unknown_key')
+    if not hmac.compare_digest(_sign(key_id, signed_part.encode()), signature):
+        raise InvalidQRToken('bad_signature')
+
+    version, student_id, issued_day = _HEADER.unpack_from(payload)
+    if version != TOKEN_VERSION:
+        raise InvalidQRToken('malformed')
+    issued = _EPOCH + timedelta(days=issued_day)
+    today = today or date.today()
+    # Reissued cards may be dated one day ahead (see issue_token)
+    if issued > today + timedelta(days=1):
+        raise InvalidQRToken('not_yet_valid')
+    max_age = _settings['max_age_days']
+    if max_age is not None and (today - issued).days > max_age:
+        raise InvalidQRToken('expired')
+
+    _ensure_revocations()
+    not_before = _revocations['not_before'].get(student_id)
+    if not_before is not None and issued < not_before:
+        raise InvalidQRToken('revoked')
+    return QRToken(student_id, payload[_HEADER.size:].decode(errors='replace'), issued, key_id)
+
+
+# Revocation list
+def _stored_version():
+    return db.session.query(RefDataVersion.version).filter(RefDataVersion.name == REVOCATIONS_KEY).scalar() or 0
+
+
+def load_revocations():
+    """
+    (Re)load the whole revocation list if its version stamp moved
+    """
+    with _settings['app'].app_context():
+        version = _stored_version()
+        if version != _revocations['version']:
+            not_before = dict(db.session.query(RevokedQRToken.student_id, RevokedQRToken.not_before))
+            with _lock:
+                _revocations['not_before'] = not_before
+                _revocations['version'] = version
+        _revocations['refreshed_at'] = time.monotonic()
+
+
+def _refresh_loop():
+    while True:
+        try:
+            load_revocations()
+        except Exception:
+            # Keep verifying against the last list we have
+            _settings['app'].logger.exception('Could not refresh the QR revocation list')
+        _loaded.set()
+        time.sleep(_settings['refresh_interval'])
+
+
+def _ensure_revocations():
+    # A background thread loads the list and keeps it current, so scans
+    # never query the database themselves; only the first scan in a process
+    # waits (briefly) for the initial load
+    thread = _revocations['thread']
+    if thread is None or not thread.is_alive():
+        with _lock:
+            thread = _revocations['thread']
+            if thread is None or not thread.is_alive():
+                _loaded.clear()
+                thread = threading.Thread(target=_refresh_loop, name='qr-revocation-refresh', daemon=True)
+                _revocations['thread'] = thread
+                thread.start()
+    if not _loaded.is_set():
+        _loaded.wait(INITIAL_LOAD_TIMEOUT)
+
+
+def revoke_student_tokens(student_id, staff_id=None, reason=None, not_before=None):
+    """
+    Reject every token issued to a student before `not_before` (default:
+    tomorrow, so all current cards stop working and a card reissued today
+    is dated tomorrow). Other processes pick it up within
+    QR_REVOCATION_REFRESH seconds. Returns the not_before date.
+    """
+    not_before = not_before or date.today() + timedelta(days=1)
+    revocation = db.session.get(RevokedQRToken, student_id)
+    if revocation is None:
+        revocation = RevokedQRToken(student_id=student_id)
+        db.session.add(revocation)
+    revocation.not_before = not_before
+    revocation.reason = reason
+    revocation.revoked_by = staff_id
+    db.session.flush()
+    bump_reference_version(db.session.connection(), REVOCATIONS_KEY)
+    db.session.commit()
+
+    with _lock:
+        _revocations['not_before'] = {**_revocations['not_before'], student_id: not_before}
+    return not_before
+
+
+def token_stats():
+    refreshed_at = _revocations['refreshed_at']
+    return {
+        'active_key': _keys['active'],
+        'keys': sorted(_keys['macs']),
+        'revoked_students': len(_revocations['not_before']),
+        'revocations_version': _revocations['version'],
+        'revocations_age_seconds': round(time.monotonic() - refreshed_at, 1) if refreshed_at else None
+    }
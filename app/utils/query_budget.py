@@ -0,0 +1,120 @@
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _active_counters():
+    if not hasattr(_local, 'counters'):
+        _local.counters = []
+    return _local.counters
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    # Feeds every active counter: budgets, count_queries and request metrics
+    for counter in _active_counters():
+        counter.append(statement)
+
+
+def request_statements():
+    """
+    Statements the current request has issued on this thread so far, or
+    None outside a request
+    """
+    return getattr(_local, 'request_counter', None)
+
+
+@contextmanager
+def count_queries():
+    """
+    Collect every SQL statement executed on this thread inside the block.
+    Yields a list that is filled in as statements run.
+    """
+    statements = []
+    counters = _active_counters()
+    counters.append(statements)
+    try:
+        yield statements
+    finally:
+        counters.remove(statements)
+
+
+def query_budget(max_queries):
+    """
+    Declare the maximum number of SQL statements a view may issue,
+    independent of how many rows it returns. The decorator only records
+    the budget; init_query_budget's after_request hook compares each
+    request's count with it, raising QueryBudgetExceeded when
+    QUERY_BUDGET_ENFORCE is on (the default under testing/debug) and
+    logging a warning otherwise. `flask check-query-budgets` checks every
+    budgeted GET endpoint in one run.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            return view(*args, **kwargs)
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
+
+
+def _budget_for_endpoint(app, endpoint):
+    view = app.view_functions.get(endpoint)
+    return getattr(view, 'query_budget', None)
+
+
+def init_query_budget(app):
+    """
+    Count statements per request and enforce declared budgets when
+    QUERY_BUDGET_ENFORCE is set (defaults to on for testing/debug)
+    """
+    @app.before_request
+    def start_query_count():
+        _local.request_counter = []
+        _active_counters().append(_local.request_counter)
+
+    @app.after_request
+    def check_query_count(response):
+        statements = getattr(_local, 'request_counter', None)
+        if statements is None:
+            return response
+        budget = _budget_for_endpoint(current_app, request.endpoint)
+        if budget is not None and len(statements) > budget:
+            message = (f'{request.endpoint} issued {len(statements)} queries '
+                       f'(budget {budget})')
+            enforce = current_app.config.get('QUERY_BUDGET_ENFORCE')
+            if enforce is None:
+                enforce = current_app.testing or current_app.debug
+            if enforce:
+                raise QueryBudgetExceeded(message + ':\n' + '\n'.join(statements))
+            current_app.logger.warning(message)
+        return response
+
+    @app.teardown_request
+    def stop_query_count(exc):
+        statements = getattr(_local, 'request_counter', None)
+        if statements is not None:
+            _active_counters().remove(statements)
+            _local.request_counter = None
+
+
+def budgeted_endpoints(app):
+    """
+    (endpoint, rule, budget, argument names) for every GET route that
+    declares a budget; routes with URL arguments need values filled in
+    (e.g. with url_for) before they can be called
+    """
+    for rule in app.url_map.iter_rules():
+        budget = _budget_for_endpoint(app, rule.endpoint)
+        if budget is not None and 'GET' in rule.methods:
+            yield rule.endpoint, rule.rule, budget, sorted(rule.arguments)
@@ -0,0 +1,182 @@
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, OffenceType, Role, RefDataVersion
+from app.db_engine import RoutingSession
+
+# Offence types and roles change a few times a year, so each process keeps
+# them in memory. Any ORM write to either table bumps a version row in the
+# same transaction; workers compare it at most every check_interval seconds
+# and reload when it moved. Lookups that miss fall back to the database.
+REFDATA_KEY = 'refdata'
+
+_lock = threading.Lock()
+_state = {
+    'loaded': False,
+    'version': None,
+    'checked_at': 0.0,
+    'check_interval': 5.0,
+    'offences': {},      # offence_id -> dict
+    'offence_list': [],  # dicts ordered by offence_id
+    'roles': {},         # role_name -> role_id
+}
+
+
+def _stored_version():
+    return db.session.query(RefDataVersion.version).filter(RefDataVersion.name == REFDATA_KEY).scalar() or 0
+
+
+def load_reference_data():
+    """
+    (Re)load offence types and roles with the current version stamp
+    """
+    version = _stored_version()
+    offence_list = [{
+        'offence_id': o.offence_id,
+        'offence_name': o.offence_name,
+        'deduct_points': o.deduct_points,
+        'description': o.description
+    } for o in db.session.query(OffenceType).order_by(OffenceType.offence_id)]
+    roles = {role_name: role_id for role_id, role_name in db.session.query(Role.role_id, Role.role_name)}
+
+    with _lock:
+        _state['offence_list'] = offence_list
+        _state['offences'] = {o['offence_id']: o for o in offence_list}
+        _state['roles'] = roles
+        _state['version'] = version
+        _state['checked_at'] = time.monotonic()
+        _state['loaded'] = True
+
+
+def _ensure_current():
+    if not _state['loaded']:
+        load_reference_data()
+        return
+    if time.monotonic() - _state['checked_at'] < _state['check_interval']:
+        return
+    if _stored_version() != _state['version']:
+        load_reference_data()
+    else:
+        _state['checked_at'] = time.monotonic()
+
+
+def reference_version():
+    _ensure_current()
+    return _state['version']
+
+
+def list_offences():
+    """
+    All offence types as dicts, ordered by offence_id
+    """
+    _ensure_current()
+    return _state['offence_list']
+
+
+def get_offence(offence_id):
+    """
+    One offence type as a dict, or None if it does not exist. A miss goes to
+    the database (e.g. a type added moments ago by another worker).
+    """
+    _ensure_current()
+    offence_id = int(offence_id)
+    offence = _state['offences'].get(offence_id)
+    if offence is None and db.session.get(OffenceType, offence_id) is not None:
+        load_reference_data()
+        offence = _state['offences'].get(offence_id)
+    return offence
+
+
+def get_offence_points(offence_id):
+    """
+    Points deducted for an offence type, or None if it does not exist
+    """
+    offence = get_offence(offence_id)
+    return offence['deduct_points'] if offence else None
+
+
+def get_role_id(role_name):
+    """
+    role_id for a role name, or None if there is no such role
+    """
+    _ensure_current()
+    role_id = _state['roles'].get(role_name)
+    if role_id is None:
+        role_id = db.session.query(Role.role_id).filter(Role.role_name == role_name).scalar()
+        if role_id is not None:
+            load_reference_data()
+    return role_id
+
+
+def invalidate_reference_data():
+    """
+    Force a reload on next access in this process
+    """
+    with _lock:
+        _state['loaded'] = False
+
+
+def bump_reference_version(connection, name=REFDATA_KEY):
+    """
+    Increment a version stamp (the reference data one by default; other
+    per-process caches keep their own rows)
+    """
+    bump = db.update(RefDataVersion).where(RefDataVersion.name == name) \
+        .values(version=RefDataVersion.version + 1)
+    if connection.execute(bump).rowcount:
+        return
+    # First bump for this name: create the row without failing when another
+    # worker creates it at the same moment, then bump whichever row exists
+    _insert_version_row(connection, name)
+    connection.execute(bump)
+
+
+def _insert_version_row(connection, name):
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = (postgresql if dialect == 'postgresql' else sqlite).insert(RefDataVersion)
+        connection.execute(insert.values(name=name, version=0).on_conflict_do_nothing(index_elements=['name']))
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(db.insert(RefDataVersion).values(name=name, version=0))
+    except IntegrityError:
+        pass
+
+
+def _touches_reference_data(session):
+    changed = list(session.new) + list(session.deleted) + \
+        [obj for obj in session.dirty if session.is_modified(obj)]
+    return any(isinstance(obj, (OffenceType, Role)) for obj in changed)
+
+
+def _stamp_reference_writes(session, flush_context, instances):
+    # Runs before the flush is written, so the bump shares its transaction
+    if _touches_reference_data(session):
+        bump_reference_version(session.connection())
+        session.info['refdata_changed'] = True
+
+
+def _reload_after_commit(session):
+    if session.info.pop('refdata_changed', False):
+        invalidate_reference_data()
+
+
+def _forget_on_rollback(session, previous_transaction):
+    session.info.pop('refdata_changed', None)
+
+
+def init_refdata(app):
+    """
+    Register the version-stamping hooks. The cache itself is loaded lazily,
+    by the first lookup in each process (see _ensure_current).
+    """
+    _state['check_interval'] = app.config.get('REFDATA_CHECK_INTERVAL', 5.0)
+    if not event.contains(RoutingSession, 'before_flush', _stamp_reference_writes):
+        event.listen(RoutingSession, 'before_flush', _stamp_reference_writes)
+        event.listen(RoutingSession, 'after_commit', _reload_after_commit)
+        event.listen(RoutingSession, 'after_soft_rollback', _forget_on_rollback)
@@ -0,0 +1,270 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
+
+from app.models import db, User, Student, Staff, OffenceType, BehaviouralPoints, DisciplinaryRecord, PointsLedger
+from app.utils.qr_generator import card_issue_days, render_qr_png, student_qr_url, _write_atomic
+
+# Font used for all text; REPORT_FONT_PATH swaps in a TTF (e.g. for non-Latin names)
+_font = {'regular': 'Helvetica', 'bold': 'Helvetica-Bold', 'path': None}
+_settings = {'title': 'Student Behaviour Report'}
+
+
+def reports_supported():
+    try:
+        import reportlab  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def configure_reports(app):
+    """
+    Pick the report title and font from app config (before any worker forks)
+    """
+    _settings['title'] = app.config.get('REPORT_TITLE') or _settings['title']
+    _font['path'] = app.config.get('REPORT_FONT_PATH')
+
+
+def report_filename(student_id, register_number):
+    return f"report_{student_id}_{register_number}.pdf"
+
+
+def load_report_data(student_ids):
+    """
+    Everything needed to render the reports of `student_ids` as plain dicts,
+    in two queries (profiles + points, then the points ledger with each
+    deduction's and reversal's record; archived records are looked up in
+    their archives). The result is picklable so rendering can happen in
+    other processes.
+    """
+    student_ids = [int(s) for s in student_ids]
+    if not student_ids:
+        return []
+
+    profiles = db.session.query(
+        Student.student_id, Student.register_number, Student.department, Student.student_class,
+        Student.parent_name, Student.parent_contact, User.full_name, User.gender,
+        BehaviouralPoints.total_points, BehaviouralPoints.offence_count
+    ).join(User, User.user_id == Student.user_id) \
+     .outerjoin(BehaviouralPoints, BehaviouralPoints.student_id == Student.student_id) \
+     .filter(Student.student_id.in_(student_ids))
+    reports = {row.student_id: dict(row._asdict(), entries=[]) for row in profiles}
+
+    # Every ledger entry, so the listed points add up to the balance: what
+    # each deduction actually took (not the offence's current points),
+    # reversals, and manual adjustments
+    entry_staff, entry_staff_user = aliased(Staff), aliased(User)
+    record_staff, record_staff_user = aliased(Staff), aliased(User)
+    history = db.session.query(
+        PointsLedger.student_id, PointsLedger.record_id, PointsLedger.entry_type, PointsLedger.points_delta,
+        PointsLedger.reason, PointsLedger.created_at, OffenceType.offence_name,
+        DisciplinaryRecord.description, DisciplinaryRecord.action_taken,
+        func.coalesce(entry_staff_user.full_name, record_staff_user.full_name).label('recorded_by')
+    ).outerjoin(DisciplinaryRecord, DisciplinaryRecord.record_id == PointsLedger.record_id) \
+     .outerjoin(OffenceType, OffenceType.offence_id == DisciplinaryRecord.offence_id) \
+     .outerjoin(entry_staff, entry_staff.staff_id == PointsLedger.created_by) \
+     .outerjoin(entry_staff_user, entry_staff_user.user_id == entry_staff.user_id) \
+     .outerjoin(record_staff, record_staff.staff_id == DisciplinaryRecord.recorded_by) \
+     .outerjoin(record_staff_user, record_staff_user.user_id == record_staff.user_id) \
+     .filter(PointsLedger.student_id.in_(list(reports))) \
+     .order_by(PointsLedger.student_id, PointsLedger.entry_id.desc())
+    archived_ids = set()
+    for row in history:
+        entry = row._asdict()
+        if entry['record_id'] is not None and entry['offence_name'] is None:
+            archived_ids.add(entry['record_id'])
+        reports[entry.pop('student_id')]['entries'].append(entry)
+
+    if archived_ids:
+        from app.utils.archive import find_records
+        archived = find_records(archived_ids)
+        for report in reports.values():
+            for entry in report['entries']:
+                record = archived.get(entry['record_id']) if entry['offence_name'] is None else None
+                if record is not None:
+                    entry.update(offence_name=record['offence_name'], description=record['description'],
+                                 action_taken=record['action_taken'])
+
+    # Signed here rather than in the render workers, which have no keys
+    issued = card_issue_days(list(reports))
+    for report in reports.values():
+        report['qr_url'] = student_qr_url(report['student_id'], report['register_number'],
+                                          issued.get(report['student_id']))
+    return [reports[s] for s in student_ids if s in reports]
+
+
+@lru_cache(maxsize=None)
+def _fonts():
+    # Registering (and parsing) a TTF is the slowest part of a small document,
+    # so it happens once per process rather than once per report
+    if _font['path']:
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+
+        pdfmetrics.registerFont(TTFont('ReportFont', _font['path']))
+        return 'ReportFont', 'ReportFont'
+    return _font['regular'], _font['bold']
+
+
+@lru_cache(maxsize=None)
+def _template():
+    """
+    Styles and table layout shared by every report in this process
+    """
+    from reportlab.lib import colors
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.platypus import TableStyle
+
+    regular, bold = _fonts()
+    return {
+        'title': ParagraphStyle('title', fontName=bold, fontSize=16, leading=20, spaceAfter=6),
+        'heading': ParagraphStyle('heading', fontName=bold, fontSize=11, leading=14, spaceBefore=10, spaceAfter=4),
+        'body': ParagraphStyle('body', fontName=regular, fontSize=9, leading=11),
+        'cell': ParagraphStyle('cell', fontName=regular, fontSize=8, leading=10),
+        'profile': TableStyle([
+            ('FONT', (0, 0), (-1, -1), regular, 9),
+            ('FONT', (0, 0), (0, -1), bold, 9),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+        ]),
+        'history': TableStyle([
+            ('FONT', (0, 0), (-1, 0), bold, 8),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e8e8e8')),
+            ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('ALIGN', (2, 1), (2, -1), 'RIGHT'),
+        ]),
+    }
+
+
+def _format_date(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    return str(value or '')[:10]
+
+
+def _entry_title(entry):
+    offence = entry['offence_name'] or 'Offence'
+    if entry['entry_type'] == 'deduction':
+        return offence
+    if entry['entry_type'] == 'reversal':
+        return f'{offence} (reversed)'
+    return 'Adjustment'
+
+
+def _entry_description(entry):
+    # Reversals and adjustments carry their own reason
+    if entry['entry_type'] == 'deduction':
+        return entry['description'] or ''
+    return entry['reason'] or ''
+
+
+def render_report_card(report):
+    """
+    Render one report (a dict from load_report_data) to PDF bytes
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Image, LongTable, Paragraph, SimpleDocTemplate, Spacer, Table
+
+    styles = _template()
+    buffered = BytesIO()
+    document = SimpleDocTemplate(buffered, pagesize=A4, leftMargin=15 * mm, rightMargin=15 * mm,
+                                 topMargin=15 * mm, bottomMargin=15 * mm,
+                                 title=f"{_settings['title']} - {report['register_number']}")
+
+    points = report['total_points'] if report['total_points'] is not None else 100
+    profile = Table([
+        ['Name', report['full_name']],
+        ['Register number', report['register_number']],
+        ['Department / class', f"{report['department']} / {report['student_class']}"],
+        ['Parent', f"{report['parent_name']} ({report['parent_contact']})"],
+        ['Behaviour points', str(points)],
+        ['Offences recorded', str(report['offence_count'] or 0)],
+    ], colWidths=[40 * mm, 85 * mm], style=styles['profile'])
+    # The QR code comes from the shared PNG cache, so repeated runs do not re-encode it
+    qr = Image(BytesIO(render_qr_png(report['qr_url'])), width=35 * mm, height=35 * mm)
+
+    story = [
+        Paragraph(escape(_settings['title']), styles['title']),
+        Paragraph(f"Generated {datetime.now().strftime('%Y-%m-%d')}", styles['body']),
+        Spacer(1, 4 * mm),
+        Table([[profile, qr]], colWidths=[130 * mm, 50 * mm]),
+        Paragraph('Points history', styles['heading']),
+    ]
+
+    if report['entries']:
+        rows = [['Date', 'Entry', 'Points', 'Description', 'Action taken', 'Recorded by']]
+        for entry in report['entries']:
+            rows.append([
+                _format_date(entry['created_at']),
+                Paragraph(escape(_entry_title(entry)), styles['cell']),
+                f"{entry['points_delta']:+d}",
+                Paragraph(escape(_entry_description(entry)), styles['cell']),
+                Paragraph(escape(entry['action_taken'] or ''), styles['cell']),
+                Paragraph(escape(entry['recorded_by'] or ''), styles['cell']),
+            ])
+        story.append(LongTable(rows, colWidths=[20 * mm, 32 * mm, 14 * mm, 50 * mm, 36 * mm, 28 * mm],
+                               repeatRows=1, style=styles['history']))
+    else:
+        story.append(Paragraph('No points changes recorded.', styles['body']))
+
+    document.build(story)
+    return buffered.getvalue()
+
+
+def _render_to_file(args):
+    report, output_path = args
+    filename = report_filename(report['student_id'], report['register_number'])
+    _write_atomic(os.path.join(output_path, filename), render_report_card(report))
+    return filename
+
+
+def iter_report_batches(department=None, student_class=None, batch_size=200):
+    """
+    Yield load_report_data() batches for a department and/or class, keyed on
+    student_id so only one batch of history is held in memory at a time
+    """
+    last_id = 0
+    while True:
+        query = db.session.query(Student.student_id).filter(Student.student_id > last_id)
+        if department:
+            query = query.filter(Student.department == department)
+        if student_class:
+            query = query.filter(Student.student_class == student_class)
+        ids = [student_id for (student_id,) in query.order_by(Student.student_id).limit(batch_size)]
+        if not ids:
+            return
+        yield load_report_data(ids)
+        last_id = ids[-1]
+
+
+def generate_report_batch(batches, output_path='pdf/reports', workers=None):
+    """
+    Render report cards from an iterable of load_report_data() batches in a
+    process pool, writing one PDF per student to `output_path`. The database
+    is only read in this process; workers just render. Returns the list of
+    written filenames.
+    """
+    os.makedirs(output_path, exist_ok=True)
+    filenames = []
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Submit a batch, then load the next one while the workers render it
+        pending = None
+        for batch in batches:
+            submitted = pool.map(_render_to_file, [(report, output_path) for report in batch], chunksize=16)
+            if pending is not None:
+                filenames.extend(pending)
+            pending = submitted
+        if pending is not None:
+            filenames.extend(pending)
+
+    return filenames
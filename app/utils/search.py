@@ -0,0 +1,226 @@
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+
+from app.models import db, User, Student, DisciplinaryRecord
+from app.utils.archive import records_source
+
+# Unicode word characters, so non-Latin names and descriptions are indexed too.
+# The index lives in memory and is rebuilt from the database by every new
+# process, so changing the pattern needs no migration.
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall((text or '').lower())
+
+
+class SearchIndex:
+    """
+    In-process search over students (prefix/typeahead) and disciplinary
+    records (keywords).
+
+    Students are kept as a sorted list of (token, student_id) pairs, so a
+    prefix is one bisect plus a scan of the matching range. Records are an
+    inverted index of word -> ascending record_id array. The index is built
+    from the database on first use; writes in this process are added
+    directly, and rows written by other processes are picked up by
+    refresh(), which only reads ids above the last one seen.
+    """
+
+    def __init__(self, refresh_interval=2.0, index_records=True):
+        self.refresh_interval = refresh_interval
+        self.index_records = index_records
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.loaded = False
+        self.students = {}        # student_id -> display dict
+        self._student_tokens = [] # sorted (token, student_id)
+        self._postings = {}       # word -> array of record_ids
+        self.record_count = 0
+        self._last_student_id = 0
+        self._last_record_id = 0
+        self._refreshed_at = 0.0
+
+    def configure(self, refresh_interval=None, index_records=None):
+        if refresh_interval is not None:
+            self.refresh_interval = refresh_interval
+        if index_records is not None:
+            self.index_records = index_records
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    # Writes
+    def add_student(self, student_id, full_name, register_number, user_code, department, student_class,
+                    _keep_sorted=True):
+        with self._lock:
+            if student_id in self.students:
+                return
+            self.students[student_id] = {
+                'student_id': student_id,
+                'full_name': full_name,
+                'register_number': register_number,
+                'user_code': user_code,
+                'department': department,
+                'student_class': student_class
+            }
+            tokens = set(tokenize(full_name)) | {register_number.lower(), user_code.lower()}
+            for token in tokens:
+                if _keep_sorted:
+                    insort(self._student_tokens, (token, student_id))
+                else:
+                    self._student_tokens.append((token, student_id))
+
+    def add_record(self, record_id, description, action_taken):
+        if not self.index_records:
+            return
+        with self._lock:
+            for word in set(tokenize(description)) | set(tokenize(action_taken)):
+                posting = self._postings.get(word)
+                if posting is None:
+                    self._postings[word] = array('q', [record_id])
+                    continue
+                if record_id > posting[-1]:
+                    posting.append(record_id)
+                    continue
+                position = bisect_left(posting, record_id)
+                if position < len(posting) and posting[position] == record_id:
+                    return  # already indexed (added directly, then seen by refresh)
+                posting.insert(position, record_id)
+            self.record_count += 1
+
+    # Loading
+    def _load_students(self, after_id):
+        rows = db.session.query(
+            Student.student_id, User.full_name, Student.register_number, User.user_code,
+            Student.department, Student.student_class
+        ).join(User, User.user_id == Student.user_id) \
+         .filter(Student.student_id > after_id) \
+         .order_by(Student.student_id) \
+         .yield_per(5000)
+        # Append everything, then sort once instead of inserting in order
+        for row in rows:
+            self.add_student(*row, _keep_sorted=False)
+            self._last_student_id = row.student_id
+        self._student_tokens.sort()
+
+    def _load_records(self, after_id):
+        # The first build also reads the archived academic years; new records
+        # only ever arrive in the live table
+        source = records_source(columns=('record_id', 'description', 'action_taken')) if not after_id \
+            else DisciplinaryRecord.__table__
+        rows = db.session.query(
+            source.c.record_id, source.c.description, source.c.action_taken
+        ).filter(source.c.record_id > after_id) \
+         .order_by(source.c.record_id) \
+         .yield_per(5000)
+        for row in rows:
+            self.add_record(*row)
+            self._last_record_id = row.record_id
+
+    def refresh(self, force=False):
+        """
+        Build the index on first use, then pick up new rows at most once per
+        refresh_interval (or immediately with force=True)
+        """
+        if self.loaded and not force and time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        with self._lock:
+            if self.loaded and not force and time.monotonic() - self._refreshed_at < self.refresh_interval:
+                return
+            self._load_students(self._last_student_id)
+            if self.index_records:
+                self._load_records(self._last_record_id)
+            self.loaded = True
+            self._refreshed_at = time.monotonic()
+
+    # Reads
+    def search_students(self, query, limit=10, department=None, student_class=None):
+        """
+        Students whose name words, register number or user code start with
+        every term of `query`, ordered by the first term's matching token
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        first, rest = terms[0], terms[1:]
+        results = []
+        seen = set()
+        with self._lock:
+            position = bisect_left(self._student_tokens, (first,))
+            while position < len(self._student_tokens) and len(results) < limit:
+                token, student_id = self._student_tokens[position]
+                position += 1
+                if not token.startswith(first):
+                    break
+                if student_id in seen:
+                    continue
+                seen.add(student_id)
+                student = self.students[student_id]
+                if department and student['department'] != department:
+                    continue
+                if student_class and student['student_class'] != student_class:
+                    continue
+                if rest and not self._matches_all(student, rest):
+                    continue
+                results.append(dict(student))
+        return results
+
+    @staticmethod
+    def _matches_all(student, terms):
+        tokens = tokenize(student['full_name']) + [student['register_number'].lower(), student['user_code'].lower()]
+        return all(any(token.startswith(term) for token in tokens) for term in terms)
+
+    def search_records(self, query, limit=20):
+        """
+        Ids of records whose description or action contains every word of
+        `query`, newest first
+        """
+        terms = set(tokenize(query))
+        if not terms or not self.index_records:
+            return []
+        with self._lock:
+            postings = [self._postings.get(term) for term in terms]
+            if not all(postings):
+                return []
+            # Walk the shortest list from the newest id and probe the others
+            postings.sort(key=len)
+            shortest, others = postings[0], postings[1:]
+            matches = []
+            for record_id in reversed(shortest):
+                if all(self._contains(posting, record_id) for posting in others):
+                    matches.append(record_id)
+                    if len(matches) >= limit:
+                        break
+        return matches
+
+    @staticmethod
+    def _contains(posting, record_id):
+        position = bisect_left(posting, record_id)
+        return position < len(posting) and posting[position] == record_id
+
+    def stats(self):
+        with self._lock:
+            return {
+                'loaded': self.loaded,
+                'students': len(self.students),
+                'student_tokens': len(self._student_tokens),
+                'records': self.record_count,
+                'record_words': len(self._postings)
+            }
+
+
+search_index = SearchIndex()
+
+
+def init_search(app):
+    search_index.configure(
+        refresh_interval=app.config.get('SEARCH_REFRESH_INTERVAL'),
+        index_records=app.config.get('SEARCH_INDEX_RECORDS')
+    )
@@ -0,0 +1,172 @@
+import random
+from datetime import datetime, timedelta
+from itertools import islice
+
+from sqlalchemy import func, insert
+from werkzeug.security import generate_password_hash
+
+from app.models import db, User, Student, Staff, Role, OffenceType, BehaviouralPoints, DisciplinaryRecord
+from app.utils.analytics import rebuild_point_bands, rebuild_rollups
+from app.utils.ledger import backfill_ledger
+
+# (department, share of students)
+DEPARTMENTS = [
+    ('Science', 0.30),
+    ('Commerce', 0.25),
+    ('Computer Science', 0.20),
+    ('Arts', 0.15),
+    ('Mathematics', 0.10),
+]
+CLASSES = [f'{grade}{section}' for grade in range(6, 13) for section in 'ABCD']
+POSITIONS = ['Teacher', 'Teacher', 'Teacher', 'Class Advisor', 'Head of Department', 'Counsellor']
+# Share of records per offence type, cheapest (most common) offence first
+OFFENCE_SHARES = [0.45, 0.25, 0.15, 0.10, 0.05]
+DESCRIPTIONS = [
+    'Arrived after the first bell', 'Missing ID card', 'Talking during assembly',
+    'Incomplete uniform', 'Using phone in class', 'Copied homework',
+    'Argument with classmate', 'Left class without permission'
+]
+ACTIONS = ['Verbal warning', 'Written warning', 'Parent informed', 'Detention', 'Counselling session']
+FIRST_NAMES = ['Aarav', 'Diya', 'Ishaan', 'Meera', 'Rahul', 'Sneha', 'Karthik', 'Priya', 'Arjun', 'Kavya',
+               'Vikram', 'Ananya', 'Rohan', 'Nisha', 'Siddharth', 'Lakshmi']
+LAST_NAMES = ['Kumar', 'Sharma', 'Iyer', 'Reddy', 'Nair', 'Patel', 'Das', 'Menon', 'Rao', 'Singh']
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _next_id(column):
+    return (db.session.query(func.max(column)).scalar() or 0) + 1
+
+
+def _school_time(rng, start, days):
+    # Offences happen on weekdays during school hours
+    while True:
+        day = start + timedelta(days=rng.randrange(days))
+        if day.weekday() < 5:
+            return day.replace(hour=rng.randint(7, 15), minute=rng.randrange(60), second=rng.randrange(60))
+
+
+def seed_database(students=1000, staff=50, records=5000, days=365, seed=42,
+                  password='password', hash_method=None, chunk_size=5000, echo=None):
+    """
+    Insert synthetic users, students, staff, disciplinary records and matching
+    behavioural points with realistic skew: a minority of students account for
+    most offences, cheap offences are far more common than serious ones, and
+    records fall on weekdays in school hours over the last `days` days.
+
+    All seeded accounts share `password`. Rows are added after any existing
+    data. Returns a dict with the number of rows created per table.
+    """
+    rng = random.Random(seed)
+    echo = echo or (lambda message: None)
+    roles = {role.role_name: role.role_id for role in Role.query.all()}
+    offences = OffenceType.query.order_by(OffenceType.deduct_points).all()
+    if not offences:
+        raise ValueError('No offence types to seed records with')
+
+    password_hash = generate_password_hash(password, method=hash_method) if hash_method else generate_password_hash(password)
+    first_user_id = _next_id(User.user_id)
+    first_student_id = _next_id(Student.student_id)
+    first_staff_id = _next_id(Staff.staff_id)
+    department_names = [name for name, _ in DEPARTMENTS]
+    department_weights = [share for _, share in DEPARTMENTS]
+
+    def user_row(user_id, code, role_name):
+        return {
+            'user_id': user_id,
+            'user_code': code,
+            'password_hash': password_hash,
+            'role_id': roles[role_name],
+            'full_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            'gender': rng.choice(['Male', 'Female']),
+            'contact_number': f'9{rng.randrange(10 ** 9):09d}',
+            'address': f'{rng.randint(1, 300)} Main Road'
+        }
+
+    # Users and profiles
+    for chunk in _chunks(range(students), chunk_size):
+        db.session.execute(insert(User), [
+            user_row(first_user_id + i, f'stu{first_student_id + i}', 'student') for i in chunk
+        ])
+        db.session.execute(insert(Student), [{
+            'student_id': first_student_id + i,
+            'user_id': first_user_id + i,
+            'register_number': f'REG{first_student_id + i:07d}',
+            'department': rng.choices(department_names, department_weights)[0],
+            'student_class': rng.choice(CLASSES),
+            'parent_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'[:20],
+            'parent_contact': f'8{rng.randrange(10 ** 9):09d}'
+        } for i in chunk])
+    echo(f'Seeded {students} students')
+
+    first_staff_user_id = first_user_id + students
+    for chunk in _chunks(range(staff), chunk_size):
+        db.session.execute(insert(User), [
+            user_row(first_staff_user_id + i, f'staff{first_staff_id + i}', 'staff') for i in chunk
+        ])
+        db.session.execute(insert(Staff), [{
+            'staff_id': first_staff_id + i,
+            'user_id': first_staff_user_id + i,
+            'staff_empid': f'EMP{first_staff_id + i:05d}',
+            'position': rng.choice(POSITIONS),
+            'department': rng.choice(department_names)
+        } for i in chunk])
+    echo(f'Seeded {staff} staff')
+
+    # Disciplinary records: per-student propensity follows a heavy-tailed
+    # distribution so a few students collect most of the offences
+    student_ids = list(range(first_student_id, first_student_id + students))
+    propensity = [rng.paretovariate(1.5) for _ in student_ids]
+    offence_weights = (OFFENCE_SHARES + [OFFENCE_SHARES[-1]] * len(offences))[:len(offences)]
+    start = datetime.now().replace(microsecond=0) - timedelta(days=days)
+    deducted = {}
+    counts = {}
+
+    if students and staff:
+        for chunk in _chunks(range(records), chunk_size):
+            picked_students = rng.choices(student_ids, propensity, k=len(chunk))
+            picked_offences = rng.choices(offences, offence_weights, k=len(chunk))
+            rows = []
+            for student_id, offence in zip(picked_students, picked_offences):
+                deducted[student_id] = deducted.get(student_id, 0) + offence.deduct_points
+                counts[student_id] = counts.get(student_id, 0) + 1
+                rows.append({
+                    'student_id': student_id,
+                    'offence_id': offence.offence_id,
+                    'description': rng.choice(DESCRIPTIONS),
+                    'action_taken': rng.choice(ACTIONS),
+                    'recorded_by': first_staff_id + rng.randrange(staff),
+                    'created_at': _school_time(rng, start, days)
+                })
+            db.session.execute(insert(DisciplinaryRecord), rows)
+        echo(f'Seeded {records} disciplinary records')
+    else:
+        records = 0
+
+    # Points consistent with the seeded history
+    for chunk in _chunks(student_ids, chunk_size):
+        db.session.execute(insert(BehaviouralPoints), [{
+            'student_id': student_id,
+            'total_points': 100 - deducted.get(student_id, 0),
+            'offence_count': counts.get(student_id, 0)
+        } for student_id in chunk])
+
+    # One ledger deduction per seeded record
+    backfill_ledger(db.session.connection())
+    echo('Built the points ledger')
+    rebuild_point_bands()
+
+    db.session.commit()
+
+    # Analytics read offence_rollup, which record_offence keeps up to date
+    # but bulk-inserted history bypasses
+    rebuild_rollups()
+    echo('Built the offence rollups')
+    return {'users': students + staff, 'students': students, 'staff': staff, 'records': records}
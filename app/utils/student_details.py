@@ -0,0 +1,70 @@
+from app.models import db, User, Student, BehaviouralPoints
+from app.db_engine import use_primary
+from app.utils.cache import TTLCache
+
+# Payloads for the QR scan endpoint, keyed by student_id. Writes in this
+# process invalidate explicitly; the TTL bounds staleness across workers.
+student_details_cache = TTLCache(maxsize=10000, ttl=60)
+
+
+def init_student_details_cache(app):
+    student_details_cache.configure(
+        maxsize=app.config.get('STUDENT_DETAILS_CACHE_SIZE'),
+        ttl=app.config.get('STUDENT_DETAILS_CACHE_TTL')
+    )
+
+
+def load_student_details(student_id):
+    """
+    Build the all_details payload for a student with a single joined query.
+    Returns None if the student or their points row does not exist.
+    """
+    row = db.session.query(
+        User.full_name,
+        Student.register_number,
+        Student.student_class,
+        Student.department,
+        Student.parent_name,
+        Student.parent_contact,
+        BehaviouralPoints.total_points,
+        BehaviouralPoints.offence_count
+    ).join(User, Student.user_id == User.user_id) \
+     .join(BehaviouralPoints, BehaviouralPoints.student_id == Student.student_id) \
+     .filter(Student.student_id == student_id) \
+     .first()
+
+    if row is None:
+        return None
+
+    return {
+        'student_name': row.full_name,
+        'register_number': row.register_number,
+        'student_class': row.student_class,
+        'department': row.department,
+        'parent_name': row.parent_name,
+        'parent_contact': row.parent_contact,
+        'total_points': row.total_points,
+        'offence_count': row.offence_count
+    }
+
+
+def get_student_details(student_id):
+    """
+    Cached version of load_student_details. Misses are loaded from the
+    primary even in read_replica views: a replica lagging behind a write
+    that just invalidated the entry would otherwise put the old values
+    back for a full TTL.
+    """
+    student_id = int(student_id)
+    details = student_details_cache.get(student_id)
+    if details is None:
+        with use_primary():
+            details = load_student_details(student_id)
+        if details is not None:
+            student_details_cache.set(student_id, details)
+    return details
+
+
+def invalidate_student_details(student_id):
+    if student_id is not None:
+        student_details_cache.invalidate(int(student_id))
@@ -0,0 +1,182 @@
+"""
+Show that hot-path query times stay flat as academic years of disciplinary
+history accumulate, when closed years are archived.
+
+    python benchmarks/archive_benchmark.py --years 6 --records-per-year 100000
+    python benchmarks/archive_benchmark.py --output archive.json
+
+Two scenarios each run in a fresh interpreter on a throwaway SQLite
+database: `single` keeps every year in disciplinary_record, `archived`
+moves the previous year into its archive table (`archive_year`) each time
+a new year's records arrive. After every year the hot queries (the ones the
+listing, dashboard and search views run against the live table) are timed,
+plus a read through the unified API (`query_records`) over the whole
+history, which fans out to the archives.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+QUERIES = {
+    'records_page': (
+        'SELECT r.*, o.offence_name FROM disciplinary_record r '
+        'JOIN offence_type o ON o.offence_id = r.offence_id ORDER BY r.record_id DESC LIMIT 50'
+    ),
+    'year_offence_counts': (
+        'SELECT offence_id, count(*) FROM disciplinary_record '
+        'WHERE created_at >= :year_start AND created_at < :year_end GROUP BY offence_id'
+    ),
+    'student_history': (
+        'SELECT * FROM disciplinary_record WHERE student_id = :student_id '
+        'ORDER BY created_at DESC LIMIT 50'
+    ),
+    'student_offence_count': 'SELECT count(*) FROM disciplinary_record WHERE student_id = :student_id',
+    'department_page': (
+        'SELECT r.* FROM disciplinary_record r JOIN student s ON s.student_id = r.student_id '
+        'WHERE s.department = :department ORDER BY r.record_id DESC LIMIT 50'
+    ),
+    'records_total': 'SELECT count(*) FROM disciplinary_record',
+    'search_index_scan': 'SELECT record_id, description, action_taken FROM disciplinary_record',
+}
+
+
+def _ts(value):
+    # The format SQLAlchemy's SQLite DateTime type stores
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def _median_ms(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 3)
+
+
+def insert_year(year, count, students, staff_ids, rng, chunk_size=20000):
+    from sqlalchemy import insert
+    from app.models import db, DisciplinaryRecord
+    from app.utils.archive import academic_year_bounds
+
+    starts_at, ends_at = academic_year_bounds(year)
+    seconds = (ends_at - starts_at).total_seconds()
+    times = sorted(starts_at + timedelta(seconds=rng.random() * seconds) for _ in range(count))
+    for start in range(0, count, chunk_size):
+        db.session.execute(insert(DisciplinaryRecord), [{
+            'student_id': rng.choice(students),
+            'offence_id': rng.randint(1, 5),
+            'description': 'Late to class after the bus',
+            'action_taken': 'Verbal warning',
+            'recorded_by': rng.choice(staff_ids),
+            'created_at': created_at
+        } for created_at in times[start:start + chunk_size]])
+    db.session.commit()
+
+
+def run_scenario(scenario, years, records_per_year, students, repeats):
+    from config import Config
+    Config.SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'archive_benchmark.db')}"
+
+    from sqlalchemy import text
+    from app import create_app
+    from app.models import db, Staff, Student
+    from app.utils.archive import academic_year_bounds, academic_year_of, archive_year, query_records
+    from app.utils.seed import seed_database, DEPARTMENTS
+
+    app = create_app()
+    rng = random.Random(42)
+    results = []
+    with app.app_context():
+        seed_database(students=students, staff=50, records=0, hash_method='pbkdf2:sha256:1000')
+        student_ids = [s for (s,) in db.session.query(Student.student_id)]
+        staff_ids = [s for (s,) in db.session.query(Staff.staff_id)]
+        last_closed = academic_year_of(datetime.now()) - 1
+        first_year = last_closed - years + 1
+
+        for year in range(first_year, last_closed + 1):
+            insert_year(year, records_per_year, student_ids, staff_ids, rng)
+            archived_ms = None
+            if scenario == 'archived' and year > first_year:
+                started = time.perf_counter()
+                archive_year(year - 1, points_policy='carry')
+                archived_ms = round((time.perf_counter() - started) * 1000, 1)
+            db.session.execute(text('ANALYZE'))
+            db.session.commit()
+
+            year_start, year_end = academic_year_bounds(year)
+            params = {
+                'year_start': _ts(year_start),
+                'year_end': _ts(year_end),
+                'student_id': student_ids[len(student_ids) // 2],
+                'department': DEPARTMENTS[0][0],
+            }
+            timings = {name: _median_ms(lambda: db.session.execute(text(sql), params).fetchall(), repeats)
+                       for name, sql in QUERIES.items()}
+            history_from = academic_year_bounds(first_year)[0]
+            timings['unified_all_years_page'] = _median_ms(
+                lambda: query_records(date_from=history_from, limit=50), repeats)
+            timings['unified_student_all_years'] = _median_ms(
+                lambda: query_records(date_from=history_from, student_id=params['student_id'], limit=50), repeats)
+            live = db.session.execute(text('SELECT count(*) FROM disciplinary_record')).scalar()
+            results.append({'years': year - first_year + 1, 'live_records': live,
+                            'archive_ms': archived_ms, 'timings': timings})
+            print(f'[{scenario}] {year - first_year + 1} year(s), {live} live record(s)', file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', type=int, default=6)
+    parser.add_argument('--records-per-year', type=int, default=100000)
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--repeats', type=int, default=15)
+    parser.add_argument('--scenario', choices=['single', 'archived'], help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    if args.scenario:
+        # Child process: one scenario, JSON on stdout
+        print(json.dumps(run_scenario(args.scenario, args.years, args.records_per_year, args.students, args.repeats)))
+        return
+
+    results = {}
+    for scenario in ('single', 'archived'):
+        output = subprocess.check_output([
+            sys.executable, os.path.abspath(__file__), '--scenario', scenario, '--years', str(args.years),
+            '--records-per-year', str(args.records_per_year), '--students', str(args.students),
+            '--repeats', str(args.repeats)
+        ], cwd=ROOT, text=True)
+        results[scenario] = json.loads(output.strip().splitlines()[-1])
+
+    names = list(results['single'][0]['timings'])
+    print('\nMedian ms per query (single table / archived) after each academic year')
+    print(f"{'query':27}" + ''.join(f"{str(r['years']) + 'y':>17}" for r in results['single']))
+    for name in names:
+        cells = ''.join(f"{s['timings'][name]:8.2f}/{a['timings'][name]:<8.2f}"
+                        for s, a in zip(results['single'], results['archived']))
+        print(f'{name:27}{cells}')
+    print(f"{'live records':27}" + ''.join(f"{s['live_records']:8}/{a['live_records']:<8}"
+                                             for s, a in zip(results['single'], results['archived'])))
+    archive_times = [a['archive_ms'] for a in results['archived'] if a['archive_ms'] is not None]
+    if archive_times:
+        print(f"archive_year took {min(archive_times):.0f}-{max(archive_times):.0f} ms per year")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+        print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Fire many concurrent offence recordings at a few students and report the
+throughput at one or more thread counts.
+
+    python benchmarks/concurrent_deductions.py --threads 1 4 16 --offences 400
+
+Each run is `flask check-concurrent-deductions` (seeding, recording and the
+lost-update checks all live there, on a throwaway SQLite database); this
+script only sweeps the thread counts and summarises the timings. Exits
+non-zero if any run failed its check.
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+SUMMARY = re.compile(r'(\d+) offences on (\d+) threads in ([\d.]+)s, (\d+) error')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, nargs='+', default=[16])
+    parser.add_argument('--offences', type=int, default=400)
+    parser.add_argument('--students', type=int, default=3)
+    args = parser.parse_args()
+
+    # The command seeds its own scratch database; this one only hosts the CLI
+    Config.SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'host.db')}"
+    from app import create_app
+    runner = create_app().test_cli_runner()
+
+    failed = 0
+    summaries = []
+    for threads in args.threads:
+        result = runner.invoke(args=['check-concurrent-deductions', '--threads', str(threads),
+                                     '--offences', str(args.offences), '--students', str(args.students)])
+        print(result.output, end='')
+        failed += result.exit_code != 0
+        match = SUMMARY.search(result.output)
+        if match:
+            summaries.append((threads, float(match.group(3)), int(match.group(4)), result.exit_code == 0))
+
+    print(f"\n{'threads':>8} {'seconds':>8} {'per sec':>8} {'errors':>7}  result")
+    for threads, elapsed, errors, ok in summaries:
+        print(f"{threads:8} {elapsed:8.2f} {args.offences / elapsed:8.0f} {errors:7}  {'ok' if ok else 'FAIL'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Show query plans and timings for the hot queries before and after the
+0001 index migration, on a seeded throwaway SQLite database.
+
+    python benchmarks/index_benchmark.py --records 1000000 --output index.json
+
+The database is created at head, downgraded to base (no indexes), seeded,
+measured, then upgraded again and re-measured.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+QUERIES = {
+    'student_history': (
+        'SELECT * FROM disciplinary_record WHERE student_id = :student_id '
+        'ORDER BY created_at DESC LIMIT 50'
+    ),
+    'offence_in_range': (
+        'SELECT count(*) FROM disciplinary_record WHERE offence_id = :offence_id '
+        'AND created_at >= :date_from AND created_at < :date_to'
+    ),
+    'recorded_by_staff': (
+        'SELECT * FROM disciplinary_record WHERE recorded_by = :staff_id '
+        'ORDER BY record_id DESC LIMIT 50'
+    ),
+    'records_in_month': (
+        'SELECT count(*) FROM disciplinary_record '
+        'WHERE created_at >= :date_from AND created_at < :date_to'
+    ),
+    'students_by_class': (
+        'SELECT * FROM student WHERE department = :department AND student_class = :student_class '
+        'ORDER BY student_id LIMIT 50'
+    ),
+    'department_records_page': (
+        'SELECT r.* FROM disciplinary_record r JOIN student s ON s.student_id = r.student_id '
+        'WHERE s.department = :department AND s.student_class = :student_class '
+        'ORDER BY r.record_id DESC LIMIT 50'
+    ),
+}
+
+def _ts(value):
+    # The format SQLAlchemy's SQLite DateTime type stores
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def measure(engine, params, repeats):
+    from sqlalchemy import text
+
+    results = {}
+    with engine.connect() as conn:
+        for name, sql in QUERIES.items():
+            plan = [row[-1] for row in conn.execute(text(f'EXPLAIN QUERY PLAN {sql}'), params)]
+            timings = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                conn.execute(text(sql), params).fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = {'median_ms': round(statistics.median(timings), 3), 'plan': plan}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--staff', type=int, default=200)
+    parser.add_argument('--days', type=int, default=3 * 365, help='History spread over this many days')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'index_benchmark.db')
+    Config.SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+
+    from app import create_app, migrations
+    from app.models import db
+    from app.utils.seed import seed_database, DEPARTMENTS, CLASSES
+
+    app = create_app()
+    quiet = lambda message: None
+    with app.app_context():
+        engine = db.engine
+        migrations.upgrade(engine, echo=quiet)
+        migrations.downgrade(engine, echo=quiet)
+
+        started = time.perf_counter()
+        seed_database(students=args.students, staff=args.staff, records=args.records,
+                      days=args.days, hash_method='pbkdf2:sha256:1000', chunk_size=20000)
+        print(f'Seeded {args.records} records in {time.perf_counter() - started:.1f}s')
+        start = datetime.now() - timedelta(days=args.days)
+
+        params = {
+            'student_id': args.students // 2,
+            'offence_id': 3,
+            'staff_id': args.staff // 2,
+            'date_from': _ts(start + timedelta(days=args.days // 2)),
+            'date_to': _ts(start + timedelta(days=args.days // 2 + 30)),
+            'department': DEPARTMENTS[0][0],
+            'student_class': CLASSES[0],
+        }
+
+        with engine.begin() as conn:
+            conn.exec_driver_sql('ANALYZE')
+        before = measure(engine, params, args.repeats)
+        migrations.upgrade(engine, echo=quiet)
+        with engine.begin() as conn:
+            conn.exec_driver_sql('ANALYZE')
+        after = measure(engine, params, args.repeats)
+
+    print(f"\n{'query':26} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for name in QUERIES:
+        b, a = before[name]['median_ms'], after[name]['median_ms']
+        print(f'{name:26} {b:10.3f} {a:10.3f} {b / a if a else float("inf"):7.1f}x')
+        print(f"    before: {' | '.join(before[name]['plan'])}")
+        print(f"    after:  {' | '.join(after[name]['plan'])}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'before': before, 'after': after}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""
+Load-test the main endpoints and report throughput and latency percentiles.
+
+    python benchmarks/load_test.py --mode client --threads 4 --duration 5
+    python benchmarks/load_test.py --mode http --threads 16 --output bench.json
+    python benchmarks/load_test.py --mode http --url http://127.0.0.1:5000 --no-seed
+
+`client` drives the app in-process through the Flask test client; `http`
+drives a real threaded HTTP server (started locally unless --url is given)
+with keep-alive connections. Unless --database-url is given, a throwaway
+SQLite database is created and seeded. Results (per endpoint requests,
+errors, req/s, mean and p50/p95/p99 latency in ms) go to stdout and,
+with --output, to a JSON file tagged with the current git commit so runs
+can be compared.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import Config
+
+
+def scenarios(ctx):
+    """
+    name -> (method, path factory, form factory, needs_login)
+    """
+    rng = ctx['rng']
+    return {
+        'login': ('POST', lambda: '/auth/login',
+                  lambda: {'username': rng.choice(ctx['staff_codes']), 'password': ctx['password']}, False),
+        'get_students': ('GET', lambda: '/api/api/students', None, False),
+        'get_offences': ('GET', lambda: '/api/api/offences', None, False),
+        'all_details': ('GET', lambda: f"/api/api/student/{rng.choice(ctx['student_ids'])}/all_details", None, True),
+        'record_offence': ('POST', lambda: '/api/record_offence', lambda: {
+            'student_id': rng.choice(ctx['student_ids']),
+            'offence_id': rng.choice(ctx['offence_ids']),
+            'description': 'Load test',
+            'action_taken': 'Verbal warning'
+        }, True),
+        'html_students': ('GET', lambda: '/students', None, True),
+        'html_disciplinary': ('GET', lambda: '/disciplinary', None, True),
+        'html_behavioral_points': ('GET', lambda: '/behavioral_points', None, True),
+    }
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class TestClientDriver:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, form=None):
+        response = self.client.open(path, method=method, data=form)
+        return response.status_code
+
+
+class HTTPDriver:
+    """
+    One keep-alive connection with a minimal cookie jar (enough for the session cookie)
+    """
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        self.cookies = {}
+
+    def request(self, method, path, form=None):
+        headers = {}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            raise
+        for header in response.headers.get_all('Set-Cookie') or []:
+            name, _, rest = header.partition('=')
+            self.cookies[name.strip()] = rest.split(';', 1)[0]
+        return response.status
+
+
+def run_scenario(name, scenario, make_driver, ctx, threads, duration):
+    method, path_factory, form_factory, needs_login = scenario
+    latencies = []
+    statuses = {}
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        driver = make_driver()
+        if needs_login:
+            driver.request('POST', '/auth/login',
+                           {'username': ctx['rng'].choice(ctx['staff_codes']), 'password': ctx['password']})
+        local_latencies, local_statuses, local_errors = [], {}, 0
+        while time.perf_counter() < deadline:
+            form = form_factory() if form_factory else None
+            started = time.perf_counter()
+            try:
+                status = driver.request(method, path_factory(), form)
+            except Exception:
+                local_errors += 1
+                continue
+            local_latencies.append((time.perf_counter() - started) * 1000)
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+            if status >= 500:
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(statistics.fmean(latencies), 3) if latencies else None,
+        'p50_ms': round(percentile(latencies, 50), 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 3) if latencies else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['client', 'http'], default='client')
+    parser.add_argument('--url', help='Target an already running server (http mode)')
+    parser.add_argument('--database-url', help='Use this database instead of a throwaway SQLite file')
+    parser.add_argument('--no-seed', action='store_true', help='Do not seed data (use what is in the database)')
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--staff', type=int, default=50)
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--password', default='password', help='Password of the seeded accounts')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per endpoint')
+    parser.add_argument('--only', nargs='*', help='Endpoints to run (default: all)')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    Config.SQLALCHEMY_DATABASE_URI = args.database_url or \
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'load_test.db')}"
+
+    # run.py builds the app with the HTML views on import
+    os.chdir(ROOT)
+    from run import app
+    from app.models import db, Student, Staff, User, OffenceType
+    from app.utils.seed import seed_database
+
+    with app.app_context():
+        if not args.no_seed:
+            started = time.perf_counter()
+            seed_database(students=args.students, staff=args.staff, records=args.records,
+                          password=args.password, hash_method=app.config.get('PASSWORD_HASH_METHOD'))
+            print(f'Seeded {args.students} students / {args.records} records in {time.perf_counter() - started:.1f}s')
+        ctx = {
+            'rng': random.Random(7),
+            'password': args.password,
+            'student_ids': [sid for (sid,) in db.session.query(Student.student_id)],
+            'staff_codes': [code for (code,) in db.session.query(User.user_code).join(Staff)],
+            'offence_ids': [oid for (oid,) in db.session.query(OffenceType.offence_id)],
+        }
+    if not (ctx['student_ids'] and ctx['staff_codes']):
+        parser.error('The database has no students or staff; seed it first')
+
+    server = None
+    if args.mode == 'client':
+        make_driver = lambda: TestClientDriver(app)
+    else:
+        base_url = args.url
+        if not base_url:
+            from werkzeug.serving import make_server
+            server = make_server('127.0.0.1', 0, app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f'http://127.0.0.1:{server.server_port}'
+        make_driver = lambda: HTTPDriver(base_url)
+
+    results = {}
+    for name, scenario in scenarios(ctx).items():
+        if args.only and name not in args.only:
+            continue
+        results[name] = run_scenario(name, scenario, make_driver, ctx, args.threads, args.duration)
+        r = results[name]
+        print(f"{name:24} {r['requests']:7} req {r['throughput_rps']:9.1f} req/s  "
+              f"p50 {r['p50_ms'] or 0:8.2f}  p95 {r['p95_ms'] or 0:8.2f}  p99 {r['p99_ms'] or 0:8.2f} ms  "
+              f"errors {r['errors']}  {r['statuses']}")
+
+    if server:
+        server.shutdown()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'commit': git_commit(),
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'args': {k: v for k, v in vars(args).items() if k != 'password'},
+                'results': results
+            }, f, indent=2)
+        print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Measure process start-up: importing the app package and running create_app.
+
+    python benchmarks/startup_benchmark.py --runs 10
+    python benchmarks/startup_benchmark.py --runs 20 --output startup.json
+
+Every run is a fresh interpreter (like a gunicorn worker being spawned).
+Two scenarios run against throwaway SQLite databases: `cold` starts on an
+empty database each time (create tables, migrate, seed), `warm` on an
+already initialised one (the normal restart path). For each, import time,
+create_app time, the number of SQL statements create_app executed and
+whether the QR/imaging stack was loaded are reported.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside each child interpreter; prints one JSON line
+CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+from config import Config
+Config.SQLALCHEMY_DATABASE_URI = {database_url!r}
+import app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+imported = time.perf_counter()
+
+statements = []
+event.listen(Engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+from app import create_app
+create_app()
+created = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'total_ms': (created - started) * 1000,
+    'statements': len(statements),
+    'qrcode_loaded': 'qrcode' in sys.modules,
+    'pil_loaded': 'PIL.Image' in sys.modules,
+}}))
+'''
+
+
+def start_once(database_url):
+    output = subprocess.check_output(
+        [sys.executable, '-c', CHILD.format(root=ROOT, database_url=database_url)],
+        cwd=ROOT, text=True
+    )
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarise(samples):
+    summary = {'runs': len(samples)}
+    for key in ('import_ms', 'create_app_ms', 'total_ms'):
+        values = sorted(s[key] for s in samples)
+        summary[key] = {
+            'mean': round(statistics.mean(values), 2),
+            'p50': round(statistics.median(values), 2),
+            'min': round(values[0], 2),
+            'max': round(values[-1], 2),
+        }
+    summary['statements'] = max(s['statements'] for s in samples)
+    summary['qrcode_loaded'] = any(s['qrcode_loaded'] for s in samples)
+    summary['pil_loaded'] = any(s['pil_loaded'] for s in samples)
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='Interpreter starts per scenario')
+    parser.add_argument('--only', choices=['cold', 'warm'], help='Run a single scenario')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    results = {}
+
+    if args.only in (None, 'cold'):
+        results['cold'] = summarise([
+            start_once(f"sqlite:///{os.path.join(workdir, f'cold_{i}.db')}") for i in range(args.runs)
+        ])
+
+    if args.only in (None, 'warm'):
+        warm_url = f"sqlite:///{os.path.join(workdir, 'warm.db')}"
+        start_once(warm_url)  # initialise once, not measured
+        results['warm'] = summarise([start_once(warm_url) for _ in range(args.runs)])
+
+    for name, r in results.items():
+        print(f"{name:5} import {r['import_ms']['p50']:8.1f} ms  create_app {r['create_app_ms']['p50']:8.1f} ms  "
+              f"total {r['total_ms']['p50']:8.1f} ms (p50 of {r['runs']})  {r['statements']} SQL statement(s)  "
+              f"qrcode loaded: {r['qrcode_loaded']}, PIL loaded: {r['pil_loaded']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'commit': git_commit(),
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'args': vars(args),
+                'results': results
+            }, f, indent=2)
+        print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,15 @@
 from app import create_app
-from flask import render_template, request, redirect, url_for, flash
+from flask import abort, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 
 app = create_app()
 
 # Import models and routes after creating app to avoid circular imports
 from app.models import db, User, Student, Staff, Role, OffenceType, BehaviouralPoints, DisciplinaryRecord
+from app.utils.query_budget import query_budget
+from app.db_engine import read_replica
+from app.utils.listing import list_students, list_staff, list_behavioural_points, list_disciplinary_records, student_choices
+from app.utils.pagination import parse_date_arg
 
 @app.route('/')
 def home():
@@ -13,9 +17,16 @@ def home():
 
 @app.route('/students')
 @login_required
+@read_replica
+@query_budget(3)
 def students():
-    students = Student.query.join(User).all()
-    return render_template('students.html', students=students)
+    try:
+        students, next_cursor = list_students(request.args.get('cursor'),
+                                              department=request.args.get('department'),
+                                              student_class=request.args.get('student_class'))
+    except ValueError as e:
+        abort(400, str(e))
+    return render_template('students.html', students=students, next_cursor=next_cursor)
 
 @app.route('/add-students')
 @login_required
@@ -24,32 +35,63 @@ def add_students():
 
 @app.route('/staff')
 @login_required
+@read_replica
+@query_budget(2)
 def staff():
-    staff_members = Staff.query.join(User).all()
-    return render_template('staff.html', staff_members=staff_members)
+    try:
+        staff_members, next_cursor = list_staff(request.args.get('cursor'), department=request.args.get('department'))
+    except ValueError as e:
+        abort(400, str(e))
+    return render_template('staff.html', staff_members=staff_members, next_cursor=next_cursor)
 
 @app.route('/add-staff')
 @login_required
+@query_budget(2)
 def add_staff():
-    staff_members = Staff.query.join(User).all()
-    return render_template('add-staff.html', staff_members=staff_members)
+    try:
+        staff_members, next_cursor = list_staff(request.args.get('cursor'))
+    except ValueError as e:
+        abort(400, str(e))
+    return render_template('add-staff.html', staff_members=staff_members, next_cursor=next_cursor)
 
 @app.route('/disciplinary')
 @login_required
+@read_replica
+@query_budget(5)
 def disciplinary():
     offences = OffenceType.query.all()
-    students = Student.query.join(User).all()
-    records = DisciplinaryRecord.query.all()
+    # The offence form must offer every student, not one listing page
+    students = student_choices()
+    try:
+        records, next_cursor = list_disciplinary_records(
+            request.args.get('cursor'),
+            offence_id=request.args.get('offence_id', type=int),
+            student_id=request.args.get('student_id', type=int),
+            date_from=parse_date_arg('date_from'),
+            date_to=parse_date_arg('date_to', end=True),
+            department=request.args.get('department'),
+            student_class=request.args.get('student_class')
+        )
+    except ValueError as e:
+        abort(400, str(e))
     return render_template('disciplinary.html', 
                          offences=offences, 
                          students=students, 
-                         records=records)
+                         records=records,
+                         next_cursor=next_cursor)
 
 @app.route('/behavioral_points')
 @login_required
+@read_replica
+@query_budget(2)
 def behavioral_points():
-    points = BehaviouralPoints.query.join(Student).join(User).all()
-    return render_template('behavioral_points.html', points=points)
+    try:
+        points, next_cursor = list_behavioural_points(request.args.get('cursor'),
+                                                      department=request.args.get('department'),
+                                                      student_class=request.args.get('student_class'))
+    except ValueError as e:
+        abort(400, str(e))
+    return render_template('behavioral_points.html', points=points, next_cursor=next_cursor)
 
 # Error handlers
 @app.errorhandler(404)